@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chats.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -53,9 +54,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'chats.middleware.RequestLoggingMiddleware',
-    'chats.middleware.RestrictAccessByTimeMiddleware',
-    'chats.middleware.OffensiveLanguageMiddleware',
-    'chats.middleware.RolePermissionMiddleware',
+    'chats.middleware.AccessPolicyMiddleware',
 ]
 
 REST_FRAMEWORK = {
@@ -166,6 +165,77 @@ SIMPLE_JWT = {
 }
 
 
+# Chats app
+# Serve list endpoints from values() rows instead of DRF serializers
+# (same JSON, see chats/fastpath.py).
+CHATS_FAST_SERIALIZATION = True
+
+# Per-user inbox cache (chats/inbox_cache.py), stored in the "default" cache
+CHATS_INBOX_CACHE_ALIAS = "default"
+CHATS_INBOX_CACHE_TTL = 30
+CHATS_INBOX_CACHE_MAX_TTL = 300
+
+# Message search (?q=) backend: "auto" (the database's own index), "sqlite"
+# (FTS5), "mysql" (FULLTEXT) or "memory", never picked by "auto" (see
+# chats/search.py). A system check rejects one the database cannot serve.
+CHATS_SEARCH_BACKEND = "auto"
+
+# Days of message change log kept for delta sync (manage.py
+# prune_message_changes); older sync tokens get 410. None keeps everything.
+CHATS_SYNC_RETENTION_DAYS = 30
+
+# New chats primary keys as time-ordered UUIDv7 instead of random v4
+# (same string format; see chats/ids.py)
+CHATS_TIME_ORDERED_IDS = False
+
+# Hot/cold message archiving (chats/archive.py, manage.py archive_messages).
+# None disables it. A separate CHATS_ARCHIVE_DATABASE alias also needs
+# DATABASE_ROUTERS = ["chats.archive.ArchiveRouter"].
+CHATS_ARCHIVE_AFTER_DAYS = None
+CHATS_ARCHIVE_DATABASE = "default"
+
+# zlib-compress message bodies of at least this many UTF-8 bytes
+# (chats/compression.py); None stores every body as is. Never applies on MySQL.
+CHATS_COMPRESS_BODIES_OVER = 2048
+
+# Access rules enforced by chats.middleware.AccessPolicyMiddleware
+# (chats/policy.py): opening hours and roles per path prefix and method.
+# Each check comes from the most specific rule that sets it; None lifts it.
+CHATS_ACCESS_POLICY = [
+    {"path": "/api/v1/chats/", "hours": ["06:00", "21:00"], "roles": ["admin", "moderator"]},
+    {"path": "/api/v1/chats/auth/", "roles": None},
+    {"path": "/api/v1/chats/status/", "hours": None, "roles": None},
+    # Access is the view's: staff users and CHATS_METRICS_TOKEN bearers
+    {"path": "/api/v1/chats/metrics/", "hours": None, "roles": None},
+]
+# Per-IP rate limits, rules of the same policy (chats/ratelimit.py counts
+# them); "limit": None exempts matching requests.
+CHATS_RATE_LIMITS = [
+    {"path": "/api/v1/chats/", "methods": ["POST"], "limit": 5, "window": 60},
+]
+# Where rate-limit counters live: "memory" (per worker process), or shared
+# between workers: "cache" (CHATS_RATE_LIMIT_CACHE alias; needs an atomic
+# incr, e.g. Redis or Memcached), "mmap" or "sqlite" (CHATS_RATE_LIMIT_PATH)
+CHATS_RATE_LIMIT_STORE = "memory"
+# Memory LRU cap / mmap slots; keys beyond it evict others
+CHATS_RATE_LIMIT_MAX_KEYS = 100000
+
+
+# Share of requests written to the request log (chats/requestlog.py);
+# server errors are always logged
+CHATS_REQUEST_LOG_SAMPLE_RATE = 1.0
+
+# Snapshot directory shared by the worker processes so a scrape of
+# /api/v1/chats/metrics/ covers all of them (chats/metrics.py); None keeps
+# metrics per process. Empty it when the server starts.
+CHATS_METRICS_DIR = None
+CHATS_METRICS_FLUSH_INTERVAL = 5
+# Bearer token a Prometheus scraper sends to read /api/v1/chats/metrics/
+# (staff users may read it too); None accepts no token. The access policy
+# lifts hours and roles there and leaves the check to the view.
+CHATS_METRICS_TOKEN = None
+
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -174,12 +244,20 @@ LOGGING = {
             "format": "[{asctime}] {levelname} {message}",
             "style": "{",
         },
+        "json": {
+            "()": "chats.requestlog.JSONFormatter",
+        },
     },
     "handlers": {
+        # Queued: a background thread writes batches of JSON lines and
+        # rotates the file by size and age
         "requests_file": {
-            "class": "logging.FileHandler",
+            "class": "chats.requestlog.QueuedRotatingFileHandler",
             "filename": "requests.log",
-            "formatter": "default",
+            "max_bytes": 10 * 1024 * 1024,
+            "interval": 24 * 3600,
+            "backup_count": 7,
+            "formatter": "json",
         },
     },
     "loggers": {
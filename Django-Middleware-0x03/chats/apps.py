@@ -1,6 +1,44 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(using, **kwargs):
+    from django.db import connections
+
+    from . import search
+
+    connection = connections[using]
+    if connection.vendor == "sqlite" and search.sqlite_fts_installed(connection):
+        search.ensure_sqlite_fts(connection)
+
+
+def register_sql_functions(connection, **kwargs):
+    if connection.vendor == "sqlite":
+        from . import compression
+
+        compression.register_sqlite_functions(connection)
+
+
+def install_query_timer(connection, **kwargs):
+    from . import metrics
+
+    metrics.install_query_timer(connection)
 
 
 class ChatsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chats'
+
+    def ready(self):
+        # Migrations that rebuild chats_message on SQLite drop the FTS triggers
+        post_migrate.connect(ensure_search_index, sender=self)
+        # The FTS triggers inflate bodies with chats_body_text()
+        connection_created.connect(register_sql_functions)
+        # MetricsMiddleware counts each request's queries
+        connection_created.connect(install_query_timer)
+        # A search backend the database cannot serve fails at startup
+        from . import search
+
+        checks.register(search.check_backend)
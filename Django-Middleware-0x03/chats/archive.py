@@ -0,0 +1,251 @@
+"""
+Hot/cold storage for messages.
+
+``manage.py archive_messages`` moves messages older than
+``CHATS_ARCHIVE_AFTER_DAYS`` from ``chats_message`` into
+``ArchivedMessage``, oldest first, in small batches, through
+``chats.services.archive_messages``. Every batch deletes what it moved,
+so an interrupted run simply resumes from the oldest message still in the
+hot table; the insert ignores rows already archived, which covers a crash
+between the two steps when the archive lives in a separate database.
+
+An archived message is still part of its conversation: summaries and
+unread counts keep counting it (``rebuild_conversation_summaries``
+included), and sync clients get an "archived" change for it.
+
+Reads stay transparent: with archiving enabled the message list merges
+both tables (keyset pages query each with the same cursor; page-number
+pages treat the archive as the head of the timeline), retrieve and sync
+fall back to the archive and exports start with it. Archived messages
+are read-only and are not searchable.
+
+Settings:
+    CHATS_ARCHIVE_AFTER_DAYS  age in days after which messages are
+                              archived; None disables archiving and
+                              archive reads (default: None)
+    CHATS_ARCHIVE_DATABASE    database alias holding the archive; add
+                              ``chats.archive.ArchiveRouter`` to
+                              DATABASE_ROUTERS when it is not "default"
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import fastpath
+from .models import ArchivedMessage, ConversationParticipant, CustomUser, Message
+
+ARCHIVED_FIELDS = ("message_id", "conversation_id", "sender_id", "message_body", "sent_at")
+DELETED_SENDER = {"first_name": "", "last_name": "", "email": "", "role": ""}
+
+
+def enabled():
+    return getattr(settings, "CHATS_ARCHIVE_AFTER_DAYS", None) is not None
+
+
+def database():
+    return getattr(settings, "CHATS_ARCHIVE_DATABASE", DEFAULT_DB_ALIAS)
+
+
+def cutoff(days=None, now=None):
+    if days is None:
+        days = settings.CHATS_ARCHIVE_AFTER_DAYS
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+class ArchiveRouter:
+    """Route ArchivedMessage to CHATS_ARCHIVE_DATABASE, and nothing else there."""
+
+    def db_for_read(self, model, **hints):
+        return database() if model is ArchivedMessage else None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if ArchivedMessage in (type(obj1), type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if database() == DEFAULT_DB_ALIAS:
+            return None
+        if model_name == "archivedmessage":
+            return db == database()
+        return None if db == DEFAULT_DB_ALIAS else False
+
+
+# -------------------------------------
+# Moving messages
+# -------------------------------------
+def oldest(before, batch_size):
+    """Up to ``batch_size`` of the oldest messages sent before ``before``, unsaved."""
+    return [
+        ArchivedMessage(**row)
+        for row in Message.objects.filter(sent_at__lt=before)
+        .order_by("sent_at", "message_id")
+        .values(*ARCHIVED_FIELDS)[:batch_size]
+    ]
+
+
+def move(messages):
+    """
+    Copy ``ArchivedMessage`` instances to the archive and delete them from
+    the hot table. Run it inside the caller's transaction on the default
+    database: when the archive lives in another one, the copy commits
+    first, so a crash leaves copies, never losses.
+    """
+    with transaction.atomic(using=database()):
+        ArchivedMessage.objects.using(database()).bulk_create(messages, ignore_conflicts=True)
+    Message.objects.filter(message_id__in=[m.message_id for m in messages]).delete()
+
+
+def conversation_deleted(conversation_id):
+    ArchivedMessage.objects.filter(conversation_id=conversation_id).delete()
+
+
+# -------------------------------------
+# Reading
+# -------------------------------------
+def visible_to(user, queryset=None):
+    """Archived messages of the user's conversations."""
+    queryset = ArchivedMessage.objects.all() if queryset is None else queryset
+    member_of = ConversationParticipant.objects.filter(user=user).values("conversation_id")
+    if database() != DEFAULT_DB_ALIAS:
+        member_of = list(member_of)  # no subqueries across databases
+    return queryset.filter(conversation_id__in=member_of)
+
+
+def message_rows(rows):
+    """
+    Turn ``ArchivedMessage`` values rows into ``fastpath.MESSAGE_FIELDS``
+    rows, with senders read from the main database in one query. A sender
+    deleted since (no foreign key guards it) is shown as ``DELETED_SENDER``.
+    """
+    rows = list(rows)
+    senders = {
+        user["user_id"]: user
+        for user in CustomUser.objects.filter(
+            user_id__in={row["sender_id"] for row in rows}
+        ).values(*fastpath.USER_FIELDS)
+    }
+    result = []
+    for row in rows:
+        sender = senders.get(row["sender_id"]) or {**DELETED_SENDER, "user_id": row["sender_id"]}
+        result.append({
+            **{name: row[name] for name in ("message_id", "conversation_id", "message_body", "sent_at")},
+            **{f"sender__{name}": sender[name] for name in fastpath.USER_FIELDS},
+        })
+    return result
+
+
+def get_rows(message_ids, user):
+    """The user's archived messages among ``message_ids``, as fastpath rows by id."""
+    rows = message_rows(
+        visible_to(user).filter(message_id__in=message_ids).values(*ARCHIVED_FIELDS)
+    )
+    return {row["message_id"]: row for row in rows}
+
+
+def get_row(message_id):
+    """One archived message as a fastpath row, or None."""
+    try:
+        row = ArchivedMessage.objects.values(*ARCHIVED_FIELDS).filter(message_id=message_id).first()
+    except ValidationError:  # malformed id
+        return None
+    return message_rows([row])[0] if row else None
+
+
+# -------------------------------------
+# Counting (summaries and unread counters)
+# -------------------------------------
+def counts(conversation_ids):
+    """conversation_id -> number of archived messages, for those that have any."""
+    return dict(
+        ArchivedMessage.objects.filter(conversation_id__in=conversation_ids)
+        .order_by().values("conversation_id").annotate(total=Count("*"))
+        .values_list("conversation_id", "total")
+    )
+
+
+def latest(conversation_id):
+    """The newest archived message of the conversation as a values dict, or None."""
+    return (
+        ArchivedMessage.objects.filter(conversation_id=conversation_id)
+        .order_by("-sent_at", "-message_id")
+        .values("message_id", "sent_at", "message_body")
+        .first()
+    )
+
+
+def unread(conversation_id, user_id, last_read_at, last_read_message_id):
+    """Archived messages of others after a read mark (None: nothing read)."""
+    queryset = ArchivedMessage.objects.filter(conversation_id=conversation_id).exclude(
+        sender_id=user_id
+    )
+    if last_read_at is not None:
+        queryset = queryset.filter(
+            Q(sent_at__gt=last_read_at)
+            | Q(sent_at=last_read_at, message_id__gt=last_read_message_id)
+        )
+    return queryset.count()
+
+
+class ArchivedRows:
+    """Sliceable, countable archive queryset yielding fastpath rows (for Paginator)."""
+
+    def __init__(self, queryset):
+        self.queryset = queryset.values(*ARCHIVED_FIELDS)
+
+    def count(self):
+        return self.queryset.count()
+
+    def __getitem__(self, index):
+        return message_rows(self.queryset[index])
+
+
+class ChainedMessages:
+    """
+    Archived messages followed by hot ones, as a single sequence that
+    Django's Paginator can count and slice. Both parts must be ordered
+    oldest first; the archive only holds messages older than the hot table.
+    """
+
+    def __init__(self, archived, hot):
+        self.archived = archived
+        self.hot = hot
+        self._archived_count = None
+
+    def archived_count(self):
+        if self._archived_count is None:
+            self._archived_count = self.archived.count()
+        return self._archived_count
+
+    def count(self):
+        return self.archived_count() + self.hot.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        split = self.archived_count()
+        start, stop = index.start or 0, index.stop
+        rows = list(self.archived[start:min(stop, split)]) if start < split else []
+        if stop > split:
+            rows += list(self.hot[max(start - split, 0):stop - split])
+        return rows
+
+
+def merge_pages(paginator, hot, archived):
+    """
+    Merge a keyset page read from both tables (each already limited to
+    page_size + 1 rows past the same cursor) and hand it to the paginator.
+    """
+    rows = {paginator.get_position(row)[1]: row for row in archived}
+    rows.update((paginator.get_position(row)[1], row) for row in hot)  # copies mid-move
+    ordered = sorted(rows.values(), key=paginator.get_position, reverse=paginator.reverse)
+    return paginator.set_page(ordered[:paginator.page_size_requested + 1])
@@ -0,0 +1,284 @@
+"""
+Native async variants of the chats list / retrieve / create endpoints.
+
+Mounted under ``/api/v1/chats/async/`` alongside the DRF viewsets (which
+Django runs in a worker thread per request under ASGI). These are plain
+``async def`` views: reads use the async ORM (``aget``, ``afirst``,
+``acount``, ``async for``) and the fast-path row builders, so a request
+never holds a worker thread while it waits.
+
+Differences from the sync endpoints:
+  * message lists always use keyset pages (``MessageCursorPagination``);
+  * the conversation list is not served from the inbox cache, conditional
+    GET (ETag / Last-Modified) still applies;
+  * writes call the same ``chats.services`` functions in a single
+    ``sync_to_async`` hop, because they need ``transaction.atomic``,
+    which the async ORM does not provide.
+
+Note that as of Django 5.2 the async ORM still executes queries through
+``sync_to_async`` internally; ``bench_async_views`` measures what that
+means for concurrency on a given database.
+"""
+import functools
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.db.models import F
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, PermissionDenied, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import conditional, fastpath, receipts, services
+from .auth import authenticate_async
+from .filters import MessageFilter
+from .models import Conversation, ConversationParticipant, CustomUser, Message
+from .pagination import ConversationPagination, MessageCursorPagination
+from .serializers import ConversationSerializer, MessageSerializer
+
+renderer = JSONRenderer()
+
+PREVIEW_SIZE = 3
+MAX_PREVIEW_SIZE = 20
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(renderer.render(data), status=status_code, content_type="application/json")
+
+
+def async_api_view(methods):
+    """
+    Method check, authentication and DRF-style error responses for an
+    async view. Sets ``request.user`` to the authenticated user.
+    """
+    def decorator(view):
+        @csrf_exempt  # enforced for session users only, as DRF does
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = render({"detail": f'Method "{request.method}" not allowed.'},
+                                  status.HTTP_405_METHOD_NOT_ALLOWED)
+                response["Allow"] = ", ".join(methods)
+                return response
+            try:
+                user = await authenticate_async(request)
+                if user is None:
+                    return render({"detail": "Authentication credentials were not provided."},
+                                  status.HTTP_401_UNAUTHORIZED)
+                request.user = user
+                return await view(request, *args, **kwargs)
+            except APIException as exc:
+                detail = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+                return render(detail, exc.status_code)
+        return wrapper
+    return decorator
+
+
+def parse_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        raise ValidationError("Malformed JSON body.")
+    if not isinstance(data, dict):
+        raise ValidationError("Expected a JSON object.")
+    return data
+
+
+def parse_uuid(value, message):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise NotFound(message)
+
+
+async def is_member(user, conversation_id):
+    return await ConversationParticipant.objects.filter(
+        conversation_id=conversation_id, user=user
+    ).aexists()
+
+
+async def not_modified_or(request, validators, build):
+    cached = conditional.not_modified(request, validators)
+    if cached is not None:
+        return cached
+    return conditional.with_validators(await build(), validators)
+
+
+# -----------------------
+# GET / POST /async/conversations/
+# -----------------------
+@async_api_view(["GET", "POST"])
+async def conversations(request):
+    if request.method == "POST":
+        return await create_conversation(request)
+    validators = await conditional.aget_validators(request)
+    return await not_modified_or(request, validators, lambda: list_conversations(request))
+
+
+async def list_conversations(request):
+    query = Request(request)
+    queryset = receipts.with_read_state(Conversation.objects.all(), request.user)
+    participant_id = query.query_params.get("participant_id")
+    if participant_id:
+        queryset = queryset.filter(participants__user_id=participant_id)
+    queryset = queryset.order_by(
+        F("summary__last_message_at").desc(nulls_last=True), "-created_at", "conversation_id"
+    )
+
+    paginator = ConversationPagination()
+    page_size = paginator.get_page_size(query)
+    try:
+        number = int(query.query_params.get(paginator.page_query_param, 1))
+    except ValueError:
+        number = 0
+    count = await queryset.acount()
+    if number < 1 or (number > 1 and (number - 1) * page_size >= count):
+        raise NotFound("Invalid page.")
+
+    offset = (number - 1) * page_size
+    rows = fastpath.conversation_values(queryset, read_state=True)[offset:offset + page_size]
+    rows = [row async for row in rows]
+    url = request.build_absolute_uri()
+    previous = None
+    if number == 2:
+        previous = remove_query_param(url, paginator.page_query_param)
+    elif number > 2:
+        previous = replace_query_param(url, paginator.page_query_param, number - 1)
+    return render({
+        "count": count,
+        "next": (replace_query_param(url, paginator.page_query_param, number + 1)
+                 if offset + page_size < count else None),
+        "previous": previous,
+        "results": await fastpath.aconversation_rows(rows, get_preview_size(query)),
+    })
+
+
+def get_preview_size(query):
+    try:
+        size = int(query.query_params.get("preview", PREVIEW_SIZE))
+    except ValueError:
+        size = PREVIEW_SIZE
+    return max(0, min(size, MAX_PREVIEW_SIZE))
+
+
+async def create_conversation(request):
+    participant_ids = parse_body(request).get("participant_ids")
+    if not participant_ids or not isinstance(participant_ids, list):
+        raise ValidationError({"participant_ids": "This field is required."})
+    try:
+        participant_ids = [uuid.UUID(str(user_id)) for user_id in participant_ids]
+    except ValueError:
+        raise ValidationError({"participant_ids": "Expected a list of user ids."})
+    participants = [u async for u in CustomUser.objects.filter(user_id__in=participant_ids)]
+
+    def create():
+        conversation = services.create_conversation(participants)
+        return ConversationSerializer(conversation).data
+
+    return render(await sync_to_async(create)(), status.HTTP_201_CREATED)
+
+
+# -----------------------
+# GET /async/conversations/<id>/
+# -----------------------
+@async_api_view(["GET"])
+async def conversation_detail(request, pk):
+    validators = await conditional.aget_validators(request, scoped=True, pk=pk)
+
+    async def build():
+        conversation_id = parse_uuid(pk, "Conversation not found.")
+        row = await fastpath.conversation_values(
+            Conversation.objects.filter(conversation_id=conversation_id)
+        ).afirst()
+        if row is None:
+            raise NotFound("Conversation not found.")
+        if not await is_member(request.user, conversation_id):
+            raise PermissionDenied("You do not have permission to access this conversation.")
+        # preview_size=None: the detail view embeds the whole history
+        return render((await fastpath.aconversation_rows([row], None))[0])
+
+    return await not_modified_or(request, validators, build)
+
+
+# -----------------------
+# GET / POST /async/messages/ OR /async/conversations/<id>/messages/
+# -----------------------
+@async_api_view(["GET", "POST"])
+async def messages(request, conversation_pk=None):
+    if request.method == "POST":
+        return await create_message(request, conversation_pk)
+    if conversation_pk:
+        validators = await conditional.aget_validators(request, pk=conversation_pk)
+    else:
+        validators = await conditional.aget_validators(request)
+    return await not_modified_or(request, validators, lambda: list_messages(request, conversation_pk))
+
+
+async def list_messages(request, conversation_pk=None):
+    queryset = Message.objects.filter(conversation__participants=request.user)
+    if conversation_pk:
+        queryset = queryset.filter(conversation_id=parse_uuid(conversation_pk, "Not found."))
+    queryset = MessageFilter(request.GET, queryset=queryset).qs
+
+    paginator = MessageCursorPagination()
+    page = paginator.page_queryset(fastpath.message_values(queryset), Request(request))
+    rows = paginator.set_page([row async for row in page])
+    return render({
+        "next": paginator.get_next_link(),
+        "previous": paginator.get_previous_link(),
+        "results": fastpath.message_rows(rows),
+    })
+
+
+async def create_message(request, conversation_pk=None):
+    data = parse_body(request)
+    conversation_id = conversation_pk or data.get("conversation_id")
+    sender_id = data.get("sender_id") or request.user.pk
+    message_body = data.get("message_body")
+    message_body = message_body.strip() if isinstance(message_body, str) else ""
+    if not all([conversation_id, message_body]):
+        raise ValidationError("conversation_id and message_body are required.")
+
+    conversation_id = parse_uuid(conversation_id, "Conversation not found.")
+    sender_id = parse_uuid(sender_id, "Sender not found.")
+    try:
+        conversation = await Conversation.objects.aget(conversation_id=conversation_id)
+    except Conversation.DoesNotExist:
+        raise NotFound("Conversation not found.")
+    if not await is_member(request.user, conversation_id):
+        raise PermissionDenied("You do not have permission to access this conversation.")
+    try:
+        sender = await CustomUser.objects.aget(user_id=sender_id)
+    except CustomUser.DoesNotExist:
+        raise NotFound("Sender not found.")
+    if sender.pk != request.user.pk and not await is_member(sender, conversation_id):
+        raise ValidationError("Sender is not a participant of this conversation.")
+
+    def create():
+        message = services.create_message(conversation, sender, message_body)
+        return MessageSerializer(message).data
+
+    return render(await sync_to_async(create)(), status.HTTP_201_CREATED)
+
+
+# -----------------------
+# GET /async/messages/<id>/
+# -----------------------
+@async_api_view(["GET"])
+async def message_detail(request, pk):
+    validators = await conditional.aget_validators(request, scoped=True, messages__pk=pk)
+
+    async def build():
+        message_id = parse_uuid(pk, "Message not found.")
+        row = await fastpath.message_values(Message.objects.filter(message_id=message_id)).afirst()
+        if row is None:
+            raise NotFound("Message not found.")
+        if not await is_member(request.user, row["conversation_id"]):
+            raise PermissionDenied("You do not have permission to access this message.")
+        return render(fastpath.message_rows([row])[0])
+
+    return await not_modified_or(request, validators, build)
@@ -1,9 +1,18 @@
 # chats/auth.py
+import hmac
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser
 from rest_framework import serializers, status
+from rest_framework.authentication import (
+    BaseAuthentication, SessionAuthentication, get_authorization_header,
+)
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 
 
@@ -42,3 +51,48 @@ class JWTLoginView(APIView):
         serializer = JWTLoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+async def authenticate_async(request):
+    """
+    Authenticate a plain (non-DRF) async view the way the API does.
+
+    A JWT bearer token wins; otherwise the Django session user is used,
+    with DRF's CSRF check on unsafe methods. Returns None when the request
+    is anonymous or the token is invalid.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if result is not None:
+        return result[0]
+    user = await request.auser()
+    if not user.is_authenticated:
+        return None
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        SessionAuthentication().enforce_csrf(request)  # raises PermissionDenied
+    return user
+
+
+# ``request.auth`` of a request authenticated by MetricsTokenAuthentication
+METRICS_SCRAPER = object()
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    ``Authorization: Bearer <CHATS_METRICS_TOKEN>``, for metrics scrapers.
+    The request stays anonymous, with ``request.auth`` set to
+    ``METRICS_SCRAPER``; any other header is left to the next class.
+    """
+
+    def authenticate(self, request):
+        expected = getattr(settings, "CHATS_METRICS_TOKEN", None)
+        if not expected:
+            return None
+        header = get_authorization_header(request).split()
+        if len(header) != 2 or header[0].lower() != b"bearer":
+            return None
+        if not hmac.compare_digest(header[1], expected.encode()):
+            return None
+        return AnonymousUser(), METRICS_SCRAPER
@@ -0,0 +1,192 @@
+"""
+Transparent compression of large message bodies.
+
+``CompressedTextField`` is a TextField that zlib-compresses values of at
+least ``CHATS_COMPRESS_BODIES_OVER`` UTF-8 bytes on write, storing them as
+``MARKER`` followed by the base85 text of the compressed bytes (so the
+column stays a text column on every backend). Values that would not get
+smaller, and every value when the setting is None, are stored as is.
+
+Reads are lazy: a compressed value comes back as ``CompressedText``,
+which inflates on first use as a string (``str()``, comparison, slicing),
+i.e. when the body is serialized. Writing an untouched value back stores
+the compressed text again without inflating it.
+
+What keeps working:
+    * filters on other columns, and exact lookups on the body
+      (the lookup value is encoded the same way);
+    * SQLite search: the FTS5 index triggers inflate bodies with the
+      ``chats_body_text()`` SQL function, which is registered on every
+      Django connection (see ``chats.apps``). Writes to chats_message from
+      outside Django fail on those triggers;
+    * the memory search backend, which reads bodies through the ORM.
+
+Substring lookups (``contains``/``icontains``) only see bodies stored
+uncompressed; use ``?q=`` search instead. On MySQL nothing is compressed,
+since the FULLTEXT index must read the column as text; use InnoDB
+``ROW_FORMAT=COMPRESSED`` there instead.
+"""
+import base64
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+MARKER = "\x01z"
+ESCAPE = "\x01p"  # prefixes stored plain text that happens to start with "\x01"
+LEVEL = 6
+
+
+def threshold():
+    return getattr(settings, "CHATS_COMPRESS_BODIES_OVER", None)
+
+
+def compresses(connection):
+    return threshold() is not None and connection.vendor != "mysql"
+
+
+def encode(text, min_bytes):
+    """The stored form of ``text``: compressed if it is large enough and shrinks."""
+    raw = text.encode()
+    if len(raw) >= min_bytes:
+        stored = MARKER + base64.b85encode(zlib.compress(raw, LEVEL)).decode("ascii")
+        if len(stored) < len(raw):
+            return stored
+    return ESCAPE + text if text.startswith("\x01") else text
+
+
+def decode(stored):
+    """Inverse of ``encode``; text not written by it is returned unchanged."""
+    if stored is None or not stored.startswith("\x01"):
+        return stored
+    if stored.startswith(MARKER):
+        return zlib.decompress(base64.b85decode(stored[len(MARKER):])).decode()
+    if stored.startswith(ESCAPE):
+        return stored[len(ESCAPE):]
+    return stored
+
+
+def register_sqlite_functions(connection):
+    """Expose ``decode`` to SQL as chats_body_text() on a SQLite connection."""
+    connection.connection.create_function("chats_body_text", 1, decode, deterministic=True)
+
+
+class CompressedText:
+    """A compressed body read from the database, inflated on first use."""
+
+    __slots__ = ("stored", "_text")
+
+    def __init__(self, stored):
+        self.stored = stored
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = decode(self.stored)
+        return self._text
+
+    @property
+    def inflated(self):
+        return self._text is not None
+
+    def __repr__(self):
+        return f"<CompressedText {len(self.stored)} chars stored>"
+
+    def __eq__(self, other):
+        if isinstance(other, CompressedText):
+            other = str(other)
+        return str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __len__(self):
+        return len(str(self))
+
+    def __getitem__(self, index):
+        return str(self)[index]
+
+    def __contains__(self, value):
+        return value in str(self)
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __getattr__(self, name):
+        # str methods: strip(), lower(), startswith(), ...
+        return getattr(str(self), name)
+
+
+class CompressedTextField(models.TextField):
+    """TextField storing large values zlib-compressed; see the module docstring."""
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or not value.startswith("\x01"):
+            return value
+        if value.startswith(MARKER):
+            return CompressedText(value)
+        return decode(value)
+
+    def to_python(self, value):
+        if isinstance(value, CompressedText):
+            return str(value)
+        return super().to_python(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, CompressedText):
+            if compresses(connection):
+                return value.stored
+            value = str(value)
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None or not compresses(connection):
+            return value
+        return encode(value, threshold())
+
+
+# -------------------------------------
+# Existing rows
+# -------------------------------------
+def rewrite_batch(queryset, after, batch_size):
+    """
+    Compress the bodies stored plain among the next ``batch_size`` rows of
+    ``queryset`` past primary key ``after`` (None: from the start).
+    Returns ``(last primary key or None when done, rows compressed)``.
+    """
+    rows = queryset.order_by("pk")
+    if after is not None:
+        rows = rows.filter(pk__gt=after)
+    rows = list(rows.only("pk", "message_body")[:batch_size])
+    if not rows:
+        return None, 0
+    min_bytes = threshold()
+    changed = [
+        row for row in rows
+        if isinstance(row.message_body, str)
+        and encode(row.message_body, min_bytes).startswith(MARKER)
+    ]
+    if changed:
+        queryset.model.objects.using(queryset.db).bulk_update(changed, ["message_body"])
+    return rows[-1].pk, len(changed)
+
+
+# -------------------------------------
+# Storage report
+# -------------------------------------
+def storage_report(connection, table, column="message_body", chunk_size=2000):
+    """
+    Count the rows of ``table`` and the UTF-8 bytes of ``column`` as stored
+    and as text. Reads the raw column, so it needs no model.
+    """
+    report = {"rows": 0, "compressed": 0, "stored_bytes": 0, "text_bytes": 0}
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {quote(column)} FROM {quote(table)}")
+        while rows := cursor.fetchmany(chunk_size):
+            for stored, in rows:
+                stored = stored or ""
+                report["rows"] += 1
+                report["compressed"] += stored.startswith(MARKER)
+                report["stored_bytes"] += len(stored.encode())
+                report["text_bytes"] += len(decode(stored).encode())
+    report["saved_bytes"] = report["text_bytes"] - report["stored_bytes"]
+    return report
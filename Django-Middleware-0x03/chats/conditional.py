@@ -0,0 +1,100 @@
+"""
+HTTP validators (ETag / Last-Modified) for the chats read endpoints.
+
+Validators come from a single aggregate over the requesting user's
+conversations and their ConversationSummary rows: no message is loaded
+and nothing is serialized, so a client polling an unchanged resource
+gets its 304 for the price of one indexed query.
+"""
+import hashlib
+from calendar import timegm
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Conversation
+
+
+class Validators:
+    __slots__ = ("etag", "last_modified")
+
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified  # seconds since the epoch, or None
+
+
+def get_validators(request, scoped=False, **lookups):
+    """
+    Compute validators for the conversations of ``request.user`` matching
+    ``lookups`` (e.g. ``pk=...`` or ``messages__pk=...``).
+
+    The summary version sum changes on every message or participant write,
+    the unread sum when the user reads, and the conversation count when
+    one is added or removed.
+    With ``scoped=True`` the resource is a single conversation or message:
+    ``None`` is returned when the user cannot see it, so the view answers
+    with its usual 403/404 instead of a 304.
+    """
+    try:
+        state = _state_queryset(request, lookups).aggregate(**STATE)
+    except ValidationError:  # malformed id in the URL; let the view report it
+        return None
+    return _validators(request, state, scoped)
+
+
+async def aget_validators(request, scoped=False, **lookups):
+    """``get_validators`` for async views."""
+    try:
+        state = await _state_queryset(request, lookups).aaggregate(**STATE)
+    except ValidationError:
+        return None
+    return _validators(request, state, scoped)
+
+
+STATE = {
+    "count": Count("pk"),
+    "versions": Sum("summary__version"),
+    # read marks only move with unread counts (chats.receipts)
+    "unread": Sum("participant_links__unread_count"),
+    "changed": Max("summary__updated_at"),
+    "created": Max("created_at"),
+}
+
+
+def _state_queryset(request, lookups):
+    return Conversation.objects.filter(participant_links__user=request.user, **lookups)
+
+
+def _validators(request, state, scoped):
+    if scoped and not state["count"]:
+        return None
+
+    moments = [moment for moment in (state["changed"], state["created"]) if moment]
+    last_modified = timegm(max(moments).utctimetuple()) if moments else None
+
+    accepted = getattr(request, "accepted_media_type", "")
+    raw = "|".join(str(part) for part in (
+        request.user.pk, request.get_full_path(), accepted,
+        state["count"], state["versions"], state["unread"], last_modified,
+    ))
+    etag = "W/" + quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+    return Validators(etag, last_modified)
+
+
+def not_modified(request, validators):
+    """Return a 304 response if the client's copy is current, else None."""
+    if validators is None or request.method not in ("GET", "HEAD"):
+        return None
+    return get_conditional_response(
+        request, etag=validators.etag, last_modified=validators.last_modified
+    )
+
+
+def with_validators(response, validators):
+    if validators is not None and response.status_code == 200:
+        response["ETag"] = validators.etag
+        if validators.last_modified is not None:
+            response["Last-Modified"] = http_date(validators.last_modified)
+    return response
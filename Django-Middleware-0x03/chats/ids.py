@@ -0,0 +1,94 @@
+"""
+Primary keys for the chats models.
+
+``default_id`` is the default of every chats UUID primary key. With
+``CHATS_TIME_ORDERED_IDS = True`` it returns version 7 UUIDs (RFC 9562):
+a 48-bit millisecond timestamp first, so new rows append to the right
+edge of the primary key B-tree instead of landing on a random page. The
+value is still a UUID and serializes to the same string format; existing
+v4 ids keep working next to v7 ones.
+
+``CompactUUIDField`` stores UUIDs as BINARY(16) on MySQL (Django's
+UUIDField uses CHAR(32) there) and behaves like UUIDField elsewhere.
+Foreign keys take the column type of the field they point to.
+"""
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7():
+    """
+    Time-ordered UUID: 48-bit Unix ms timestamp, 4-bit version, 12-bit
+    counter, 2-bit variant, 62 random bits.
+
+    The counter makes ids generated in this process strictly increasing
+    within a millisecond; when it runs out the timestamp is advanced by one.
+    """
+    global _last_ms, _counter
+    with _lock:
+        now = time.time_ns() // 1_000_000
+        if now > _last_ms:
+            _last_ms = now
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF  # leave headroom
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+        timestamp, counter = _last_ms, _counter
+    random_bits = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return uuid.UUID(int=(
+        (timestamp & ((1 << 48) - 1)) << 80
+        | 0x7 << 76
+        | counter << 64
+        | 0b10 << 62
+        | random_bits
+    ))
+
+
+def default_id():
+    if getattr(settings, "CHATS_TIME_ORDERED_IDS", False):
+        return uuid7()
+    return uuid.uuid4()
+
+
+class CompactUUIDField(models.UUIDField):
+    """UUIDField stored as BINARY(16) on MySQL."""
+
+    def get_internal_type(self):
+        # Not "UUIDField": MySQL's UUID converter would choke on bytes, so
+        # this field converts values from every backend itself.
+        return "CompactUUIDField"
+
+    def db_type(self, connection):
+        if connection.vendor == "mysql":
+            return "binary(16)"
+        return connection.data_types["UUIDField"] % self.db_type_parameters(connection)
+
+    def cast_db_type(self, connection):
+        return self.db_type(connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if connection.vendor != "mysql":
+            return super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = self.to_python(value)
+        return value.bytes
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)) and len(value) == 16:
+            return uuid.UUID(bytes=bytes(value))
+        return uuid.UUID(value)
@@ -0,0 +1,117 @@
+"""
+Read-through cache of ConversationViewSet.list responses, per user.
+
+Entries live in Django's cache framework (locmem by default, so no outside
+service is needed) under a per-user generation token. Invalidating a user
+drops the token, which orphans every cached page of their inbox at once;
+the orphans simply expire. Writes invalidate exactly the participants of
+the conversations they touch, after the transaction commits.
+
+Settings:
+    CHATS_INBOX_CACHE_ALIAS    cache alias to use (default: "default")
+    CHATS_INBOX_CACHE_TTL      entry lifetime in seconds, 0 disables (default: 30)
+    CHATS_INBOX_CACHE_MAX_TTL  hard cap applied to the TTL (default: 300)
+"""
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import ConversationParticipant
+
+KEY_PREFIX = "chats:inbox"
+
+
+class CacheStats:
+    """Hit/miss counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def record(self, attr, amount=1):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + amount)
+
+    def as_dict(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[getattr(settings, "CHATS_INBOX_CACHE_ALIAS", "default")]
+
+
+def get_ttl():
+    ttl = getattr(settings, "CHATS_INBOX_CACHE_TTL", 30)
+    return min(ttl, getattr(settings, "CHATS_INBOX_CACHE_MAX_TTL", 300))
+
+
+def generation_key(user_id):
+    return f"{KEY_PREFIX}:gen:{user_id}"
+
+
+def _generation(cache, user_id):
+    key = generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # add() keeps whichever token a concurrent request stored first
+        cache.add(key, uuid.uuid4().hex, get_ttl())
+        generation = cache.get(key)
+    return generation
+
+
+def entry_key(request):
+    cache = get_cache()
+    user_id = request.user.pk
+    url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f"{KEY_PREFIX}:{user_id}:{_generation(cache, user_id)}:{url}"
+
+
+def get_or_build(request, build):
+    """
+    Return the cached inbox page for ``request``, or ``build()`` and store it.
+
+    ``build`` returns the response payload (plain data, not a Response).
+    """
+    if get_ttl() <= 0:
+        return build()
+    cache = get_cache()
+    key = entry_key(request)
+    data = cache.get(key)
+    if data is not None:
+        stats.record("hits")
+        return data
+    stats.record("misses")
+    data = build()
+    cache.set(key, data, get_ttl())
+    return data
+
+
+def invalidate_users(user_ids):
+    keys = [generation_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+
+    def drop():
+        get_cache().delete_many(keys)
+        stats.record("invalidations", len(keys))
+
+    # Dropping before commit would let a concurrent read re-cache old rows.
+    transaction.on_commit(drop)
+
+
+def invalidate_conversations(conversation_ids):
+    """Invalidate the inbox of every participant of the given conversations."""
+    invalidate_users(
+        ConversationParticipant.objects.filter(conversation_id__in=conversation_ids)
+        .values_list("user_id", flat=True)
+    )
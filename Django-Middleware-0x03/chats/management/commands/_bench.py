@@ -0,0 +1,110 @@
+"""
+Shared helpers for the chats ``bench_*`` management commands.
+
+Benchmarks never touch the configured database: they run against a
+throwaway test database created (and destroyed) with Django's test
+database machinery, so they can be pointed at a dev or staging settings
+module safely.
+"""
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from chats.models import Conversation, ConversationParticipant, CustomUser, Message
+
+
+@contextmanager
+def bench_database(keepdb=False):
+    """Create a test database for the duration of the block."""
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        if not keepdb:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed(users=100, conversations=1000, messages=10000, batch_size=10000, log=None):
+    """
+    Fill the chats tables with random but reproducible data.
+
+    Every conversation gets two participants; messages are spread across
+    conversations and senders, one second apart, ending now.
+    """
+    rng = random.Random(1234)
+    user_objs = [
+        CustomUser(
+            user_id=uuid.uuid4(), username=f"bench{i}", email=f"bench{i}@example.com",
+            first_name="Bench", last_name=str(i), password="!",
+        )
+        for i in range(users)
+    ]
+    CustomUser.objects.bulk_create(user_objs, batch_size=batch_size)
+    user_ids = [u.user_id for u in user_objs]
+
+    conversation_objs = [Conversation(conversation_id=uuid.uuid4()) for _ in range(conversations)]
+    Conversation.objects.bulk_create(conversation_objs, batch_size=batch_size)
+    members = {}
+    links = []
+    for conversation in conversation_objs:
+        pair = rng.sample(user_ids, 2)
+        members[conversation.conversation_id] = pair
+        links.extend(
+            ConversationParticipant(conversation_id=conversation.conversation_id, user_id=uid)
+            for uid in pair
+        )
+    ConversationParticipant.objects.bulk_create(links, batch_size=batch_size)
+
+    conversation_ids = list(members)
+    start = timezone.now() - timedelta(seconds=messages)
+    with explicit_sent_at():
+        for offset in range(0, messages, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, messages)):
+                conversation_id = rng.choice(conversation_ids)
+                batch.append(Message(
+                    message_id=uuid.uuid4(),
+                    conversation_id=conversation_id,
+                    sender_id=rng.choice(members[conversation_id]),
+                    message_body=f"bench message {i}",
+                    sent_at=start + timedelta(seconds=i),
+                ))
+            Message.objects.bulk_create(batch)
+            if log:
+                log(f"  seeded {offset + len(batch)}/{messages} messages")
+    return user_ids, conversation_ids
+
+
+@contextmanager
+def explicit_sent_at():
+    """Let seeded messages keep their own sent_at instead of auto_now_add."""
+    field = Message._meta.get_field("sent_at")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def timed(func, repeat=20):
+    """Run ``func`` ``repeat`` times; return (p50, p95, max) in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples), p95, samples[-1]
+
+
+def format_timing(label, timing):
+    p50, p95, worst = timing
+    return f"{label:<40} p50={p50:8.3f}ms  p95={p95:8.3f}ms  max={worst:8.3f}ms"
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chats import archive, services
+
+
+class Command(BaseCommand):
+    help = (
+        "Move messages older than CHATS_ARCHIVE_AFTER_DAYS (or --older-than-days) "
+        "into the archive table, oldest first, one batch per transaction. "
+        "Safe to interrupt: a rerun continues where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=None)
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Messages moved per transaction (default: 500).",
+        )
+        parser.add_argument("--max-batches", type=int, default=None,
+                            help="Stop after this many batches.")
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Seconds to sleep between batches, to spare the primary.")
+
+    def handle(self, *args, **options):
+        days = options["older_than_days"]
+        if days is None:
+            days = getattr(settings, "CHATS_ARCHIVE_AFTER_DAYS", None)
+        if days is None:
+            raise CommandError("Archiving is disabled; set CHATS_ARCHIVE_AFTER_DAYS "
+                               "or pass --older-than-days.")
+        if not archive.enabled():
+            self.stderr.write("Warning: CHATS_ARCHIVE_AFTER_DAYS is not set, so the API "
+                              "will not read archived messages.")
+
+        before = archive.cutoff(days)
+        total = batches = 0
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            moved = services.archive_messages(before, options["batch_size"])
+            if not moved:
+                break
+            total += moved
+            batches += 1
+            self.stdout.write(f"Archived {total} messages...")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total} messages sent before {before.isoformat()} archived."
+        ))
+
@@ -0,0 +1,144 @@
+from datetime import datetime, time
+
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse, HttpResponseForbidden
+from django.test import RequestFactory, override_settings
+
+from chats import ratelimit
+from chats.middleware import AccessPolicyMiddleware
+from chats.models import CustomUser
+
+from ._bench import timed
+
+# Every check passes for the benchmark requests (open all day, generous
+# limit), so both stacks do their full work and reach the view.
+POLICY = [
+    {"path": "/api/v1/chats/", "hours": ["00:00", "23:59"], "roles": ["admin", "moderator"]},
+    {"path": "/api/v1/chats/auth/", "roles": None},
+]
+RATE_LIMITS = [{"path": "/api/v1/chats/", "methods": ["POST"], "limit": 10**9, "window": 60}]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the overhead of the chats access checks: the former chain "
+        "of three middlewares (opening hours, rate limit, role) against the "
+        "compiled AccessPolicyMiddleware, on chat and non-chat paths. Both "
+        "are chained the way Django's handler chains middleware."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20000,
+                            help="Requests per timed sample.")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        user = CustomUser(username="bench", role="admin")
+        requests = []
+        for label, method, path in (
+            ("GET chats conversation list", "get", "/api/v1/chats/conversations/"),
+            ("POST chats message", "post", "/api/v1/chats/messages/"),
+            ("POST chats login (role lifted)", "post", "/api/v1/chats/auth/login/"),
+            ("GET /admin/ (not chats)", "get", "/admin/"),
+            ("GET static file (not chats)", "get", "/static/app.css"),
+        ):
+            request = getattr(factory, method)(path)
+            request.user = user
+            requests.append((label, request))
+
+        response = HttpResponse()
+
+        def view(request):
+            return response
+
+        with override_settings(CHATS_ACCESS_POLICY=POLICY, CHATS_RATE_LIMITS=RATE_LIMITS,
+                               CHATS_RATE_LIMIT_STORE="memory"):
+            stacks = [
+                ("no access checks", chain(view, [])),
+                ("three middlewares (before)", chain(view, LEGACY_MIDDLEWARE)),
+                ("compiled policy", chain(view, [AccessPolicyMiddleware])),
+            ]
+
+        for label, request in requests:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+            for name, stack in stacks:
+                def run():
+                    for _ in range(options["requests"]):
+                        stack(request)
+                p50, p95, _ = timed(run, repeat=options["repeat"])
+                scale = 1000 / options["requests"]  # ms per sample -> µs per request
+                self.stdout.write(
+                    f"{name:<28} p50={p50 * scale:6.2f}µs  p95={p95 * scale:6.2f}µs per request"
+                )
+
+
+def chain(view, middleware):
+    """Wrap ``view`` the way django.core.handlers.base.BaseHandler does."""
+    handler = convert_exception_to_response(view)
+    for middleware_class in reversed(middleware):
+        handler = convert_exception_to_response(middleware_class(handler))
+    return handler
+
+
+# -------------------------------------
+# The middleware the policy replaced (open all day here)
+# -------------------------------------
+class RestrictAccessByTimeMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.start_time = time(0, 0)
+        self.end_time = time(23, 59)
+
+    def __call__(self, request):
+        current_time = datetime.now().time()
+        if request.path.startswith("/api/v1/chats/"):
+            if not (self.start_time <= current_time <= self.end_time):
+                return HttpResponseForbidden("Restricted.")
+        return self.get_response(request)
+
+
+class OffensiveLanguageMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rules = RATE_LIMITS
+        self.limiter = ratelimit.SlidingWindowLimiter()
+
+    def __call__(self, request):
+        for position, rule in enumerate(self.rules):
+            if request.path.startswith(rule["path"]) and request.method in rule["methods"]:
+                break
+        else:
+            return self.get_response(request)
+
+        key = f"{position}:{self.get_ip(request)}"
+        if self.limiter.hit(key, rule["limit"], rule["window"]) is not None:
+            return HttpResponse(status=429)
+        return self.get_response(request)
+
+    def get_ip(self, request):
+        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+        if x_forwarded_for:
+            return x_forwarded_for.split(",")[0].strip()
+        return request.META.get("REMOTE_ADDR", "unknown")
+
+
+class RolepermissionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.allowed_roles = ["admin", "moderator"]
+
+    def __call__(self, request):
+        user = getattr(request, "user", None)
+        if user and user.is_authenticated:
+            if getattr(user, "role", None) not in self.allowed_roles:
+                return HttpResponseForbidden("No permission.")
+        else:
+            return HttpResponseForbidden("Not logged in.")
+        return self.get_response(request)
+
+
+LEGACY_MIDDLEWARE = [
+    RestrictAccessByTimeMiddleware, OffensiveLanguageMiddleware, RolepermissionMiddleware,
+]
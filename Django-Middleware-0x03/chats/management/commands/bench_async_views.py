@@ -0,0 +1,126 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chats import policy
+from chats.models import ConversationParticipant, CustomUser, Message, UserRole
+
+from ._bench import bench_database, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the ASGI application in-process with concurrent clients and "
+        "compare the DRF viewsets against the native async views "
+        "(throughput and tail latency per concurrency level), behind the "
+        "project's MIDDLEWARE. Opening hours are lifted so results do not "
+        "depend on the time of day."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+        parser.add_argument("--requests", type=int, default=500,
+                            help="Requests per endpoint and concurrency level.")
+        parser.add_argument("--messages", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        rules = getattr(settings, "CHATS_ACCESS_POLICY", policy.DEFAULT_POLICY)
+        with bench_database(), override_settings(
+            CHATS_ACCESS_POLICY=[{**rule, "hours": None} for rule in rules],
+            CHATS_INBOX_CACHE_TTL=0, ALLOWED_HOSTS=["localhost"],
+        ):
+            seed(users=50, conversations=500, messages=options["messages"])
+            link = ConversationParticipant.objects.order_by("conversation_id").first()
+            user = CustomUser.objects.get(pk=link.user_id)
+            user.role = UserRole.Admin
+            user.save(update_fields=["role"])
+            message_id = Message.objects.filter(conversation_id=link.conversation_id).first().pk
+            token = str(AccessToken.for_user(user))
+
+            endpoints = [
+                ("conversation list", "conversations/", "preview=3"),
+                ("message list (cursor)", f"conversations/{link.conversation_id}/messages/",
+                 "pagination=cursor"),
+                ("message retrieve", f"messages/{message_id}/", ""),
+            ]
+            app = get_asgi_application()
+            for label, path, query in endpoints:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+                for concurrency in options["concurrency"]:
+                    for stack, prefix in (("sync viewset", ""), ("async view", "async/")):
+                        stats = asyncio.run(load(
+                            app, f"/api/v1/chats/{prefix}{path}", query, token,
+                            concurrency, options["requests"],
+                        ))
+                        self.stdout.write(format_load(f"{stack:<13} c={concurrency:<4}", stats))
+
+
+async def load(app, path, query, token, concurrency, total):
+    """Run ``total`` GETs with ``concurrency`` clients; return timings in ms."""
+    samples = []
+    remaining = iter(range(total))
+
+    async def client():
+        for _ in remaining:
+            started = time.perf_counter()
+            status = await call(app, path, query, token)
+            samples.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                raise AssertionError(f"GET {path} returned {status}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    samples.sort()
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+    return {
+        "rps": total / elapsed, "p50": statistics.median(samples),
+        "p95": percentile(0.95), "p99": percentile(0.99), "max": samples[-1],
+    }
+
+
+async def call(app, path, query, token):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    sent = asyncio.Event()
+    status = None
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await sent.wait()  # the client stays connected until the response is complete
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body"):
+            sent.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+def format_load(label, stats):
+    return (
+        f"{label}  {stats['rps']:8.1f} req/s  p50={stats['p50']:7.2f}ms  "
+        f"p95={stats['p95']:7.2f}ms  p99={stats['p99']:7.2f}ms  max={stats['max']:7.2f}ms"
+    )
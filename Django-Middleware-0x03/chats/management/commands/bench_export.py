@@ -0,0 +1,60 @@
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from chats import export
+from chats.models import Conversation, ConversationParticipant, CustomUser, Message
+
+from ._bench import bench_database, explicit_sent_at
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream conversation exports of growing size and report time and "
+        "peak Python memory, which should stay flat with the chunk size. "
+        "Times include tracemalloc overhead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, nargs="+", default=[1000, 10000, 100000])
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--output", choices=sorted(export.CONTENT_TYPES), default="ndjson")
+
+    def handle(self, *args, **options):
+        with bench_database():
+            sender = CustomUser.objects.create_user(
+                username="exporter", email="exporter@example.com", password="!"
+            )
+            for size in options["messages"]:
+                conversation = Conversation.objects.create()
+                ConversationParticipant.objects.create(conversation=conversation, user=sender)
+                fill(conversation, sender, size)
+
+                tracemalloc.start()
+                started = time.perf_counter()
+                written = sum(
+                    len(part.encode())
+                    for part in export.stream(conversation.pk, options["output"], options["chunk_size"])
+                )
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write(
+                    f"{size:>9} messages  {written / 2**20:8.1f} MiB out  "
+                    f"{elapsed:7.2f}s  peak={peak / 2**20:6.1f} MiB"
+                )
+
+
+def fill(conversation, sender, size, batch_size=10000):
+    with explicit_sent_at():
+        for offset in range(0, size, batch_size):
+            Message.objects.bulk_create([
+                Message(
+                    message_id=uuid.uuid4(), conversation=conversation, sender=sender,
+                    message_body=f"export message {i}", sent_at=conversation.created_at,
+                )
+                for i in range(offset, min(offset + batch_size, size))
+            ])
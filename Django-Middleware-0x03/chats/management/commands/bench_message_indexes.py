@@ -0,0 +1,97 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from chats.models import ConversationParticipant, Message
+
+from ._bench import bench_database, format_timing, seed, timed
+
+# Indexes added by migration 0005, keyed by the model that owns them.
+INDEXES = [
+    (Message, "chats_msg_conv_sent_idx"),
+    (Message, "chats_msg_sender_sent_idx"),
+    (ConversationParticipant, "chats_part_user_conv_idx"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and compare query plans and latency of the "
+        "hot chats message queries with and without the composite indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2_000_000)
+        parser.add_argument("--conversations", type=int, default=20_000)
+        parser.add_argument("--users", type=int, default=5_000)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--keepdb", action="store_true",
+                            help="Reuse (and keep) the seeded benchmark database.")
+
+    def handle(self, *args, **options):
+        with bench_database(keepdb=options["keepdb"]) as connection:
+            if not Message.objects.exists():
+                self.stdout.write(f"Seeding {options['messages']} messages...")
+                seed(options["users"], options["conversations"], options["messages"],
+                     log=self.stdout.write)
+
+            queries = self.build_queries()
+            with connection.schema_editor() as editor:
+                for model, name in INDEXES:
+                    editor.remove_index(model, self.get_index(model, name))
+            self.run("without composite indexes", queries, options["repeat"])
+
+            with connection.schema_editor() as editor:
+                for model, name in INDEXES:
+                    editor.add_index(model, self.get_index(model, name))
+            self.run("with composite indexes", queries, options["repeat"])
+
+    @staticmethod
+    def get_index(model, name):
+        return next(index for index in model._meta.indexes if index.name == name)
+
+    def build_queries(self):
+        rng = random.Random(42)
+        count = Message.objects.count()
+        conversation_id, sender_id, sent_at = (
+            Message.objects.order_by("pk")
+            .values_list("conversation_id", "sender_id", "sent_at")[rng.randrange(count)]
+        )
+        middle = (
+            Message.objects.filter(conversation_id=conversation_id)
+            .order_by("sent_at", "message_id")
+            .values_list("sent_at", "message_id")
+        )
+        middle = middle[middle.count() // 2]
+
+        return {
+            "conversation first page": lambda: (
+                Message.objects.filter(conversation_id=conversation_id)
+                .order_by("sent_at", "message_id")[:20]
+            ),
+            "conversation keyset page (middle)": lambda: (
+                Message.objects.filter(conversation_id=conversation_id)
+                .filter(Q(sent_at__gt=middle[0]) | Q(sent_at=middle[0], message_id__gt=middle[1]))
+                .order_by("sent_at", "message_id")[:20]
+            ),
+            "sender + date range": lambda: (
+                Message.objects.filter(
+                    sender_id=sender_id,
+                    sent_at__gte=sent_at - timedelta(days=1),
+                    sent_at__lte=sent_at,
+                ).order_by("sent_at")[:20]
+            ),
+            "conversations of a user": lambda: (
+                ConversationParticipant.objects.filter(user_id=sender_id)
+                .values_list("conversation_id", flat=True)
+            ),
+        }
+
+    def run(self, label, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {label} =="))
+        for name, build in queries.items():
+            self.stdout.write(f"\n-- {name}")
+            self.stdout.write(build().explain())
+            self.stdout.write(format_timing(name, timed(lambda: list(build()), repeat)))
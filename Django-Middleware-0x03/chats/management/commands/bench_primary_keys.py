@@ -0,0 +1,68 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from chats.ids import uuid7
+from chats.models import Conversation, ConversationParticipant, CustomUser, Message
+
+from ._bench import bench_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert messages keyed by random (v4) and time-ordered (v7) UUIDs "
+        "and compare insert throughput and the on-disk size of the "
+        "message table and its indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=200000)
+        parser.add_argument("--batch-size", type=int, default=500,
+                            help="Rows per INSERT/transaction (default: 500).")
+
+    def handle(self, *args, **options):
+        for label, generate in (("uuid4 (random)", uuid.uuid4), ("uuid7 (time-ordered)", uuid7)):
+            with bench_database():
+                elapsed = insert(generate, options["messages"], options["batch_size"])
+                sizes = table_sizes(connection, Message._meta.db_table)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+            self.stdout.write(f"  {options['messages'] / elapsed:10.0f} rows/s ({elapsed:.2f}s)")
+            for name, size in sizes:
+                self.stdout.write(f"  {name:<40} {size / 2**20:8.2f} MiB")
+
+
+def insert(generate, total, batch_size):
+    user = CustomUser.objects.create_user(username="keys", email="keys@example.com", password="!")
+    conversation = Conversation.objects.create()
+    ConversationParticipant.objects.create(conversation=conversation, user=user)
+    started = time.perf_counter()
+    for offset in range(0, total, batch_size):
+        with transaction.atomic():
+            Message.objects.bulk_create([
+                Message(message_id=generate(), conversation=conversation, sender=user,
+                        message_body=f"key bench {i}")
+                for i in range(offset, min(offset + batch_size, total))
+            ])
+    return time.perf_counter() - started
+
+
+def table_sizes(connection, table):
+    """[(btree name, bytes)] for the table and its indexes."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT name, SUM(pgsize) FROM dbstat WHERE name = %s OR name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s) "
+                "GROUP BY name ORDER BY name", [table, table],
+            )
+            return cursor.fetchall()
+        if connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT index_name, stat_value * @@innodb_page_size FROM mysql.innodb_index_stats "
+                "WHERE database_name = DATABASE() AND table_name = %s AND stat_name = 'size' "
+                "ORDER BY index_name", [table],
+            )
+            return cursor.fetchall()
+    return []
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from chats import ratelimit
+
+STORES = ("memory", "cache", "mmap", "sqlite")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the rate-limit stores: hits/s from one process and from "
+        "several forked workers sharing the store, and how many requests "
+        "the workers let through for a single hot key (should be the limit)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stores", nargs="+", choices=STORES, default=list(STORES))
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+        parser.add_argument("--hits", type=int, default=20000, help="Hits per worker.")
+        parser.add_argument("--keys", type=int, default=10000,
+                            help="Distinct client keys the throughput runs cycle through.")
+        parser.add_argument("--limit", type=int, default=100,
+                            help="Limit of the hot-key run.")
+
+    def handle(self, *args, **options):
+        if not hasattr(os, "fork"):
+            raise CommandError("bench_ratelimit forks its workers (POSIX only).")
+        with tempfile.TemporaryDirectory() as directory:
+            for name in options["stores"]:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}"))
+                for workers in options["workers"]:
+                    store = make_store(name, os.path.join(directory, f"{name}.{workers}"),
+                                       options["keys"])
+                    rate = run(store, workers, options["hits"], options["keys"], limit=10**9)[0]
+                    store = make_store(name, os.path.join(directory, f"{name}.{workers}.hot"),
+                                       options["keys"])
+                    allowed = run(store, workers, options["limit"] * 2, 1,
+                                  limit=options["limit"])[1]
+                    self.stdout.write(
+                        f"workers={workers:<3} {rate:12.0f} hits/s   hot key: "
+                        f"{allowed}/{workers * options['limit'] * 2} allowed "
+                        f"(limit {options['limit']})"
+                    )
+        if "memory" in options["stores"]:
+            self.stdout.write(
+                "\nmemory is per process: each worker allows the full limit on its own."
+            )
+        if "cache" in options["stores"] and isinstance(caches[cache_alias()], LocMemCache):
+            self.stdout.write(
+                "cache ran on the local-memory backend, which is per process too; "
+                "point CACHES at Redis or Memcached to measure the shared store."
+            )
+
+
+def cache_alias():
+    return getattr(settings, "CHATS_RATE_LIMIT_CACHE", "default")
+
+
+def make_store(name, path, keys):
+    if name == "cache":
+        return ratelimit.CacheStore(cache_alias(), prefix=f"bench:{os.path.basename(path)}")
+    if name == "mmap":
+        return ratelimit.MmapStore(path, slots=keys * 2)
+    if name == "sqlite":
+        return ratelimit.SQLiteStore(path)
+    return ratelimit.SlidingWindowLimiter(max_keys=keys * 2)
+
+
+def run(store, workers, hits, keys, limit):
+    """Fork ``workers`` processes doing ``hits`` each; return (hits/s, allowed)."""
+    context = multiprocessing.get_context("fork")
+    start, results = context.Event(), context.Queue()
+
+    def worker(number):
+        start.wait()
+        allowed = 0
+        for i in range(hits):
+            allowed += store.hit(f"10.0.{number}.{i % keys}" if keys > 1 else "hot",
+                                 limit, 3600) is None
+        results.put(allowed)
+
+    processes = [context.Process(target=worker, args=(n,)) for n in range(workers)]
+    for process in processes:
+        process.start()
+    started = time.perf_counter()
+    start.set()
+    allowed = sum(results.get() for _ in processes)
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return workers * hits / elapsed, allowed
@@ -0,0 +1,96 @@
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from chats import requestlog
+from chats.middleware import RequestLoggingMiddleware
+
+from ._bench import timed
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request overhead of the request log: the former "
+        "synchronous FileHandler line against the queued JSON handler at a "
+        "few sampling rates (middleware around a no-op view). The queued "
+        "handler's writer-thread time is reported next to the request path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000,
+                            help="Requests per timed sample.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--sample-rates", type=float, nargs="+", default=[1.0, 0.1])
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get("/api/v1/chats/conversations/?page=2")
+        request.user = AnonymousUser()
+
+        def get_response(request):
+            return HttpResponse()
+
+        def per_request(func):
+            def run():
+                for _ in range(options["requests"]):
+                    func(request)
+            p50, p95, _ = timed(run, repeat=options["repeat"])
+            scale = 1000 / options["requests"]  # ms per sample -> µs per request
+            return p50 * scale, p95 * scale
+
+        with tempfile.TemporaryDirectory() as directory:
+            rows = [("no logging", per_request(get_response))]
+
+            handler = logging.FileHandler(os.path.join(directory, "sync.log"))
+            handler.setFormatter(logging.Formatter("[{asctime}] {levelname} {message}", style="{"))
+            legacy = bench_logger("sync", handler)
+
+            def legacy_middleware(request):
+                user = request.user.username if request.user.is_authenticated else "Anonymous"
+                legacy.info(f"{datetime.now()} - User: {user} - Path: {request.get_full_path()}")
+                return get_response(request)
+
+            rows.append(("FileHandler, synchronous (before)", per_request(legacy_middleware)))
+            handler.close()
+
+            for rate in options["sample_rates"]:
+                # The writer is parked while requests are timed, then timed
+                # on its own draining the backlog: the request path and the
+                # background cost are reported separately.
+                handler = requestlog.QueuedRotatingFileHandler(
+                    os.path.join(directory, f"queued.{rate}.log"), queue_size=10**8,
+                    batch_size=10**8, flush_interval=3600,
+                )
+                handler.setFormatter(requestlog.JSONFormatter())
+                with override_settings(CHATS_REQUEST_LOG_SAMPLE_RATE=rate):
+                    middleware = RequestLoggingMiddleware(get_response)
+                middleware.logger = bench_logger(f"queued.{rate}", handler)
+                timing = per_request(middleware)
+                handler.batch_size = 500
+                started = time.perf_counter()
+                handler.flush()
+                background = (time.perf_counter() - started) * 10**6 / (
+                    options["requests"] * options["repeat"]
+                )
+                rows.append((f"queued JSON, sample={rate:g}", timing, background))
+                handler.close()
+
+        for label, (p50, p95), *background in rows:
+            line = f"{label:<36} p50={p50:7.2f}µs  p95={p95:7.2f}µs per request"
+            if background:
+                line += f"  + writer thread {background[0]:6.2f}µs"
+            self.stdout.write(line)
+
+
+def bench_logger(name, handler):
+    logger = logging.getLogger(f"chats.bench.{name}")
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
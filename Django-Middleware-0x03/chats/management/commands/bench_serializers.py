@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from chats import fastpath
+from chats.models import Message
+from chats.serializers import MessageSerializer
+
+from ._bench import bench_database, format_timing, seed, timed
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the DRF MessageSerializer against the values()-based fast "
+        "path, end to end (query + serialization + JSON rendering)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        with bench_database():
+            seed(users=50, conversations=200, messages=max(options["rows"]))
+            ordered = Message.objects.order_by("sent_at", "message_id")
+
+            for rows in options["rows"]:
+                def drf():
+                    page = ordered.select_related("sender")[:rows]
+                    return renderer.render(MessageSerializer(page, many=True).data)
+
+                def fast():
+                    page = fastpath.message_values(ordered)[:rows]
+                    return renderer.render(fastpath.message_rows(page))
+
+                if drf() != fast():
+                    raise AssertionError("fast path output differs from MessageSerializer")
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n{rows} messages (byte-identical)"))
+                slow_timing = timed(drf, options["repeat"])
+                fast_timing = timed(fast, options["repeat"])
+                self.stdout.write(format_timing("MessageSerializer", slow_timing))
+                self.stdout.write(format_timing("fastpath.message_rows", fast_timing))
+                self.stdout.write(f"speedup (p50): {slow_timing[0] / fast_timing[0]:.1f}x")
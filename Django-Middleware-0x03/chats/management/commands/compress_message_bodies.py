@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from chats import compression
+from chats.models import ArchivedMessage, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Report how much space compressed message bodies save. With "
+        "--rewrite, first compress the existing bodies above "
+        "CHATS_COMPRESS_BODIES_OVER that are still stored as plain text, "
+        "one batch per transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rewrite", action="store_true")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Messages scanned per transaction (default: 1000).",
+        )
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        for model in (Message, ArchivedMessage):
+            alias = router.db_for_write(model)
+            if options["rewrite"]:
+                if not compression.compresses(connections[alias]):
+                    raise CommandError(
+                        "Compression is off for this database; set CHATS_COMPRESS_BODIES_OVER "
+                        "(bodies are never compressed on MySQL)."
+                    )
+                self.rewrite(model, alias, options["batch_size"], options["pause"])
+            self.report(model, alias)
+
+    def rewrite(self, model, alias, batch_size, pause):
+        last, total = None, 0
+        while True:
+            with transaction.atomic(using=alias):
+                last, compressed = compression.rewrite_batch(
+                    model.objects.using(alias), last, batch_size
+                )
+            if last is None:
+                break
+            total += compressed
+            if pause:
+                time.sleep(pause)
+        self.stdout.write(f"{model._meta.db_table}: compressed {total} bodies.")
+
+    def report(self, model, alias):
+        report = compression.storage_report(connections[alias], model._meta.db_table)
+        ratio = report["stored_bytes"] / report["text_bytes"] if report["text_bytes"] else 1
+        self.stdout.write(self.style.MIGRATE_HEADING(model._meta.db_table))
+        self.stdout.write(f"  rows                {report['rows']:>12}")
+        self.stdout.write(f"  compressed bodies   {report['compressed']:>12}")
+        self.stdout.write(f"  text size           {report['text_bytes'] / 2**20:>12.2f} MiB")
+        self.stdout.write(f"  stored size         {report['stored_bytes'] / 2**20:>12.2f} MiB")
+        self.stdout.write(self.style.SUCCESS(
+            f"  saved               {report['saved_bytes'] / 2**20:>12.2f} MiB ({1 - ratio:.0%})"
+        ))
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from chats import sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete message change log rows older than CHATS_SYNC_RETENTION_DAYS "
+        "(or --older-than-days), oldest first, one batch per statement. Sync "
+        "tokens older than what is kept get 410 and must start over."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=None)
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Rows deleted per statement (default: 1000).",
+        )
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="Seconds to sleep between batches, to spare the primary.")
+
+    def handle(self, *args, **options):
+        days = options["older_than_days"]
+        if days is None:
+            days = getattr(settings, "CHATS_SYNC_RETENTION_DAYS", None)
+        if days is None:
+            raise CommandError("Pruning is disabled; set CHATS_SYNC_RETENTION_DAYS "
+                               "or pass --older-than-days.")
+
+        before = timezone.now() - timedelta(days=days)
+        total = 0
+        while True:
+            deleted = sync.prune(before, options["batch_size"])
+            if not deleted:
+                break
+            total += deleted
+            self.stdout.write(f"Pruned {total} changes...")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total} changes from before {before.isoformat()} pruned."
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chats import inbox_cache, receipts
+from chats.models import Conversation, ConversationParticipant, ConversationSummary
+from chats.summaries import rebuild_summaries
+
+
+def lock(queryset):
+    list(queryset.select_for_update().order_by("pk").values_list("pk", flat=True))
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every ConversationSummary, and the participants' unread "
+        "counts, from the messages table (and the archive, when enabled), "
+        "walking conversations in primary-key order in fixed-size batches, "
+        "one transaction each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Conversations rebuilt per query/transaction (default: 500).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        conversations = Conversation.objects.order_by("pk").values_list("pk", flat=True)
+
+        last_pk, total = None, 0
+        while True:
+            batch = conversations.filter(pk__gt=last_pk) if last_pk else conversations
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                # Message writes update these rows, in this order: lock them
+                # so a write to the batch waits instead of being overwritten.
+                lock(ConversationSummary.objects.filter(conversation_id__in=batch))
+                lock(ConversationParticipant.objects.filter(conversation_id__in=batch))
+                total += rebuild_summaries(batch)
+                receipts.recount(batch)
+                inbox_cache.invalidate_conversations(batch)
+            last_pk = batch[-1]
+            self.stdout.write(f"Rebuilt {total} summaries...")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} conversation summaries rebuilt."))
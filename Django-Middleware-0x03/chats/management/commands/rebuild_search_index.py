@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from chats import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the message full-text index from chats_message. Needed on "
+        "SQLite after a VACUUM, which may renumber the rowids it is keyed on."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite":
+            if not search.sqlite_fts_installed(connection):
+                raise CommandError("FTS5 index not installed; is SQLite built with FTS5?")
+            search.ensure_sqlite_fts(connection, rebuild=True)
+        elif connection.vendor == "mysql":
+            with connection.cursor() as cursor:
+                cursor.execute("OPTIMIZE TABLE chats_message")
+        search.memory_backend.reset()  # rebuilt from the database on next use
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
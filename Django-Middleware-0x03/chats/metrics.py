@@ -0,0 +1,251 @@
+"""
+Per-route request metrics for chats.middleware.MetricsMiddleware, served
+in the Prometheus text format by MetricsViewSet (``/metrics/``).
+
+For every request the middleware records, under the route pattern that
+matched (``api/v1/chats/messages/(?P<pk>[^/.]+)/``, so label values stay
+few; ``<unresolved>`` when no route matched):
+
+    chats_http_requests_total               counter: route, method, status
+    chats_http_request_duration_seconds     histogram: route, method
+    chats_http_response_size_bytes          histogram: route, method
+                                            (streaming responses skipped)
+    chats_db_queries_per_request            histogram: route, method
+    chats_db_duration_seconds               histogram of time spent in
+                                            queries per request
+
+Queries are counted and timed by ``time_queries``, an execute wrapper
+installed on every connection as it opens; it reports to the request's
+``QueryTimer``, kept in a context variable so queries a sync view runs
+in a worker thread under ASGI are counted too. All of a request's updates take one uncontended lock on a
+dict of plain lists, so recording costs a few microseconds.
+
+Each process aggregates on its own. With several worker processes (e.g.
+gunicorn), set CHATS_METRICS_DIR: every process writes a snapshot of its
+totals to ``chats-metrics.<pid>.json`` there, at most every
+CHATS_METRICS_FLUSH_INTERVAL seconds and at exit, and a scrape adds up
+the snapshots of all processes (its own taken live). Snapshots of exited
+workers are kept so counters never go down; empty the directory when
+the server (re)starts.
+
+Settings:
+    CHATS_METRICS_DIR              snapshot directory shared by the worker
+                                   processes (default: None, this process
+                                   only)
+    CHATS_METRICS_FLUSH_INTERVAL   seconds between snapshots (default: 5)
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets)
+FAMILIES = {
+    "chats_http_requests_total": (
+        "counter", "Requests by route, method and status code.", None,
+    ),
+    "chats_http_request_duration_seconds": (
+        "histogram", "Time spent in the view and the middleware below it.", LATENCY_BUCKETS,
+    ),
+    "chats_http_response_size_bytes": (
+        "histogram", "Response body size (streaming responses excluded).", SIZE_BUCKETS,
+    ),
+    "chats_db_queries_per_request": (
+        "histogram", "Database queries run by a request.", QUERY_BUCKETS,
+    ),
+    "chats_db_duration_seconds": (
+        "histogram", "Time a request spent in database queries.", LATENCY_BUCKETS,
+    ),
+}
+
+UNRESOLVED = "<unresolved>"
+METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class QueryTimer:
+    """Counts and times the queries of one request (see ``time_queries``)."""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - started
+            self.count += 1
+
+
+current_timer = ContextVar("chats_query_timer", default=None)
+
+
+def time_queries(execute, sql, params, many, context):
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    """``connection_created`` receiver (see ChatsConfig.ready)."""
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class Registry:
+    """
+    This process's totals: ``series`` maps (name, labels) to a list, the
+    count for counters, and per-bucket counts (the last one +Inf) then
+    the sum for histograms.
+    """
+
+    def __init__(self):
+        self.series = {}
+        self.pid = os.getpid()
+        self.flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _observe(self, name, labels, value):
+        buckets = FAMILIES[name][2]
+        values = self.series.get((name, labels))
+        if values is None:
+            values = self.series[(name, labels)] = [0] * (len(buckets) + 2)
+        values[bisect.bisect_left(buckets, value)] += 1
+        values[-1] += value
+
+    def record(self, route, method, status, seconds, size, queries, db_seconds):
+        labels = (("route", route), ("method", method))
+        with self._lock:
+            if self.pid != os.getpid():  # forked: the parent's totals are not ours
+                self.series, self.pid = {}, os.getpid()
+            key = ("chats_http_requests_total", labels + (("status", str(status)),))
+            self.series[key] = self.series.get(key, 0) + 1
+            self._observe("chats_http_request_duration_seconds", labels, seconds)
+            if size is not None:
+                self._observe("chats_http_response_size_bytes", labels, size)
+            self._observe("chats_db_queries_per_request", labels, queries)
+            self._observe("chats_db_duration_seconds", labels, db_seconds)
+
+    def snapshot(self):
+        with self._lock:
+            if self.pid != os.getpid():
+                return {}
+            return {key: list(values) if isinstance(values, list) else values
+                    for key, values in self.series.items()}
+
+    def clear(self):
+        with self._lock:
+            self.series = {}
+
+    # -------------------------------------
+    # Worker processes
+    # -------------------------------------
+    def maybe_flush(self):
+        directory = getattr(settings, "CHATS_METRICS_DIR", None)
+        interval = getattr(settings, "CHATS_METRICS_FLUSH_INTERVAL", 5)
+        if directory and time.monotonic() - self.flushed_at >= interval:
+            self.flush(directory)
+
+    def flush(self, directory=None):
+        """Write this process's snapshot (atomically) for the other workers' scrapes."""
+        directory = directory or getattr(settings, "CHATS_METRICS_DIR", None)
+        if not directory:
+            return
+        self.flushed_at = time.monotonic()
+        series = self.snapshot()
+        if not series:
+            return
+        path = os.path.join(directory, f"chats-metrics.{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as snapshot:
+            json.dump([[name, labels, values] for (name, labels), values in series.items()],
+                      snapshot, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+
+    def collect(self):
+        """This process's live totals plus every other process's snapshot."""
+        totals = self.snapshot()
+        directory = getattr(settings, "CHATS_METRICS_DIR", None)
+        if not directory:
+            return totals
+        own = os.path.join(directory, f"chats-metrics.{os.getpid()}.json")
+        for path in glob.glob(os.path.join(directory, "chats-metrics.*.json")):
+            if path == own:
+                continue
+            try:
+                with open(path) as snapshot:
+                    rows = json.load(snapshot)
+            except (OSError, ValueError):  # vanished or half-written
+                continue
+            for name, labels, values in rows:
+                merge(totals, (name, tuple(map(tuple, labels))), values)
+        return totals
+
+
+def merge(totals, key, values):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = values
+    elif isinstance(values, list):
+        totals[key] = [a + b for a, b in zip(current, values)]
+    else:
+        totals[key] = current + values
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+# -------------------------------------
+# Prometheus text format
+# -------------------------------------
+def _label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(series):
+    """Prometheus text exposition (version 0.0.4) of collected series."""
+    lines = []
+    for name, (kind, help_text, buckets) in FAMILIES.items():
+        rows = sorted((labels, values) for (family, labels), values in series.items()
+                      if family == name)
+        if not rows:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, values in rows:
+            if kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {values}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ("+Inf",), values):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_labels(labels)} {_number(values[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
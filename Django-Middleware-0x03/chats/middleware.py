@@ -1,113 +1,157 @@
+"""
+The chats middleware. Each one runs natively under both WSGI and ASGI
+(like Django's ``MiddlewareMixin``): with an async ``get_response`` its
+``__call__`` returns a coroutine, so async views and the SSE stream do not
+hop to a thread and back at every layer.
+"""
 import logging
-from datetime import datetime, time
-import time as time_module   # <--- FIX: rename module to avoid clash
+import random
+from datetime import datetime
+from time import perf_counter
 
-from django.http import HttpResponseForbidden, HttpResponse
-from django.utils.deprecation import MiddlewareMixin
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import metrics, policy, ratelimit, requestlog
 
 
 # Configure logger
 logger = logging.getLogger("requests_logger")
 
 
-class RequestLoggingMiddleware(MiddlewareMixin):
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        user = request.user.username if request.user.is_authenticated else "Anonymous"
-        path = request.get_full_path()
-
-        logger.info(f"{datetime.now()} - User: {user} - Path: {path}")
-
-        return self.get_response(request)
+class HybridMiddleware:
+    """Sync and async capable: subclasses implement ``handle`` and ``__acall__``."""
 
+    sync_capable = True
+    async_capable = True
 
-class RestrictAccessByTimeMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
-
-        # Allowed: 06:00 → 21:00
-        self.start_time = time(6, 0)
-        self.end_time = time(21, 0)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        current_time = datetime.now().time()
-
-        if request.path.startswith("/api/v1/chats/"):
-            if not (self.start_time <= current_time <= self.end_time):
-                return HttpResponseForbidden(
-                    "Access to the messaging system is restricted outside 6 AM - 9 PM."
-                )
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
 
-        return self.get_response(request)
 
+class RequestLoggingMiddleware(HybridMiddleware):
+    """
+    One structured record per sampled request, written off the request
+    path (see chats.requestlog).
+    """
 
-class OffensiveLanguageMiddleware:
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
+        self.logger = logger
+        self.sample_rate = requestlog.sample_rate()
+
+    def handle(self, request):
+        started = perf_counter()
+        response = self.get_response(request)
+        if self.sampled(response):
+            self.log(request, response, started, getattr(request, "user", None))
+        return response
+
+    async def __acall__(self, request):
+        started = perf_counter()
+        response = await self.get_response(request)
+        if self.sampled(response):
+            user = getattr(request, "user", None)
+            if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+                user = await request.auser()  # no view loaded it; don't block the loop
+            self.log(request, response, started, user)
+        return response
+
+    def sampled(self, response):
+        return (
+            self.sample_rate >= 1 or random.random() < self.sample_rate
+            or response.status_code >= 500
+        ) and self.logger.isEnabledFor(logging.INFO)
+
+    def log(self, request, response, started, user):
+        self.logger.info("request", extra={"fields": {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "duration_ms": round((perf_counter() - started) * 1000, 3),
+            "user": user.username if user is not None and user.is_authenticated else None,
+        }})
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Per-route latency, status, response size and database metrics (see
+    chats.metrics). Put it first so the time includes the middleware
+    below it.
+    """
+
+    def handle(self, request):
+        timer = metrics.QueryTimer()
+        token = metrics.current_timer.set(timer)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_timer.reset(token)
+        self.record(request, response, perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = metrics.QueryTimer()
+        token = metrics.current_timer.set(timer)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_timer.reset(token)
+        self.record(request, response, perf_counter() - started, timer)
+        return response
+
+    def record(self, request, response, seconds, timer):
+        match = request.resolver_match
+        metrics.registry.record(
+            match.route.rstrip("$") if match else metrics.UNRESOLVED,
+            request.method if request.method in metrics.METHODS else "other",
+            response.status_code,
+            seconds,
+            None if response.streaming else len(response.content),
+            timer.count,
+            timer.seconds,
+        )
+        metrics.registry.maybe_flush()
+
+
+class AccessPolicyMiddleware(HybridMiddleware):
+    """
+    Opening hours, roles and per-IP rate limits for the chats API, from
+    the rules compiled at startup (see chats.policy). Requests no rule
+    covers go straight through.
+    """
 
-        # Tracks messages per IP:
-        self.message_log = {}
-
-        # Rate limit
-        self.limit = 5       # 5 messages
-        self.window = 60     # in 60 seconds
-
-    def __call__(self, request):
-        if request.method == "POST" and request.path.startswith("/api/v1/chats/"):
-
-            ip = self.get_ip(request)
-            now = time_module.time()  # <--- FIX: use renamed module
-
-            # Initialize tracking for new IP
-            if ip not in self.message_log:
-                self.message_log[ip] = []
-
-            # Keep only timestamps in the last minute
-            self.message_log[ip] = [
-                ts for ts in self.message_log[ip] if now - ts < self.window
-            ]
-
-            # Limit reached?
-            if len(self.message_log[ip]) >= self.limit:
-                return HttpResponse(
-                    "Rate limit exceeded. You can only send 5 messages per minute.",
-                    status=429,
-                )
-
-            # Accept this message
-            self.message_log[ip].append(now)
-
-        return self.get_response(request)
-
-    def get_ip(self, request):
-        x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
-        if x_forwarded_for:
-            return x_forwarded_for.split(",")[0].strip()
-        return request.META.get("REMOTE_ADDR", "unknown")
-
-
-class RolepermissionMiddleware:
     def __init__(self, get_response):
-        self.get_response = get_response
-        # Define allowed roles
-        self.allowed_roles = ["admin", "moderator"]
-
-    def __call__(self, request):
-        # Check the user role only if user is authenticated
-        user = getattr(request, "user", None)
-        if user and user.is_authenticated:
-            role = getattr(user, "role", None)
-
-            # Restrict access if role is not allowed
-            if role not in self.allowed_roles:
-                return HttpResponseForbidden(
-                    "You do not have permission to perform this action."
-                )
-        else:
-            # Anonymous users are forbidden
-            return HttpResponseForbidden("You must be logged in to perform this action.")
-
+        super().__init__(get_response)
+        self.policy = policy.compile_rules()
+        self.limiter = ratelimit.get_store()
+        # Local time in TIME_ZONE: Django sets the process time zone from it.
+        self.now = datetime.now
+
+    def handle(self, request):
+        applicable = self.policy.match(request.method, request.path)
+        if applicable is not None:
+            refused = applicable.check(request, self.limiter, self.now)
+            if refused is not None:
+                return refused
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        applicable = self.policy.match(request.method, request.path)
+        if applicable is not None:
+            if applicable.blocking:
+                refused = await sync_to_async(applicable.check)(request, self.limiter, self.now)
+            else:
+                refused = applicable.check(request, self.limiter, self.now)
+            if refused is not None:
+                return refused
+        return await self.get_response(request)
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_remove_customuser_hashed_password_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('conversation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='chats.conversation')),
+                ('last_message_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_message_id', models.UUIDField(blank=True, null=True)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('last_message_snippet', models.CharField(blank=True, default='', max_length=255)),
+            ],
+        ),
+    ]
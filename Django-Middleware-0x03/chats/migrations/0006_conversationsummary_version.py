@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0005_message_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationsummary',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversationsummary',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0006_conversationsummary_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('message_id', models.UUIDField()),
+                ('kind', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=7)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='message_changes', to='chats.conversation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['conversation', 'seq'], name='chats_change_conv_seq_idx')],
+            },
+        ),
+    ]
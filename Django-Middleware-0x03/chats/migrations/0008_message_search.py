@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# Frozen copy of the index as chats.search first defined it: later
+# migrations change it, so this one must not follow the live code.
+MYSQL_INDEX = "chats_msg_body_ft"
+FTS_TABLE = "chats_message_fts"
+
+SQLITE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "message_body, content='chats_message', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, message_body) VALUES (new.rowid, new.message_body);
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, old.message_body);
+        END""",
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF message_body ON chats_message
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, old.message_body);
+            INSERT INTO {FTS_TABLE}(rowid, message_body) VALUES (new.rowid, new.message_body);
+        END""",
+}
+
+
+def sqlite_fts_supported(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(option == "ENABLE_FTS5" for option, in cursor.fetchall())
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite" and sqlite_fts_supported(connection):
+        schema_editor.execute(SQLITE_TABLE)
+        for sql in SQLITE_TRIGGERS.values():
+            schema_editor.execute(sql)
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif connection.vendor == "mysql":
+        schema_editor.execute(
+            f"ALTER TABLE chats_message ADD FULLTEXT INDEX {MYSQL_INDEX} (message_body)"
+        )
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        for trigger in SQLITE_TRIGGERS:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif connection.vendor == "mysql":
+        schema_editor.execute(f"ALTER TABLE chats_message DROP INDEX {MYSQL_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0007_messagechange'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
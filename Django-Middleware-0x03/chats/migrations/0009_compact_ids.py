@@ -0,0 +1,118 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:08
+
+import chats.ids
+from django.db import migrations
+
+# (model, primary key) pairs moving to CompactUUIDField
+KEYS = [('chats', 'customuser'), ('chats', 'conversation'), ('chats', 'message')]
+# Plain UUID columns holding message ids, compared against chats_message's key
+VALUES = {('chats.conversationsummary', 'last_message_id'), ('chats.messagechange', 'message_id')}
+
+
+def key_columns(apps):
+    """
+    Yield ``(table, [(column, null), ...])`` for the primary keys in KEYS,
+    every foreign key (in any app, M2M tables included) pointing at them
+    and the VALUES columns.
+    """
+    def label(field):
+        return field.model._meta.label_lower, field.name
+
+    targets = {label(apps.get_model(*key)._meta.pk) for key in KEYS}
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.proxy or not model._meta.managed:
+            continue
+        columns = []
+        for field in model._meta.local_fields:
+            if field.primary_key and label(field) in targets:
+                columns.append((field.column, False))
+            elif field.is_relation and field.concrete and label(field.target_field) in targets:
+                columns.append((field.column, field.null))
+            elif label(field) in VALUES:
+                columns.append((field.column, field.null))
+        if columns:
+            yield model._meta.db_table, columns
+
+
+def convert(schema_editor, columns, staging, transform, final_type):
+    quote = schema_editor.quote_name
+    for table, fields in columns:
+        def modify(column_type):
+            return ", ".join(
+                f"MODIFY {quote(column)} {column_type}{'' if null else ' NOT NULL'}"
+                for column, null in fields
+            )
+        schema_editor.execute(f"ALTER TABLE {quote(table)} {modify(staging)}")
+        schema_editor.execute(f"UPDATE {quote(table)} SET " + ", ".join(
+            f"{quote(column)} = {transform % quote(column)}" for column, _ in fields
+        ))
+        schema_editor.execute(f"ALTER TABLE {quote(table)} {modify(final_type)}")
+
+
+def to_binary(apps, schema_editor):
+    """
+    MySQL only: CHAR(32) hex -> BINARY(16), in place.
+
+    Other databases keep their column type (UUIDField's), so nothing
+    changes on disk there. Every column is rewritten with foreign key
+    checks off; run it in a maintenance window on large tables.
+    """
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    try:
+        convert(schema_editor, list(key_columns(apps)), "varbinary(32)", "UNHEX(%s)", "binary(16)")
+    finally:
+        schema_editor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def to_char(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    try:
+        convert(schema_editor, list(key_columns(apps)), "varbinary(32)", "LOWER(HEX(%s))", "char(32)")
+    finally:
+        schema_editor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0008_message_search'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='conversationsummary',
+                    name='last_message_id',
+                    field=chats.ids.CompactUUIDField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='messagechange',
+                    name='message_id',
+                    field=chats.ids.CompactUUIDField(),
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='conversation_id',
+                    field=chats.ids.CompactUUIDField(default=chats.ids.default_id, editable=False, primary_key=True, serialize=False, unique=True),
+                ),
+                migrations.AlterField(
+                    model_name='customuser',
+                    name='user_id',
+                    field=chats.ids.CompactUUIDField(default=chats.ids.default_id, editable=False, primary_key=True, serialize=False, unique=True),
+                ),
+                migrations.AlterField(
+                    model_name='message',
+                    name='message_id',
+                    field=chats.ids.CompactUUIDField(default=chats.ids.default_id, editable=False, primary_key=True, serialize=False, unique=True),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(to_binary, to_char),
+            ],
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:16
+
+import base64
+import zlib
+
+import chats.compression
+from django.db import migrations, router
+
+# Frozen copy of the stored format (chats.compression) at this migration
+MARKER = "\x01z"
+ESCAPE = "\x01p"
+
+# Rows read and rewritten per query by the reverse migration
+BATCH_SIZE = 1000
+
+
+def decode(stored):
+    if stored is None or not stored.startswith("\x01"):
+        return stored
+    if stored.startswith(MARKER):
+        return zlib.decompress(base64.b85decode(stored[len(MARKER):])).decode()
+    if stored.startswith(ESCAPE):
+        return stored[len(ESCAPE):]
+    return stored
+
+
+def inflate_bodies(apps, schema_editor):
+    """
+    Store every compressed body as plain text again, BATCH_SIZE rows at a
+    time in primary key order. The column type never changes, so this is
+    all the reverse migration has to do.
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    for name in ("message", "archivedmessage"):
+        model = apps.get_model("chats", name)
+        if not router.allow_migrate_model(connection.alias, model):
+            continue
+        table, pk = quote(model._meta.db_table), quote(model._meta.pk.column)
+        select = f"SELECT {pk}, message_body FROM {table} WHERE message_body LIKE %s"
+        with connection.cursor() as cursor:
+            last = None
+            while True:
+                after, params = ("", []) if last is None else (f" AND {pk} > %s", [last])
+                cursor.execute(
+                    f"{select}{after} ORDER BY {pk} LIMIT {BATCH_SIZE}", [MARKER + "%", *params]
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                cursor.executemany(
+                    f"UPDATE {table} SET message_body = %s WHERE {pk} = %s",
+                    [(decode(body), key) for key, body in rows],
+                )
+                last = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0010_archivedmessage'),
+    ]
+
+    operations = [
+        # Same column type: only the state changes, nothing is rewritten.
+        # Existing bodies stay uncompressed until rewritten
+        # (manage.py compress_message_bodies --rewrite).
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='archivedmessage',
+                    name='message_body',
+                    field=chats.compression.CompressedTextField(),
+                ),
+                migrations.AlterField(
+                    model_name='message',
+                    name='message_body',
+                    field=chats.compression.CompressedTextField(),
+                ),
+            ],
+        ),
+        migrations.RunPython(migrations.RunPython.noop, inflate_bodies),
+    ]
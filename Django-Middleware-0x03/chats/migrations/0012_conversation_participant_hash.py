@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:19
+
+import hashlib
+import uuid
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def participant_hash(user_ids):
+    """Frozen copy of chats.models.participant_hash."""
+    canonical = ",".join(sorted({uuid.UUID(str(user_id)).hex for user_id in user_ids}))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def backfill_hashes(apps, schema_editor):
+    """Hash every participant set; the oldest conversation of a set holds it."""
+    Conversation = apps.get_model('chats', 'Conversation')
+    ConversationParticipant = apps.get_model('chats', 'ConversationParticipant')
+
+    members = defaultdict(list)
+    for conversation_id, user_id in ConversationParticipant.objects.values_list(
+        'conversation_id', 'user_id'
+    ).iterator():
+        members[conversation_id].append(user_id)
+
+    claimed = set()
+    updates = []
+    for conversation in Conversation.objects.order_by('created_at', 'pk').only('pk').iterator():
+        key = participant_hash(members.get(conversation.pk, []))
+        if key not in claimed:
+            claimed.add(key)
+            conversation.participant_hash = key
+            updates.append(conversation)
+    Conversation.objects.bulk_update(updates, ['participant_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0011_compressed_bodies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='participant_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_hashes, migrations.RunPython.noop),
+    ]
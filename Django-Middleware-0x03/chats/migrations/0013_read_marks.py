@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:22
+
+import chats.ids
+from django.db import migrations, models
+
+
+def mark_history_read(apps, schema_editor):
+    """Existing members start with everything read up to the latest message."""
+    ConversationParticipant = apps.get_model('chats', 'ConversationParticipant')
+    Message = apps.get_model('chats', 'Message')
+    latest = Message.objects.filter(
+        conversation=models.OuterRef('conversation')
+    ).order_by('-sent_at', '-message_id')
+    ConversationParticipant.objects.update(
+        last_read_at=models.Subquery(latest.values('sent_at')[:1]),
+        last_read_message_id=models.Subquery(latest.values('message_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0012_conversation_participant_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_message_id',
+            field=chats.ids.CompactUUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(mark_history_read, migrations.RunPython.noop),
+    ]
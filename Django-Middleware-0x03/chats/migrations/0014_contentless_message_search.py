@@ -0,0 +1,118 @@
+import base64
+import zlib
+
+from django.db import migrations
+
+# SQLite only: the external-content FTS5 table of 0008 indexes the stored
+# column, which holds compressed bodies since 0011. It is replaced by a
+# contentless table fed inflated bodies by its triggers. Frozen copies of
+# both versions of chats.search's DDL and of chats.compression's decoder.
+FTS_TABLE = "chats_message_fts"
+MARKER = "\x01z"
+ESCAPE = "\x01p"
+
+CONTENTLESS_TABLE = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    "message_body, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+CONTENTLESS_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, message_body)
+            VALUES (new.rowid, chats_body_text(new.message_body));
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, chats_body_text(old.message_body));
+        END""",
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF message_body ON chats_message
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, chats_body_text(old.message_body));
+            INSERT INTO {FTS_TABLE}(rowid, message_body)
+            VALUES (new.rowid, chats_body_text(new.message_body));
+        END""",
+}
+
+EXTERNAL_TABLE = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    "message_body, content='chats_message', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+EXTERNAL_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, message_body) VALUES (new.rowid, new.message_body);
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, old.message_body);
+        END""",
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF message_body ON chats_message
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, old.message_body);
+            INSERT INTO {FTS_TABLE}(rowid, message_body) VALUES (new.rowid, new.message_body);
+        END""",
+}
+
+
+def decode(stored):
+    if stored is None or not stored.startswith("\x01"):
+        return stored
+    if stored.startswith(MARKER):
+        return zlib.decompress(base64.b85decode(stored[len(MARKER):])).decode()
+    if stored.startswith(ESCAPE):
+        return stored[len(ESCAPE):]
+    return stored
+
+
+def fts_installed(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def replace_index(schema_editor, table, triggers):
+    for trigger in triggers:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    schema_editor.execute(table)
+    for sql in triggers.values():
+        schema_editor.execute(sql)
+
+
+def to_contentless(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite" or not fts_installed(connection):
+        return
+    connection.ensure_connection()
+    connection.connection.create_function("chats_body_text", 1, decode, deterministic=True)
+    replace_index(schema_editor, CONTENTLESS_TABLE, CONTENTLESS_TRIGGERS)
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, message_body) "
+        "SELECT rowid, chats_body_text(message_body) FROM chats_message"
+    )
+
+
+def to_external_content(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite" or not fts_installed(connection):
+        return
+    replace_index(schema_editor, EXTERNAL_TABLE, EXTERNAL_TRIGGERS)
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0013_read_marks'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_contentless, to_external_content),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0014_contentless_message_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='messagechange',
+            name='kind',
+            field=models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('archived', 'Archived')], max_length=8),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:15
+
+import chats.ids
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0015_messagechange_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagechange',
+            name='recipient',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='messagechange',
+            name='conversation',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='message_changes', to='chats.conversation'),
+        ),
+        migrations.AlterField(
+            model_name='messagechange',
+            name='kind',
+            field=models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted'), ('archived', 'Archived'), ('conversation_deleted', 'Conversation deleted')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='messagechange',
+            name='message_id',
+            field=chats.ids.CompactUUIDField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='messagechange',
+            index=models.Index(fields=['recipient', 'seq'], name='chats_change_recipient_seq_idx'),
+        ),
+    ]
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 """Models for the messaging app."""
-
+import hashlib
 import uuid
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
+
+from .compression import CompressedTextField
+from .ids import CompactUUIDField, default_id
 
 
 class UserRole(models.TextChoices):
@@ -15,9 +20,9 @@ class UserRole(models.TextChoices):
 
 class CustomUser(AbstractUser):
     """Custom user model extending AbstractUser."""
-    user_id = models.UUIDField(
+    user_id = CompactUUIDField(
         primary_key = True,
-        default=uuid.uuid4,
+        default=default_id,
         editable=False,
         unique=True
     )
@@ -37,26 +42,77 @@ class CustomUser(AbstractUser):
     REQUIRED_FIELDS = ['username']
 
 
+def participant_hash(user_ids):
+    """Canonical key of a participant set: SHA-256 of the sorted user ids."""
+    canonical = ",".join(sorted({uuid.UUID(str(user_id)).hex for user_id in user_ids}))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
 class Conversation(models.Model):
     """Model representing a conversation between users."""
-    conversation_id = models.UUIDField(
+    conversation_id = CompactUUIDField(
         primary_key=True,
-        default=uuid.uuid4,
+        default=default_id,
         editable=False,
         unique=True
     )
     participants = models.ManyToManyField(
         CustomUser,
-        related_name='conversations'     
+        related_name='conversations',
+        through='ConversationParticipant'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # participant_hash() of the participants, held by at most one
+    # conversation per participant set (the one find-or-create resolves
+    # to); NULL on the others. Maintained by chats.services.
+    participant_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
+
+
+class ConversationParticipant(models.Model):
+    """
+    Membership row between a conversation and a user.
+
+    Maps onto the table Django originally auto-created for
+    ``Conversation.participants``; declaring it lets us index it.
+    """
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='participant_links'
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        db_column='customuser_id',
+        related_name='conversation_links'
+    )
+    # Read high-water mark: the (sent_at, message_id) position of the last
+    # message the user has read; NULL before the first one. unread_count
+    # counts the messages from others after it. Maintained by chats.receipts.
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    last_read_message_id = CompactUUIDField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'chats_conversation_participants'
+        unique_together = [('conversation', 'user')]
+        indexes = [
+            # "conversations of user X" without touching the conversation-first unique index
+            models.Index(fields=['user', 'conversation'], name='chats_part_user_conv_idx'),
+        ]
 
 
 class Message(models.Model):
     """Model representing a message sent by a user."""
-    message_id = models.UUIDField(
+    message_id = CompactUUIDField(
         primary_key=True,
-        default=uuid.uuid4,
+        default=default_id,
         editable=False,
         unique=True
     )
@@ -70,8 +126,120 @@ class Message(models.Model):
         on_delete=models.CASCADE,
         related_name='sent_messages'
     )
-    message_body = models.TextField(blank=False)
+    message_body = CompressedTextField(blank=False)
     sent_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # conversation timelines and (sent_at, message_id) keyset pages
+            models.Index(
+                fields=['conversation', 'sent_at', 'message_id'],
+                name='chats_msg_conv_sent_idx'
+            ),
+            # MessageFilter: sender_id with start_date/end_date ranges
+            models.Index(fields=['sender', 'sent_at'], name='chats_msg_sender_sent_idx'),
+        ]
+
+
+class ConversationSummary(models.Model):
+    """
+    Denormalized activity of a conversation, kept in step with its messages.
+
+    Maintained by ``chats.services`` on every message write so the inbox
+    can be ordered and badged without aggregating over ``Message``.
+    """
+    conversation = models.OneToOneField(
+        Conversation,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='summary'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_message_id = CompactUUIDField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_snippet = models.CharField(max_length=255, blank=True, default='')
+    # Bumped on every write touching the conversation; feeds HTTP validators
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+
+class MessageChangeKind(models.TextChoices):
+    """What happened to a message."""
+    Created = 'created', 'Created'
+    Updated = 'updated', 'Updated'
+    Deleted = 'deleted', 'Deleted'
+    Archived = 'archived', 'Archived'
+    ConversationDeleted = 'conversation_deleted', 'Conversation deleted'
+
+
+class MessageChange(models.Model):
+    """
+    Append-only log of message writes, ordered by a monotonic ``seq``.
+
+    Sync clients hold the last ``seq`` they have seen; see ``chats.sync``.
+    Rows outlive their conversation: deleting one appends a
+    ``conversation_deleted`` tombstone per participant (``recipient``, no
+    ``message_id``), and the log is only trimmed by pruning.
+    """
+    seq = models.BigAutoField(primary_key=True)
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='message_changes',
+        db_index=False  # covered by the (conversation, seq) index
+    )
+    message_id = CompactUUIDField(null=True, blank=True)
+    recipient = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+        db_index=False  # covered by the (recipient, seq) index
+    )
+    kind = models.CharField(max_length=20, choices=MessageChangeKind.choices)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'seq'], name='chats_change_conv_seq_idx'),
+            models.Index(fields=['recipient', 'seq'], name='chats_change_recipient_seq_idx'),
+        ]
+
+
+class ArchivedMessage(models.Model):
+    """
+    A message moved out of ``Message`` by ``manage.py archive_messages``.
 
+    May live in another database (``CHATS_ARCHIVE_DATABASE``), so the
+    foreign keys carry no constraint and nothing joins across them;
+    see ``chats.archive``.
+    """
+    message_id = CompactUUIDField(primary_key=True, editable=False)
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,  # covered by the (conversation, sent_at, message_id) index
+        related_name='+'
+    )
+    sender = models.ForeignKey(
+        CustomUser,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+'
+    )
+    message_body = CompressedTextField()
+    sent_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['conversation', 'sent_at', 'message_id'],
+                name='chats_arch_conv_sent_idx'
+            ),
+            models.Index(fields=['sender', 'sent_at'], name='chats_arch_sender_sent_idx'),
+        ]
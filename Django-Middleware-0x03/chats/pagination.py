@@ -1,5 +1,26 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def after_position(queryset, position, reverse=False):
+    """Messages strictly after (or before) a (sent_at, message_id) position."""
+    sent_at, message_id = position
+    if reverse:
+        return queryset.filter(
+            Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, message_id__lt=message_id)
+        )
+    return queryset.filter(
+        Q(sent_at__gt=sent_at) | Q(sent_at=sent_at, message_id__gt=message_id)
+    )
+
 
 class MessagePagination(PageNumberPagination):
     page_size = 20
@@ -13,3 +34,125 @@ class MessagePagination(PageNumberPagination):
             "previous": self.get_previous_link(),
             "results": data
         })
+
+
+class ConversationPagination(MessagePagination):
+    """Conversation pages: same page sizes and response shape as message pages."""
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination over (sent_at, message_id).
+
+    Each page is a single range scan starting right after the cursor
+    position, so page N costs the same as page 1 and no COUNT(*) is run.
+    Cursors are opaque to clients: base64 of "<direction>|<sent_at>|<message_id>".
+    """
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        """
+        Return the sliced queryset for the requested page.
+
+        Evaluate it (sync or async) and hand the rows to ``set_page``.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.page_size_requested = self.get_page_size(request)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        self.reverse, self.position = self.decode_cursor(encoded) if encoded else (False, None)
+
+        if self.position is not None:
+            queryset = after_position(queryset, self.position, self.reverse)
+
+        ordering = ("-sent_at", "-message_id") if self.reverse else ("sent_at", "message_id")
+        return queryset.order_by(*ordering)[:page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size_requested
+        rows = rows[:self.page_size_requested]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data
+        })
+
+    # -----------------------
+    # Cursor encoding
+    # -----------------------
+    def encode_cursor(self, reverse, row):
+        sent_at, message_id = self.get_position(row)
+        raw = "%d|%s|%s" % (int(reverse), sent_at.isoformat(), message_id.hex)
+        token = base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, encoded):
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("ascii")
+            reverse, sent_at, message_id = raw.split("|")
+            sent_at = parse_datetime(sent_at)
+            message_id = uuid.UUID(message_id)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if sent_at is None or reverse not in ("0", "1"):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse == "1", (sent_at, message_id)
+
+    @staticmethod
+    def get_position(row):
+        if isinstance(row, dict):
+            return row["sent_at"], row["message_id"]
+        return row.sent_at, row.message_id
+
+
+def get_message_paginator(request):
+    """
+    Pick the paginator for a message list request.
+
+    Clients opt into keyset pagination with ``?pagination=cursor``; any
+    request already carrying a cursor stays on it.
+    """
+    if (request.query_params.get("pagination") == "cursor"
+            or MessageCursorPagination.cursor_query_param in request.query_params):
+        return MessageCursorPagination()
+    return MessagePagination()
@@ -1,5 +1,59 @@
 from rest_framework import permissions
 
+from .auth import METRICS_SCRAPER
+from .models import Conversation, ConversationParticipant
+
+
+# -------------------------------------
+# Membership lookups
+# -------------------------------------
+# Answers are memoized on the underlying HttpRequest, so every check after
+# the first one for a conversation is free for the rest of the request.
+MEMBERSHIP_CACHE_ATTR = "_chats_memberships"
+
+
+def _membership_cache(request):
+    request = getattr(request, "_request", request)  # unwrap DRF's Request
+    cache = getattr(request, MEMBERSHIP_CACHE_ATTR, None)
+    if cache is None:
+        cache = {}
+        setattr(request, MEMBERSHIP_CACHE_ATTR, cache)
+    return cache
+
+
+def remember_memberships(request, conversation_ids, is_participant=True):
+    """Record memberships already established, e.g. by a participant-scoped queryset."""
+    _membership_cache(request).update(dict.fromkeys(conversation_ids, is_participant))
+
+
+def load_memberships(request, conversation_ids):
+    """
+    Resolve membership for many conversations with one indexed query.
+
+    Returns the subset of ``conversation_ids`` the user participates in.
+    """
+    cache = _membership_cache(request)
+    unknown = {cid for cid in conversation_ids if cid not in cache}
+    if unknown:
+        member_of = set(
+            ConversationParticipant.objects.filter(
+                user_id=request.user.pk, conversation_id__in=unknown
+            ).values_list("conversation_id", flat=True)
+        )
+        cache.update((cid, cid in member_of) for cid in unknown)
+    return {cid for cid in conversation_ids if cache[cid]}
+
+
+def is_participant(request, conversation_id):
+    """Single EXISTS probe on the (conversation, user) unique index, memoized."""
+    cache = _membership_cache(request)
+    if conversation_id not in cache:
+        cache[conversation_id] = ConversationParticipant.objects.filter(
+            conversation_id=conversation_id, user_id=request.user.pk
+        ).exists()
+    return cache[conversation_id]
+
+
 class IsParticipantOfConversation(permissions.BasePermission):
     """
     Only authenticated users can access the API.
@@ -11,24 +65,22 @@ class IsParticipantOfConversation(permissions.BasePermission):
         return request.user and request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
-        user = request.user
-
         # For conversations
-        if hasattr(obj, "participants"):
-            is_participant = user in obj.participants.all()
+        if isinstance(obj, Conversation):
+            participant = is_participant(request, obj.pk)
         # For messages
-        elif hasattr(obj, "conversation"):
-            is_participant = user in obj.conversation.participants.all()
+        elif hasattr(obj, "conversation_id"):
+            participant = is_participant(request, obj.conversation_id)
         else:
-            is_participant = False
+            participant = False
 
         # Allow read-only for participants
         if request.method in permissions.SAFE_METHODS:
-            return is_participant
+            return participant
 
         # Allow write methods (POST, PUT, PATCH, DELETE) only for participants
         if request.method in ["POST", "PUT", "PATCH", "DELETE"]:
-            return is_participant
+            return participant
 
         # Deny everything else
         return False
@@ -36,3 +88,12 @@ class IsParticipantOfConversation(permissions.BasePermission):
     @staticmethod
     def filter_queryset_for_user(queryset, user):
         return queryset.filter(participants=user)
+
+
+class CanReadMetrics(permissions.BasePermission):
+    """Staff users, and scrapers holding CHATS_METRICS_TOKEN (see chats.auth)."""
+
+    def has_permission(self, request, view):
+        if request.auth is METRICS_SCRAPER:
+            return True
+        return bool(request.user and request.user.is_staff)
@@ -0,0 +1,208 @@
+"""
+Access policy for chats.middleware.AccessPolicyMiddleware: opening hours,
+roles and rate limits, declared as rules and compiled once at startup.
+
+A rule has a ``path`` prefix, optional ``methods`` (any when omitted) and
+any of:
+
+    "hours"   ["HH:MM", "HH:MM"]: only allowed between the two local
+              times, inclusive (a window may wrap past midnight)
+    "roles"   the user must be authenticated (session, basic auth or JWT
+              bearer token) with one of these roles
+    "limit"   requests per "window" seconds (default 60) per client IP,
+              counted by the CHATS_RATE_LIMIT_STORE store
+
+Each of the three is decided by the most specific rule that sets it:
+the longest matching prefix, then the first declared. Setting it to None
+lifts it, e.g. ``{"path": "/api/v1/chats/auth/", "roles": None}``.
+
+``compile_rules`` merges the rules into a dispatch table of one merged
+``Policy`` per (prefix, method), indexed by prefix length. A request
+costs one ``startswith`` when no rule's prefix matches it (the admin,
+static files) and a few dict lookups otherwise; all of its checks then
+run in one pass, cheapest first, so rate-limit quota is only spent by
+requests the other checks let through.
+
+Settings:
+    CHATS_ACCESS_POLICY   list of rules (default: chats hours and roles)
+    CHATS_RATE_LIMITS     more rules, for rate limits (default: 5 POSTs
+                          per minute under /api/v1/chats/)
+"""
+from datetime import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+DEFAULT_POLICY = [
+    {"path": "/api/v1/chats/", "hours": ["06:00", "21:00"], "roles": ["admin", "moderator"]},
+    {"path": "/api/v1/chats/auth/", "roles": None},
+    {"path": "/api/v1/chats/status/", "hours": None, "roles": None},
+    # Access is the view's: staff users and CHATS_METRICS_TOKEN bearers
+    {"path": "/api/v1/chats/metrics/", "hours": None, "roles": None},
+]
+DEFAULT_RATE_LIMITS = [
+    {"path": "/api/v1/chats/", "methods": ["POST"], "limit": 5, "window": 60},
+]
+METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+CHECKS = ("hours", "roles", "limit")
+
+
+class Rule:
+    """One declared rule; ``checks`` holds only the checks it sets."""
+
+    __slots__ = ("index", "path", "methods", "checks", "window")
+
+    def __init__(self, index, path="/", methods=None, window=60, **checks):
+        unknown = set(checks) - set(CHECKS)
+        if unknown:
+            raise ValueError(f"Unknown access rule keys for {path!r}: {sorted(unknown)}")
+        self.index = index
+        self.path = path
+        self.methods = frozenset(method.upper() for method in methods) if methods else None
+        self.checks = checks
+        self.window = window
+
+    def applies(self, prefix, method):
+        return prefix.startswith(self.path) and (
+            self.methods is None or method in self.methods
+        )
+
+
+class Policy:
+    """The merged checks of one (prefix, method)."""
+
+    __slots__ = ("hours", "roles", "rate_key", "limit", "window")
+
+    def __init__(self, hours=None, roles=None, rate_rule=None):
+        self.hours = tuple(time.fromisoformat(bound) for bound in hours) if hours else None
+        self.roles = frozenset(roles) if roles else None
+        self.limit = rate_rule.checks["limit"] if rate_rule else None
+        self.rate_key = rate_rule.index if rate_rule else None
+        self.window = rate_rule.window if rate_rule else None
+
+    def __bool__(self):
+        return bool(self.hours or self.roles or self.limit is not None)
+
+    @property
+    def blocking(self):
+        """Whether ``check`` may do I/O: load the user or hit the rate-limit store."""
+        return bool(self.roles) or self.limit is not None
+
+    def check(self, request, limiter, now):
+        """None when the request may go on, else the response refusing it."""
+        if self.hours:
+            start, end = self.hours
+            if not within(start, end, now().time()):
+                return HttpResponseForbidden(
+                    "Access to the messaging system is restricted outside "
+                    f"{start:%H:%M} - {end:%H:%M}."
+                )
+        if self.roles:
+            user = request_user(request)
+            if user is None:
+                return HttpResponseForbidden("You must be logged in to perform this action.")
+            if getattr(user, "role", None) not in self.roles:
+                return HttpResponseForbidden("You do not have permission to perform this action.")
+        if self.limit is not None:
+            retry_after = limiter.hit(
+                f"{self.rate_key}:{client_ip(request)}", self.limit, self.window
+            )
+            if retry_after is not None:
+                response = HttpResponse(
+                    f"Rate limit exceeded. You can only send {self.limit} requests "
+                    f"per {self.window} seconds.",
+                    status=429,
+                )
+                response["Retry-After"] = str(retry_after)
+                return response
+        return None
+
+
+class CompiledPolicy:
+    """Dispatch table: ``tables`` is [(prefix length, {prefix: {method: Policy}})]."""
+
+    def __init__(self, rules):
+        self.scope = tuple({rule.path for rule in rules})
+        by_length = {}
+        for prefix in self.scope:
+            # Rules that match a path whose longest matching prefix is
+            # ``prefix`` are exactly the rules whose path ``prefix`` starts with.
+            candidates = sorted(
+                (rule for rule in rules if prefix.startswith(rule.path)),
+                key=lambda rule: (-len(rule.path), rule.index),
+            )
+            by_method = {
+                method: merge(rule for rule in candidates if rule.applies(prefix, method))
+                for method in METHODS
+            }
+            by_method["*"] = merge(rule for rule in candidates if rule.methods is None)
+            by_length.setdefault(len(prefix), {})[prefix] = by_method
+        self.tables = sorted(by_length.items(), reverse=True)
+
+    def match(self, method, path):
+        """The request's Policy, or None when nothing applies to it."""
+        if not path.startswith(self.scope):
+            return None
+        for length, table in self.tables:
+            by_method = table.get(path[:length])
+            if by_method is not None:
+                return by_method.get(method, by_method["*"])
+        return None
+
+
+def within(start, end, current):
+    if start <= end:
+        return start <= current <= end
+    return current >= start or current <= end  # wraps past midnight
+
+
+def merge(rules):
+    """Policy from rules ordered most specific first, or None if it checks nothing."""
+    decided = {}
+    for rule in rules:
+        for name, value in rule.checks.items():
+            decided.setdefault(name, (value, rule))
+    rate = decided.get("limit")
+    policy = Policy(
+        hours=decided.get("hours", (None,))[0],
+        roles=decided.get("roles", (None,))[0],
+        rate_rule=rate[1] if rate and rate[0] is not None else None,
+    )
+    return policy or None
+
+
+def get_rules():
+    declared = list(getattr(settings, "CHATS_ACCESS_POLICY", DEFAULT_POLICY)) + [
+        {"path": rule["path"], "methods": rule.get("methods"), "limit": rule.get("limit"),
+         "window": rule.get("window", 60)}
+        for rule in getattr(settings, "CHATS_RATE_LIMITS", DEFAULT_RATE_LIMITS)
+    ]
+    return [Rule(index, **rule) for index, rule in enumerate(declared)]
+
+
+def compile_rules(rules=None):
+    return CompiledPolicy(get_rules() if rules is None else rules)
+
+
+# -------------------------------------
+# Request details
+# -------------------------------------
+def request_user(request):
+    """The session/basic-auth user, else the JWT bearer token's; None if anonymous."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def client_ip(request):
+    x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+    if x_forwarded_for:
+        return x_forwarded_for.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR", "unknown")
@@ -0,0 +1,77 @@
+"""
+In-process pub/sub hub fanning new messages out to SSE subscribers.
+
+Each subscriber is an ``asyncio.Queue`` owned by the event loop serving its
+stream, so an idle client costs one queue and no thread. Publishers are
+ordinary sync code (the DRF views run in worker threads under ASGI): they
+hand events to each subscriber's loop with ``call_soon_threadsafe``.
+
+The hub is per process. With several ASGI workers a client only sees
+messages written through the worker it is connected to; put a broker in
+front of ``hub.publish`` if that matters.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    __slots__ = ("user_id", "loop", "queue", "overflowed")
+
+    def __init__(self, user_id, loop, max_queue):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(max_queue)
+        self.overflowed = False
+
+    def offer(self, event):
+        """Runs on the subscriber's loop. Slow consumers lose events, not memory."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class MessageHub:
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        """Must be called from the event loop that will consume the queue."""
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def has_subscribers(self, user_ids):
+        with self._lock:
+            return any(user_id in self._subscribers for user_id in user_ids)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_ids, event):
+        """Deliver ``event`` to every subscription of ``user_ids``; thread-safe."""
+        with self._lock:
+            targets = [s for user_id in set(user_ids) for s in self._subscribers.get(user_id, ())]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:  # loop already closed; its stream is going away
+                pass
+        return len(targets)
+
+
+hub = MessageHub()
@@ -0,0 +1,292 @@
+"""
+Rate-limit counters for the access policy's "limit" rules (chats.policy).
+
+Every store approximates a sliding window with two fixed windows: the
+count of the current window plus the previous window's count weighted by
+how much of it the sliding window still covers. A check is O(1) and a key
+costs a few fixed-size counters whatever the limit. Rejected requests are
+not counted.
+
+Stores (``CHATS_RATE_LIMIT_STORE``):
+
+    "memory"  ``SlidingWindowLimiter``: per process, so N workers allow N
+              times the limit. Keys live in an LRU ordered dict capped at
+              CHATS_RATE_LIMIT_MAX_KEYS (about 25 MB for 100000 IPv4 keys).
+    "cache"   ``CacheStore``: per-window counters in a Django cache, bumped
+              with ``incr``. Shared and atomic on Redis or Memcached; the
+              local-memory cache is per process, and the database and file
+              caches implement ``incr`` as read-then-write, so they can
+              over-admit under concurrency.
+    "mmap"    ``MmapStore``: a fixed table of CHATS_RATE_LIMIT_MAX_KEYS
+              24-byte slots in a memory-mapped file (POSIX only), each
+              updated under a byte-range lock. Shared by the processes of
+              one host. A key whose slot is taken by another key evicts it.
+    "sqlite"  ``SQLiteStore``: one row per key in a SQLite file, updated in
+              a BEGIN IMMEDIATE transaction; expired rows are pruned as it
+              goes. Shared by the processes of one host.
+
+Settings:
+    CHATS_RATE_LIMIT_STORE      see above (default: "memory")
+    CHATS_RATE_LIMIT_MAX_KEYS   memory LRU cap / mmap slot count
+                                (default: 100000)
+    CHATS_RATE_LIMIT_CACHE      cache alias of the "cache" store
+                                (default: "default")
+    CHATS_RATE_LIMIT_PATH       file of the "mmap" and "sqlite" stores
+                                (default: chats-ratelimit.<store> in the
+                                temporary directory)
+"""
+import hashlib
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_MAX_KEYS = 100_000
+
+
+def roll(stored_window, previous, current, index):
+    """(previous, current) at window ``index`` of a counter last used at ``stored_window``."""
+    if stored_window == index:
+        return previous, current
+    return (current if stored_window == index - 1 else 0), 0
+
+
+def over_limit(previous, current, offset, limit, window):
+    """Seconds to wait (for Retry-After) if one more request is over the limit, else None."""
+    if previous * (1 - offset / window) + current >= limit:
+        return max(1, math.ceil(window - offset))
+    return None
+
+
+def digest(key, size=8):
+    """Stable across processes, unlike hash()."""
+    return hashlib.blake2b(str(key).encode(), digest_size=size).digest()
+
+
+# -------------------------------------
+# Process memory
+# -------------------------------------
+class Counter:
+    """Requests seen in the current fixed window and the one before it."""
+
+    __slots__ = ("window", "previous", "current")
+
+    def __init__(self, window):
+        self.window = window
+        self.previous = 0
+        self.current = 0
+
+
+class SlidingWindowLimiter:
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, clock=time.time):
+        self.max_keys = max_keys
+        self.clock = clock
+        self.counters = OrderedDict()
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        """
+        Count a request for ``key``. Returns None when it is allowed, or the
+        number of seconds to wait when it is over the limit.
+        """
+        now = self.clock()
+        index, offset = int(now // window), now % window
+        with self._lock:
+            counter = self.counters.get(key)
+            if counter is None:
+                counter = self.counters[key] = Counter(index)
+                if len(self.counters) > self.max_keys:
+                    self.counters.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self.counters.move_to_end(key)
+                counter.previous, counter.current = roll(
+                    counter.window, counter.previous, counter.current, index
+                )
+                counter.window = index
+
+            retry_after = over_limit(counter.previous, counter.current, offset, limit, window)
+            if retry_after is None:
+                counter.current += 1
+            return retry_after
+
+    def __len__(self):
+        return len(self.counters)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+
+
+# -------------------------------------
+# Django cache
+# -------------------------------------
+class CacheStore:
+    """Two cache entries per key: this window's count and the last one's."""
+
+    def __init__(self, alias="default", prefix="chats:ratelimit", clock=time.time):
+        self.alias = alias
+        self.prefix = prefix
+        self.clock = clock
+
+    def hit(self, key, limit, window):
+        cache = caches[self.alias]
+        now = self.clock()
+        index, offset = int(now // window), now % window
+        base = f"{self.prefix}:{window}:{digest(key).hex()}"
+        current_key = f"{base}:{index}"
+
+        cache.add(current_key, 0, timeout=2 * window + 1)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:  # evicted between add() and incr()
+            cache.set(current_key, 1, timeout=2 * window + 1)
+            current = 1
+        previous = cache.get(f"{base}:{index - 1}", 0)
+
+        # ``current`` already includes this request
+        retry_after = over_limit(previous, current - 1, offset, limit, window)
+        if retry_after is not None:
+            try:
+                cache.decr(current_key)
+            except ValueError:  # evicted since: nothing left to roll back
+                pass
+        return retry_after
+
+
+# -------------------------------------
+# Shared memory (mmap)
+# -------------------------------------
+class MmapStore:
+    """
+    Direct-mapped table in a shared file: slot = hash(key) % slots, each
+    ``<key hash, window, previous, current>``. A POSIX record lock on the
+    slot's bytes serializes processes; a thread lock serializes this
+    process's threads (record locks are per process).
+    """
+    SLOT = struct.Struct("<8sqII")
+
+    def __init__(self, path, slots=DEFAULT_MAX_KEYS, clock=time.time):
+        self.path = path
+        self.slots = slots
+        self.clock = clock
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # Opened per process: a mapping inherited through fork would be
+        # shared too, but the lock's file descriptor must not be.
+        if self._pid != os.getpid():
+            size = self.slots * self.SLOT.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd, self._map, self._pid = fd, mmap.mmap(fd, size), os.getpid()
+        return self._fd, self._map
+
+    def hit(self, key, limit, window):
+        import fcntl
+
+        now = self.clock()
+        index, offset = int(now // window), now % window
+        tag = digest(key)
+        position = int.from_bytes(tag, "little") % self.slots * self.SLOT.size
+        with self._lock:
+            fd, segment = self._open()
+            fcntl.lockf(fd, fcntl.LOCK_EX, self.SLOT.size, position, os.SEEK_SET)
+            try:
+                stored_tag, stored_window, previous, current = self.SLOT.unpack_from(
+                    segment, position
+                )
+                if stored_tag == tag:
+                    previous, current = roll(stored_window, previous, current, index)
+                else:  # empty, or another key's: take it over
+                    previous = current = 0
+                retry_after = over_limit(previous, current, offset, limit, window)
+                if retry_after is None:
+                    current += 1
+                self.SLOT.pack_into(segment, position, tag, index, previous, current)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, self.SLOT.size, position, os.SEEK_SET)
+        return retry_after
+
+
+# -------------------------------------
+# SQLite file
+# -------------------------------------
+class SQLiteStore:
+    """One row per key; rows past their two windows are pruned every ``prune_every`` hits."""
+    prune_every = 1000
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        self._hits = 0
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or forks
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit (key BLOB PRIMARY KEY, "
+                "window INTEGER NOT NULL, previous INTEGER NOT NULL, "
+                "current INTEGER NOT NULL, expires REAL NOT NULL) WITHOUT ROWID"
+            )
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def hit(self, key, limit, window):
+        now = self.clock()
+        index, offset = int(now // window), now % window
+        tag = digest(key, 16)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT window, previous, current FROM rate_limit WHERE key = ?", (tag,)
+            ).fetchone()
+            previous, current = roll(*row, index) if row else (0, 0)
+            retry_after = over_limit(previous, current, offset, limit, window)
+            if retry_after is None:
+                current += 1
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_limit VALUES (?, ?, ?, ?, ?)",
+                (tag, index, previous, current, (index + 2) * window),
+            )
+            self._hits += 1
+            if self._hits % self.prune_every == 0:
+                connection.execute("DELETE FROM rate_limit WHERE expires < ?", (now,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+def get_store():
+    name = getattr(settings, "CHATS_RATE_LIMIT_STORE", "memory")
+    max_keys = getattr(settings, "CHATS_RATE_LIMIT_MAX_KEYS", DEFAULT_MAX_KEYS)
+    path = getattr(settings, "CHATS_RATE_LIMIT_PATH", None) or os.path.join(
+        tempfile.gettempdir(), f"chats-ratelimit.{name}"
+    )
+    if name == "cache":
+        return CacheStore(getattr(settings, "CHATS_RATE_LIMIT_CACHE", "default"))
+    if name == "mmap":
+        return MmapStore(path, slots=max_keys)
+    if name == "sqlite":
+        return SQLiteStore(path)
+    return SlidingWindowLimiter(max_keys=max_keys)
@@ -0,0 +1,178 @@
+"""
+Read receipts: per-(user, conversation) read marks and unread counters.
+
+Every ConversationParticipant row holds the position (sent_at, message_id)
+of the last message its user has read and ``unread_count``, the number of
+messages from the other participants after it. ``chats.services`` keeps
+both in step in the transaction that writes the message, so showing a
+badge or marking a conversation read touches one row and never counts
+messages. Sending a message marks everything up to it read for the sender.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import archive
+from .fastpath import datetime_formatter
+from .models import ConversationParticipant, Message
+
+
+def before(sent_at, message_id):
+    """Participant rows whose read mark is before the message at this position."""
+    return (
+        Q(last_read_at__isnull=True)
+        | Q(last_read_at__lt=sent_at)
+        | Q(last_read_at=sent_at, last_read_message_id__lt=message_id)
+    )
+
+
+def with_read_state(queryset, user):
+    """
+    Narrow a Conversation queryset to the user's conversations, annotated
+    with the user's ``unread_count`` and ``last_read_at`` (no extra join:
+    the membership join is reused).
+    """
+    return queryset.filter(participant_links__user=user).annotate(
+        unread_count=F("participant_links__unread_count"),
+        last_read_at=F("participant_links__last_read_at"),
+    )
+
+
+# -------------------------------------
+# Maintenance (inside the write's transaction)
+# -------------------------------------
+def messages_created(messages):
+    """
+    Count new messages as unread for everyone but their senders: one
+    UPDATE per conversation, plus one per sender moving its read mark.
+    """
+    by_conversation = defaultdict(list)
+    for message in messages:
+        by_conversation[message.conversation_id].append(message)
+
+    for conversation_id, batch in by_conversation.items():
+        batch.sort(key=lambda message: (message.sent_at, message.message_id))
+        last_sent = {message.sender_id: index for index, message in enumerate(batch)}
+        links = ConversationParticipant.objects.filter(conversation_id=conversation_id)
+        links.exclude(user_id__in=list(last_sent)).update(
+            unread_count=F("unread_count") + len(batch)
+        )
+        for sender_id, index in last_sent.items():
+            links.filter(user_id=sender_id).update(
+                last_read_at=batch[index].sent_at,
+                last_read_message_id=batch[index].message_id,
+                unread_count=sum(1 for later in batch[index + 1:] if later.sender_id != sender_id),
+            )
+
+
+def message_deleted(message):
+    """Uncount the message for the participants who had not read it yet."""
+    ConversationParticipant.objects.filter(
+        before(message.sent_at, message.message_id), conversation_id=message.conversation_id,
+    ).exclude(user_id=message.sender_id).update(
+        unread_count=Greatest(F("unread_count") - 1, Value(0))
+    )
+
+
+def members_joined(conversation_id, user_ids):
+    """New members start with the existing history read."""
+    latest = Message.objects.filter(conversation_id=conversation_id).order_by(
+        "-sent_at", "-message_id"
+    )
+    ConversationParticipant.objects.filter(
+        conversation_id=conversation_id, user_id__in=user_ids
+    ).update(
+        last_read_at=Subquery(latest.values("sent_at")[:1]),
+        last_read_message_id=Subquery(latest.values("message_id")[:1]),
+        unread_count=0,
+    )
+
+
+def mark_read(conversation_id, user):
+    """
+    Move the user's mark to the conversation's latest message: a single
+    UPDATE of one row (the latest message is an index probe). Returns
+    False when the user is not a participant.
+    """
+    latest = Message.objects.filter(conversation_id=conversation_id).order_by(
+        "-sent_at", "-message_id"
+    )
+    return bool(ConversationParticipant.objects.filter(
+        conversation_id=conversation_id, user=user
+    ).update(
+        last_read_at=Subquery(latest.values("sent_at")[:1]),
+        last_read_message_id=Subquery(latest.values("message_id")[:1]),
+        unread_count=0,
+    ))
+
+
+def recount(conversation_ids):
+    """
+    Recompute unread counters from the messages (maintenance only). With
+    archiving enabled, archived messages are added with one count per
+    participant of a conversation that has any.
+    """
+    links = ConversationParticipant.objects.filter(conversation_id__in=conversation_ids)
+    from_others = Message.objects.filter(
+        conversation_id=OuterRef("conversation_id")
+    ).exclude(sender_id=OuterRef("user_id"))
+
+    def count(messages):
+        counts = messages.order_by().values("conversation").annotate(total=Count("*"))
+        return Coalesce(Subquery(counts.values("total"), output_field=IntegerField()), 0)
+
+    links.filter(last_read_at__isnull=True).update(unread_count=count(from_others))
+    links.filter(last_read_at__isnull=False).update(unread_count=count(from_others.filter(
+        Q(sent_at__gt=OuterRef("last_read_at"))
+        | Q(sent_at=OuterRef("last_read_at"), message_id__gt=OuterRef("last_read_message_id"))
+    )))
+
+    if archive.enabled():
+        archived = archive.counts(conversation_ids)
+        for link in links.filter(conversation_id__in=list(archived)).values(
+            "pk", "conversation_id", "user_id", "last_read_at", "last_read_message_id"
+        ):
+            count = archive.unread(
+                link["conversation_id"], link["user_id"],
+                link["last_read_at"], link["last_read_message_id"],
+            )
+            if count:
+                links.filter(pk=link["pk"]).update(unread_count=F("unread_count") + count)
+
+
+# -------------------------------------
+# Reading
+# -------------------------------------
+def read_state(conversation_id, user):
+    """
+    The user's unread count and mark, and every participant's mark, from
+    the conversation's membership rows (one query). None when the user is
+    not a participant.
+    """
+    rows = list(ConversationParticipant.objects.filter(conversation_id=conversation_id).values(
+        "user_id", "last_read_at", "last_read_message_id", "unread_count"
+    ))
+    own = next((row for row in rows if row["user_id"] == user.pk), None)
+    if own is None:
+        return None
+
+    format_datetime = datetime_formatter()
+
+    def mark(row):
+        return {
+            "last_read_message_id": (
+                str(row["last_read_message_id"]) if row["last_read_message_id"] else None
+            ),
+            "last_read_at": format_datetime(row["last_read_at"]),
+        }
+
+    return {
+        "conversation_id": str(conversation_id),
+        "unread_count": own["unread_count"],
+        **mark(own),
+        "receipts": [
+            {"user_id": str(row["user_id"]), **mark(row)}
+            for row in sorted(rows, key=lambda row: row["user_id"])
+        ],
+    }
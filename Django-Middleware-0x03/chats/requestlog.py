@@ -0,0 +1,217 @@
+"""
+Request log for chats.middleware.RequestLoggingMiddleware: JSON lines
+written off the request path.
+
+The middleware hands one record per sampled request to the
+``requests_logger`` logger. ``QueuedRotatingFileHandler`` only puts the
+record on a bounded queue. A writer thread drains the queue, formats the
+records with ``JSONFormatter`` and writes each batch with one write and
+one flush, rotating the file by size and age. When the queue is full
+(the disk cannot keep up) records are dropped and counted in
+``dropped``, so requests never wait on the log.
+
+Settings:
+    CHATS_REQUEST_LOG_SAMPLE_RATE   share of requests logged, 0 to 1;
+                                    server errors are always logged
+                                    (default: 1.0)
+
+The handler itself is configured in LOGGING (see settings.py).
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+_STOP = object()
+_encode = json.JSONEncoder(default=str, separators=(",", ":")).encode
+
+
+def sample_rate():
+    return float(getattr(settings, "CHATS_REQUEST_LOG_SAMPLE_RATE", 1.0))
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line: time (UTC, ISO 8601), level, message, and
+    the ``fields`` dict passed as ``extra={"fields": {...}}``.
+    """
+
+    def formatTime(self, record, datefmt=None):
+        return datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+            timespec="milliseconds"
+        )
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return _encode(entry)
+
+
+class RotatingFile:
+    """
+    Append-only file rolled over to ``<name>.1`` .. ``<name>.<backup_count>``
+    once it would grow past ``max_bytes`` or has been open ``interval``
+    seconds (0 disables either). Used by one writer thread only.
+    """
+
+    def __init__(self, filename, max_bytes=0, interval=0, backup_count=0, encoding="utf-8"):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.encoding = encoding
+        self.stream = None
+
+    def _open(self):
+        self.stream = open(self.filename, "a", encoding=self.encoding)
+        self.opened_at = time.time()
+
+    def write(self, text):
+        if self.stream is None:
+            self._open()
+        if self.should_rotate(len(text.encode(self.encoding))):
+            self.rotate()
+        self.stream.write(text)
+        self.stream.flush()
+
+    def should_rotate(self, size):
+        position = self.stream.tell()
+        if self.max_bytes and position and position + size > self.max_bytes:
+            return True
+        return bool(self.interval and position and time.time() - self.opened_at >= self.interval)
+
+    def rotate(self):
+        self.stream.close()
+        if self.backup_count:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.filename}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.filename}.{index + 1}")
+            os.replace(self.filename, f"{self.filename}.1")
+        else:
+            os.remove(self.filename)
+        self._open()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class QueuedRotatingFileHandler(logging.handlers.QueueHandler):
+    """
+    ``emit`` is a ``put`` on an unlocked ``SimpleQueue``. A daemon thread
+    wakes every ``flush_interval`` seconds (sooner when ``batch_size``
+    records are waiting), formats what is queued and writes it at once,
+    so a busy server pays for one thread switch and one write per batch
+    rather than per request. The thread and queue are started on the
+    first record of each process, so workers forked after logging is
+    configured get their own; ``{pid}`` in ``filename`` gives each process
+    its own file (rotation is per process).
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, interval=24 * 3600,
+                 backup_count=7, queue_size=10000, batch_size=500, flush_interval=0.2,
+                 encoding="utf-8"):
+        super().__init__(None)
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.encoding = encoding
+        self.dropped = 0
+        self._pid = None
+        self._thread = None
+
+    def _start(self):
+        self.queue = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._file = RotatingFile(
+            self.filename.replace("{pid}", str(os.getpid())),
+            self.max_bytes, self.interval, self.backup_count, self.encoding,
+        )
+        self._thread = threading.Thread(
+            target=self._write_batches, name="chats-request-log", daemon=True
+        )
+        self._pid = os.getpid()
+        self._thread.start()
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread, not here.
+        return record
+
+    def enqueue(self, record):
+        # Called under the handler lock (Handler.handle).
+        if self._pid != os.getpid():
+            self._start()
+        size = self.queue.qsize()
+        if size >= self.queue_size:
+            self.dropped += 1
+            return
+        self.queue.put(record)
+        if size + 1 == self.batch_size:
+            self._wake.set()
+
+    def _write_batches(self):
+        records = self.queue
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stop = False
+            while not records.empty() and not stop:
+                lines, waiting = [], []
+                while len(lines) < self.batch_size:
+                    try:
+                        record = records.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is _STOP:
+                        stop = True
+                    elif isinstance(record, threading.Event):
+                        waiting.append(record)  # flush()
+                    else:
+                        try:
+                            lines.append(self.format(record) + "\n")
+                        except Exception:
+                            self.handleError(record)
+                try:
+                    if lines:
+                        self._file.write("".join(lines))
+                except Exception:
+                    self.handleError(record)
+                for event in waiting:
+                    event.set()
+            if stop:
+                self._file.close()
+                return
+
+    def flush(self):
+        """Block until every record queued so far is written."""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            written = threading.Event()
+            self.queue.put(written)
+            self._wake.set()
+            written.wait()
+
+    def close(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._wake.set()
+            self._thread.join(timeout=5)
+        self._pid = None
+        super().close()
@@ -0,0 +1,330 @@
+"""
+Full-text search over message bodies (``?q=`` on the message list).
+
+Backends, picked by the ``CHATS_SEARCH_BACKEND`` setting:
+
+    "sqlite"  Contentless FTS5 table ``chats_message_fts`` keyed on
+              chats_message's rowid, fed inflated bodies by triggers
+              (migrations 0008 and 0014); ranked by bm25().
+    "mysql"   InnoDB FULLTEXT index on message_body; ranked by
+              MATCH ... AGAINST relevance. Terms shorter than
+              innodb_ft_min_token_size (3) and stopwords are ignored.
+    "memory"  Pure-Python inverted index per process, built on first use
+              and caught up from the MessageChange log before each search,
+              so it only sees writes made through ``chats.services``.
+              Meant for tests and databases without a native index;
+              never picked unless named.
+    "auto"    (default) the native index of the database. Raises
+              ImproperlyConfigured when there is none (another vendor, or
+              SQLite without FTS5): name a backend explicitly.
+
+The setting is checked at startup (system check ``check_backend``), so a
+backend the database cannot serve fails ``runserver``/``migrate`` rather
+than the first ``?q=`` request.
+
+Every backend takes an already participant-scoped queryset and returns it
+narrowed to matching messages (all terms must match) and annotated with a
+``search_rank``, higher is better.
+"""
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models import BooleanField, Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+
+from . import compression, sync
+from .models import Message, MessageChange, MessageChangeKind
+
+BACKENDS = ("auto", "sqlite", "mysql", "memory")
+
+TOKEN_RE = re.compile(r"\w+")
+
+FTS_TABLE = "chats_message_fts"
+
+# Keep these in step with chats_message; ensure_sqlite_fts() reinstalls
+# them when a migration rebuilds the table (which drops its triggers).
+# chats_body_text() inflates compressed bodies (see chats.compression).
+SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, message_body)
+            VALUES (new.rowid, chats_body_text(new.message_body));
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON chats_message BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, chats_body_text(old.message_body));
+        END""",
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF message_body ON chats_message
+        BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, message_body)
+            VALUES ('delete', old.rowid, chats_body_text(old.message_body));
+            INSERT INTO {FTS_TABLE}(rowid, message_body)
+            VALUES (new.rowid, chats_body_text(new.message_body));
+        END""",
+}
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+# -------------------------------------
+# SQLite FTS5
+# -------------------------------------
+def sqlite_fts_supported(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(option == "ENABLE_FTS5" for option, in cursor.fetchall())
+
+
+def sqlite_fts_installed(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def install_sqlite_fts(connection):
+    """
+    Create the FTS table and its triggers, and index existing messages.
+
+    The table is contentless: it keeps no copy of the bodies, and deleting
+    from it takes the indexed text, which the triggers inflate again.
+    """
+    connection.ensure_connection()
+    compression.register_sqlite_functions(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "message_body, content='', tokenize='unicode61 remove_diacritics 2')"
+        )
+    ensure_sqlite_fts(connection, rebuild=True)
+
+
+def uninstall_sqlite_fts(connection):
+    with connection.cursor() as cursor:
+        for trigger in SQLITE_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def ensure_sqlite_fts(connection, rebuild=False):
+    """
+    Reinstall missing triggers; rebuild the index if any were missing.
+
+    SQLite migrations that alter chats_message copy it into a new table,
+    dropping the triggers and renumbering rowids. Also run the rebuild
+    after a VACUUM (``manage.py rebuild_search_index``).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'chats_message'"
+        )
+        present = {name for name, in cursor.fetchall()}
+        for name, sql in SQLITE_TRIGGERS.items():
+            if name not in present:
+                cursor.execute(sql)
+                rebuild = True
+        if rebuild:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, message_body) "
+                "SELECT rowid, chats_body_text(message_body) FROM chats_message"
+            )
+
+
+class SQLiteBackend:
+
+    def search(self, queryset, terms):
+        # \w+ tokens contain no quotes; quoting keeps FTS5 operators inert
+        match = " ".join(f'"{term}"' for term in terms)
+        matching = RawSQL(
+            f"chats_message.rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)",
+            (match,), output_field=BooleanField(),
+        )
+        # Evaluated for matching rows only; bm25() is lower-is-better
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = chats_message.rowid",
+            (match,), output_field=FloatField(),
+        )
+        return queryset.filter(matching).annotate(search_rank=rank)
+
+
+# -------------------------------------
+# MySQL FULLTEXT
+# -------------------------------------
+class MySQLBackend:
+
+    def search(self, queryset, terms):
+        matching = RawSQL(
+            "MATCH (chats_message.message_body) AGAINST (%s IN BOOLEAN MODE)",
+            (" ".join(f"+{term}" for term in terms),), output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            "MATCH (chats_message.message_body) AGAINST (%s IN NATURAL LANGUAGE MODE)",
+            (" ".join(terms),), output_field=FloatField(),
+        )
+        return queryset.filter(matching).annotate(search_rank=rank)
+
+
+# -------------------------------------
+# In-memory fallback
+# -------------------------------------
+class MemoryBackend:
+    """
+    Inverted index ``term -> {message_id: term frequency}``, tf-idf ranked.
+
+    The index covers every message, so matches are narrowed to the ones in
+    the (participant-scoped) queryset before ranking; at most
+    ``max_results`` best of those are returned, since they are passed back
+    to the database as an id list.
+    """
+    max_results = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}  # message_id -> Counter of terms
+        self.seq = None
+
+    def search(self, queryset, terms):
+        with self._lock:
+            self.refresh()
+            scores = self.score(terms)
+        if len(scores) > self.max_results:
+            visible = set(queryset.order_by().values_list("message_id", flat=True))
+            scores = {pk: score for pk, score in scores.items() if pk in visible}
+        if not scores:
+            return no_results(queryset)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.max_results]
+        return queryset.filter(message_id__in=[pk for pk, _ in best]).annotate(search_rank=Case(
+            *(When(message_id=pk, then=Value(score)) for pk, score in best),
+            output_field=FloatField(),
+        ))
+
+    def score(self, terms):
+        terms = set(terms)
+        postings = [self.postings.get(term, {}) for term in terms]
+        if not all(postings):
+            return {}
+        total = len(self.documents)
+        scores = {}
+        for pk in set.intersection(*(set(p) for p in postings)):
+            length = sum(self.documents[pk].values())
+            scores[pk] = sum(
+                (p[pk] / length) * math.log(1 + total / len(p)) for p in postings
+            )
+        return scores
+
+    def refresh(self):
+        head = sync.head()
+        if self.seq is None or head < self.seq:  # first use, or the log was reset
+            self.reset()
+            for pk, body in Message.objects.values_list("message_id", "message_body").iterator():
+                self.add(pk, body)
+        elif head > self.seq:
+            changes = dict(
+                MessageChange.objects.filter(seq__gt=self.seq, seq__lte=head)
+                .exclude(kind=MessageChangeKind.ConversationDeleted)
+                .order_by("seq").values_list("message_id", "kind")
+            )
+            for pk in changes:
+                self.remove(pk)
+            alive = [pk for pk, kind in changes.items() if kind != MessageChangeKind.Deleted]
+            for pk, body in Message.objects.filter(message_id__in=alive).values_list(
+                "message_id", "message_body"
+            ):
+                self.add(pk, body)
+        self.seq = head
+
+    def add(self, pk, body):
+        counts = Counter(tokenize(str(body)))
+        self.documents[pk] = counts
+        for term, count in counts.items():
+            self.postings[term][pk] = count
+
+    def remove(self, pk):
+        for term in self.documents.pop(pk, ()):
+            self.postings[term].pop(pk, None)
+            if not self.postings[term]:
+                del self.postings[term]
+
+
+memory_backend = MemoryBackend()
+
+
+def _fts_installed():
+    # remembered per connection once found; it never goes away by itself
+    if not getattr(connection, "_chats_fts_installed", False):
+        connection._chats_fts_installed = sqlite_fts_installed(connection)
+    return connection._chats_fts_installed
+
+
+def get_backend():
+    name = getattr(settings, "CHATS_SEARCH_BACKEND", "auto")
+    if name == "auto":
+        if connection.vendor == "sqlite" and _fts_installed():
+            name = "sqlite"
+        elif connection.vendor == "mysql":
+            name = "mysql"
+        else:
+            raise ImproperlyConfigured(
+                f"No full-text index for {connection.vendor} (SQLite needs FTS5); set "
+                'CHATS_SEARCH_BACKEND = "memory" to search with the in-process index.'
+            )
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "mysql":
+        return MySQLBackend()
+    return memory_backend
+
+
+def check_backend(app_configs=None, databases=None, **kwargs):
+    """
+    System check: CHATS_SEARCH_BACKEND names a backend the default database
+    can serve. Whether SQLite has FTS5 is only asked when the checks may
+    query the database (``migrate``, ``test``, ``check --database``).
+    """
+    name = getattr(settings, "CHATS_SEARCH_BACKEND", "auto")
+    if name not in BACKENDS:
+        return [checks.Error(
+            f"CHATS_SEARCH_BACKEND is {name!r}; expected one of {', '.join(BACKENDS)}.",
+            id="chats.E001",
+        )]
+    if name == "memory":
+        return []
+    vendor = connection.vendor
+    served = name in ("auto", vendor) and vendor in ("sqlite", "mysql")
+    if served and vendor == "sqlite" and DEFAULT_DB_ALIAS in (databases or ()):
+        served = sqlite_fts_supported(connection)
+    if not served:
+        return [checks.Error(
+            f"CHATS_SEARCH_BACKEND {name!r} needs a full-text index that the "
+            f"{vendor} database does not have (SQLite needs FTS5).",
+            hint='Set CHATS_SEARCH_BACKEND = "memory" to search with the in-process index.',
+            id="chats.E002",
+        )]
+    return []
+
+
+def no_results(queryset):
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+def search(queryset, query):
+    """Narrow ``queryset`` to messages matching every term of ``query``, ranked."""
+    terms = tokenize(query)
+    if not terms:
+        return no_results(queryset)
+    return get_backend().search(queryset, terms)
@@ -22,8 +22,24 @@ class ConversationSerializer(serializers.Serializer):
     messages = serializers.SerializerMethodField()
     created_at = serializers.DateTimeField(read_only=True)
 
+    # Denormalized activity, see ConversationSummary
+    last_message_at = serializers.DateTimeField(source="summary.last_message_at", read_only=True)
+    message_count = serializers.IntegerField(source="summary.message_count", read_only=True)
+    last_message_snippet = serializers.CharField(
+        source="summary.last_message_snippet", read_only=True
+    )
+
+    # The requester's read state; only on lists (see chats.receipts.with_read_state)
+    unread_count = serializers.IntegerField(read_only=True)
+    last_read_at = serializers.DateTimeField(read_only=True)
+
     # Include messages nested manually
     def get_messages(self, obj):
+        # List views prefetch a bounded newest-first preview instead of the
+        # whole history; show it oldest-first like the message endpoints.
+        recent = getattr(obj, "recent_messages", None)
+        if recent is not None:
+            return MessageSerializer(recent[::-1], many=True).data
         qs = obj.messages.all()  # Related name from Message model
         return MessageSerializer(qs, many=True).data
 
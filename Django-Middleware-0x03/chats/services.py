@@ -0,0 +1,194 @@
+"""
+Write operations for conversations and messages.
+
+Views go through these functions so that every write also updates the
+denormalized state that hangs off it, in the same transaction.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from . import archive, inbox_cache, receipts, streams, summaries, sync
+from .models import (
+    Conversation, ConversationParticipant, ConversationSummary, Message, MessageChangeKind,
+    participant_hash,
+)
+
+
+def _participants(conversation_ids):
+    """Map conversation_id -> participant user ids, in one query."""
+    participants = defaultdict(list)
+    rows = ConversationParticipant.objects.filter(conversation_id__in=conversation_ids)
+    for conversation_id, user_id in rows.values_list("conversation_id", "user_id"):
+        participants[conversation_id].append(user_id)
+    return participants
+
+
+def _messages_created(messages):
+    """Bookkeeping shared by create_message and create_messages."""
+    participants = _participants({m.conversation_id for m in messages})
+    inbox_cache.invalidate_users(uid for uids in participants.values() for uid in uids)
+    streams.publish_messages(messages, participants)
+
+
+def _insert_conversation(user_ids, key):
+    """New conversation with its participant rows (one bulk INSERT) and summary."""
+    conversation = Conversation.objects.create(participant_hash=key)
+    ConversationParticipant.objects.bulk_create(
+        ConversationParticipant(conversation=conversation, user_id=user_id)
+        for user_id in user_ids
+    )
+    ConversationSummary.objects.create(conversation=conversation)
+    inbox_cache.invalidate_users(user_ids)
+    return conversation
+
+
+def create_conversation(participants):
+    """
+    Always a new conversation. It becomes the one find-or-create resolves
+    to for its participant set unless another conversation already is.
+    """
+    user_ids = {user.pk for user in participants}
+    key = participant_hash(user_ids)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                return _insert_conversation(user_ids, key)
+        except IntegrityError:  # participant_hash taken
+            return _insert_conversation(user_ids, None)
+
+
+def find_or_create_conversation(participants):
+    """
+    The conversation of exactly these participants, created if there is
+    none. Returns ``(conversation, created)``.
+
+    Resolved by a unique index lookup on participant_hash; of two
+    concurrent creates, the loser's INSERT fails and it reads the winner's.
+    """
+    user_ids = {user.pk for user in participants}
+    key = participant_hash(user_ids)
+    conversation = Conversation.objects.filter(participant_hash=key).first()
+    if conversation is not None:
+        return conversation, False
+    try:
+        with transaction.atomic():
+            return _insert_conversation(user_ids, key), True
+    except IntegrityError:
+        return Conversation.objects.get(participant_hash=key), False
+
+
+def update_participants(conversation, participants):
+    participants = list(participants)
+    key = participant_hash(user.pk for user in participants)
+    with transaction.atomic():
+        # both the users leaving and the users joining see a changed inbox
+        inbox_cache.invalidate_conversations([conversation.pk])
+        members = set(conversation.participants.values_list("pk", flat=True))
+        conversation.participants.set(participants)
+        receipts.members_joined(
+            conversation.pk, [user.pk for user in participants if user.pk not in members]
+        )
+        if conversation.participant_hash != key:
+            # Claim the new set's hash, or give it up if another conversation holds it
+            try:
+                with transaction.atomic():
+                    Conversation.objects.filter(pk=conversation.pk).update(participant_hash=key)
+            except IntegrityError:
+                key = None
+                Conversation.objects.filter(pk=conversation.pk).update(participant_hash=key)
+            conversation.participant_hash = key
+        summaries.conversation_changed(conversation.pk)
+        inbox_cache.invalidate_conversations([conversation.pk])
+    return conversation
+
+
+def delete_conversation(conversation):
+    with transaction.atomic():
+        inbox_cache.invalidate_conversations([conversation.pk])
+        archive.conversation_deleted(conversation.pk)
+        sync.record_conversation_deleted(
+            conversation.pk, conversation.participant_links.values_list("user_id", flat=True)
+        )
+        conversation.delete()
+
+
+def create_message(conversation, sender, message_body):
+    with transaction.atomic():
+        message = Message.objects.create(
+            conversation=conversation,
+            sender=sender,
+            message_body=message_body
+        )
+        summaries.message_created(message)
+        receipts.messages_created([message])
+        sync.record(MessageChangeKind.Created, [message])
+        _messages_created([message])
+    return message
+
+
+def create_messages(messages):
+    """
+    Insert unsaved ``Message`` instances with one bulk INSERT.
+
+    Callers validate conversations and senders beforehand; summaries and
+    caches are updated per conversation rather than per message.
+    """
+    with transaction.atomic():
+        messages = Message.objects.bulk_create(messages)
+        summaries.messages_created(messages)
+        receipts.messages_created(messages)
+        sync.record(MessageChangeKind.Created, messages)
+        _messages_created(messages)
+    return messages
+
+
+def update_message(message, message_body):
+    with transaction.atomic():
+        message.message_body = message_body
+        message.save()
+        summaries.message_updated(message)
+        sync.record(MessageChangeKind.Updated, [message])
+        inbox_cache.invalidate_conversations([message.conversation_id])
+    return message
+
+
+def delete_message(message):
+    # delete() clears the primary key on the instance
+    conversation_id, message_id = message.conversation_id, message.message_id
+    with transaction.atomic():
+        receipts.message_deleted(message)
+        message.delete()
+        summaries.message_deleted(conversation_id, message_id)
+        sync.record_deleted(conversation_id, message_id)
+        inbox_cache.invalidate_conversations([conversation_id])
+
+
+def archive_messages(before, batch_size):
+    """
+    Move up to ``batch_size`` of the oldest messages sent before ``before``
+    to the archive (see chats.archive); returns how many were moved.
+
+    The messages stay in their conversations, so counts and read marks are
+    unchanged; summaries are bumped (retrieves embed hot messages only) and
+    sync clients get an "archived" change.
+    """
+    messages = archive.oldest(before, batch_size)
+    if not messages:
+        return 0
+    conversation_ids = {m.conversation_id for m in messages}
+    with transaction.atomic():
+        archive.move(messages)
+        summaries.messages_archived(conversation_ids)
+        sync.record(MessageChangeKind.Archived, messages)
+        inbox_cache.invalidate_conversations(conversation_ids)
+    return len(messages)
+
+
+def mark_read(conversation_id, user):
+    """Mark the conversation read up to its latest message; False if not a member."""
+    with transaction.atomic():
+        marked = receipts.mark_read(conversation_id, user)
+        if marked:
+            inbox_cache.invalidate_users([user.pk])
+    return marked
@@ -0,0 +1,91 @@
+"""
+Server-Sent Events stream of new messages (ASGI only).
+
+``GET /api/v1/chats/stream/`` holds one connection per client and pushes
+every message created in the user's conversations as an SSE ``message``
+event. The view is a native async view: an idle subscriber is a suspended
+coroutine waiting on its queue in ``chats.pubsub``, not a worker thread.
+"""
+import asyncio
+
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .auth import authenticate_async
+from .models import CustomUser, Message
+from .pubsub import hub
+from .serializers import MessageSerializer
+
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+
+# -------------------------------------
+# Publishing (sync side)
+# -------------------------------------
+def format_event(event, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id else []
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+def publish_messages(messages, participants):
+    """
+    Push ``messages`` to subscribed participants once the transaction commits.
+
+    ``participants`` maps conversation_id -> participant user ids. Nothing
+    is serialized unless one of them has an open stream.
+    """
+    def publish():
+        if not hub.has_subscribers({uid for uids in participants.values() for uid in uids}):
+            return
+        missing = {m.sender_id for m in messages if not Message.sender.is_cached(m)}
+        senders = CustomUser.objects.in_bulk(missing) if missing else {}
+        renderer = JSONRenderer()
+        for message in messages:
+            if message.sender_id in senders:
+                message.sender = senders[message.sender_id]
+            payload = renderer.render(MessageSerializer(message).data).decode()
+            hub.publish(
+                participants.get(message.conversation_id, ()),
+                format_event("message", payload, event_id=message.message_id),
+            )
+
+    transaction.on_commit(publish)
+
+
+# -------------------------------------
+# Streaming (async side)
+# -------------------------------------
+async def event_stream(user_id, heartbeat=HEARTBEAT_SECONDS):
+    subscription = hub.subscribe(user_id)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield event
+            if subscription.overflowed:
+                # Events were dropped: tell the client to catch up via /messages/sync/
+                subscription.overflowed = False
+                yield format_event("resync", "{}")
+    finally:
+        hub.unsubscribe(subscription)
+
+
+async def message_stream(request):
+    if request.method != "GET":
+        return HttpResponse(status=405, headers={"Allow": "GET"})
+    user = await authenticate_async(request)
+    if user is None:
+        return HttpResponse("Authentication credentials were not provided.", status=401)
+
+    response = StreamingHttpResponse(event_stream(user.pk), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
@@ -0,0 +1,188 @@
+"""
+Maintenance of the denormalized ConversationSummary rows.
+
+Every function here is meant to run inside the transaction that wrote the
+message, so a summary never disagrees with the committed messages.
+"""
+from django.db.models import (
+    Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import archive
+from .models import Conversation, ConversationSummary, Message
+
+LAST_MESSAGE_AT = ConversationSummary._meta.get_field("last_message_at")
+LAST_MESSAGE_ID = ConversationSummary._meta.get_field("last_message_id")
+LAST_MESSAGE_SNIPPET = ConversationSummary._meta.get_field("last_message_snippet")
+SNIPPET_LENGTH = LAST_MESSAGE_SNIPPET.max_length
+
+
+def snippet(body):
+    return (body or "")[:SNIPPET_LENGTH]
+
+
+def bumped():
+    """Update kwargs marking a summary as changed (see ConversationSummary.version)."""
+    return {"version": F("version") + 1, "updated_at": timezone.now()}
+
+
+def conversation_changed(conversation_id):
+    """Record a change to the conversation itself, e.g. its participants."""
+    updated = ConversationSummary.objects.filter(conversation_id=conversation_id).update(**bumped())
+    if not updated:
+        rebuild_summaries([conversation_id])
+
+
+def message_created(message):
+    """Count a new message and make it the conversation's latest."""
+    messages_created([message])
+
+
+def messages_created(messages):
+    """
+    Count a batch of new messages: one UPDATE per conversation touched.
+
+    The newest message of the batch becomes the latest only if it is newer
+    than the summary's: transactions may commit out of order, and one that
+    commits late must not move the preview back to an older message.
+    """
+    by_conversation = {}
+    for message in messages:
+        count, latest = by_conversation.get(message.conversation_id, (0, message))
+        if (message.sent_at, message.message_id) > (latest.sent_at, latest.message_id):
+            latest = message
+        by_conversation[message.conversation_id] = (count + 1, latest)
+
+    missing = []
+    for conversation_id, (count, latest) in by_conversation.items():
+        newer = (
+            Q(last_message_at__isnull=True)
+            | Q(last_message_at__lt=latest.sent_at)
+            | Q(last_message_at=latest.sent_at, last_message_id__lt=latest.message_id)
+        )
+
+        def if_newer(field, value):
+            return Case(When(newer, then=Value(value, output_field=field)),
+                        default=F(field.name))
+
+        updated = ConversationSummary.objects.filter(conversation_id=conversation_id).update(
+            message_count=F("message_count") + count,
+            last_message_at=if_newer(LAST_MESSAGE_AT, latest.sent_at),
+            last_message_id=if_newer(LAST_MESSAGE_ID, latest.message_id),
+            last_message_snippet=if_newer(LAST_MESSAGE_SNIPPET, snippet(latest.message_body)),
+            **bumped(),
+        )
+        if not updated:
+            missing.append(conversation_id)
+    if missing:
+        # Conversations predating summaries: build their rows from the messages.
+        rebuild_summaries(missing)
+
+
+def message_updated(message):
+    """Bump the version; refresh the snippet when the edited message is the latest one."""
+    ConversationSummary.objects.filter(conversation_id=message.conversation_id).update(
+        last_message_snippet=Case(
+            When(last_message_id=message.message_id, then=Value(snippet(message.message_body))),
+            default=F("last_message_snippet"),
+        ),
+        **bumped(),
+    )
+
+
+def messages_archived(conversation_ids):
+    """Archived messages still count, and the latest stays the latest: bump only."""
+    ConversationSummary.objects.filter(conversation_id__in=conversation_ids).update(**bumped())
+
+
+def message_deleted(conversation_id, message_id):
+    """Uncount a deleted message, moving "latest" back if it was the latest."""
+    summaries = ConversationSummary.objects.filter(conversation_id=conversation_id)
+    updated = summaries.update(
+        message_count=Greatest(F("message_count") - 1, Value(0)), **bumped()
+    )
+    if not updated:
+        rebuild_summaries([conversation_id])
+        return
+
+    if summaries.filter(last_message_id=message_id).exists():
+        latest = (
+            Message.objects.filter(conversation_id=conversation_id)
+            .order_by("-sent_at", "-message_id")
+            .values("message_id", "sent_at", "message_body")
+            .first()
+        )
+        if latest is None and archive.enabled():
+            latest = archive.latest(conversation_id)
+        summaries.update(
+            last_message_at=latest["sent_at"] if latest else None,
+            last_message_id=latest["message_id"] if latest else None,
+            last_message_snippet=snippet(latest["message_body"] if latest else ""),
+        )
+
+
+def rebuild_summaries(conversation_ids):
+    """
+    Recompute the summaries of the given conversations from their messages,
+    archived ones included when archiving is enabled.
+
+    Issues one read (correlated subqueries per conversation, each an index
+    range on the messages' conversation FK), one upsert and one UPDATE
+    bumping the versions, so HTTP validators change with the summaries.
+    The archive, which may live in another database, adds one count query
+    and one read per conversation with no hot message left.
+    """
+    messages = Message.objects.filter(conversation=OuterRef("pk"))
+    latest = messages.order_by("-sent_at", "-message_id")
+    counts = (
+        messages.order_by().values("conversation")
+        .annotate(total=Count("*")).values("total")
+    )
+    rows = Conversation.objects.filter(pk__in=conversation_ids).annotate(
+        total=Coalesce(Subquery(counts, output_field=IntegerField()), 0),
+        latest_id=Subquery(latest.values("message_id")[:1]),
+        latest_at=Subquery(latest.values("sent_at")[:1]),
+        # Whole body: a compressed one can only be cut once inflated
+        latest_body=Subquery(latest.values("message_body")[:1]),
+    ).values_list("pk", "total", "latest_id", "latest_at", "latest_body")
+
+    if archive.enabled():
+        rows = list(rows)
+        archived = archive.counts([row[0] for row in rows])
+        for index, (pk, total, latest_id, latest_at, latest_body) in enumerate(rows):
+            if pk not in archived:
+                continue
+            if latest_id is None:
+                newest = archive.latest(pk)
+                latest_id, latest_at, latest_body = (
+                    newest["message_id"], newest["sent_at"], newest["message_body"]
+                )
+            rows[index] = (pk, total + archived[pk], latest_id, latest_at, latest_body)
+
+    now = timezone.now()
+    summaries = [
+        ConversationSummary(
+            conversation_id=pk,
+            updated_at=now,
+            message_count=total,
+            last_message_id=latest_id,
+            last_message_at=latest_at,
+            last_message_snippet=snippet(latest_body),
+        )
+        for pk, total, latest_id, latest_at, latest_body in rows
+    ]
+    ConversationSummary.objects.bulk_create(
+        summaries,
+        update_conflicts=True,
+        unique_fields=["conversation"],
+        update_fields=[
+            "message_count", "last_message_id", "last_message_at", "last_message_snippet",
+            "updated_at",
+        ],
+    )
+    ConversationSummary.objects.filter(
+        conversation_id__in=[summary.conversation_id for summary in summaries]
+    ).update(version=F("version") + 1)
+    return len(summaries)
@@ -0,0 +1,173 @@
+"""
+Delta sync over the MessageChange log.
+
+A sync token is an opaque encoding of (user, last seq seen). A poll first
+reads the user's head of the log, one query probing the (conversation,
+seq) index of each of their conversations and the (recipient, seq) index
+of their tombstones; when nothing of theirs was appended since the token,
+that is the whole cost. Otherwise the user's changes after the token are
+read in seq order, collapsed per message, and returned with the current
+state of surviving messages.
+
+Deleting a conversation leaves its rows in the log and appends a
+``conversation_deleted`` tombstone per participant, since the participant
+links that scope the other rows go with it.
+
+The log is ordered by auto-increment value, so a writer that allocated a
+lower seq but commits after a poll could be skipped on databases with
+concurrent writers; keep message write transactions short.
+
+``prune`` (``manage.py prune_message_changes``) drops rows older than
+CHATS_SYNC_RETENTION_DAYS, always keeping the newest. A token from before
+the oldest remaining row may have missed changes: polling with it raises
+``TokenExpired`` (410) and the client reloads from the list endpoints.
+"""
+import base64
+import binascii
+
+from django.db.models import Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import ConversationParticipant, MessageChange, MessageChangeKind
+
+
+class TokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = "Sync token expired; reload the messages and sync from a new token."
+    default_code = "sync_token_expired"
+
+
+def record(kind, messages):
+    """Append one change row per message (one INSERT)."""
+    MessageChange.objects.bulk_create([
+        MessageChange(conversation_id=m.conversation_id, message_id=m.message_id, kind=kind)
+        for m in messages
+    ])
+
+
+def record_deleted(conversation_id, message_id):
+    MessageChange.objects.create(
+        conversation_id=conversation_id, message_id=message_id, kind=MessageChangeKind.Deleted
+    )
+
+
+def record_conversation_deleted(conversation_id, user_ids):
+    """Append one tombstone per former participant (one INSERT)."""
+    MessageChange.objects.bulk_create([
+        MessageChange(
+            conversation_id=conversation_id, recipient_id=user_id,
+            kind=MessageChangeKind.ConversationDeleted
+        )
+        for user_id in user_ids
+    ])
+
+
+def head(user=None):
+    """The newest seq in the log, or the newest one ``user`` can see."""
+    if user is None:
+        return MessageChange.objects.order_by("-seq").values_list("seq", flat=True).first() or 0
+
+    def newest(changes):
+        return Subquery(changes.order_by("-seq").values("seq")[:1])
+
+    conversation_head = MessageChange.objects.filter(conversation_id=OuterRef("conversation_id"))
+    tombstone_head = MessageChange.objects.filter(recipient=user)
+    # An aggregate returns its row even when the user has no conversations.
+    return ConversationParticipant.objects.filter(user=user).aggregate(head=Greatest(
+        Coalesce(Max(newest(conversation_head)), Value(0)),
+        Coalesce(newest(tombstone_head), Value(0)),
+    ))["head"]
+
+
+def encode_token(user, seq):
+    raw = f"{user.pk.hex}:{seq}"
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii")
+
+
+def decode_token(user, token):
+    try:
+        owner, seq = base64.urlsafe_b64decode(token.encode("ascii")).decode("ascii").split(":")
+        seq = int(seq)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValidationError({"token": "Invalid sync token."})
+    if owner != user.pk.hex or seq < 0:
+        raise ValidationError({"token": "Invalid sync token."})
+    return seq
+
+
+def oldest():
+    return MessageChange.objects.order_by("seq").values_list("seq", flat=True).first() or 0
+
+
+def prune(before, batch_size=1000):
+    """
+    Delete up to ``batch_size`` of the oldest rows changed before ``before``,
+    never the newest row (it anchors ``head``). Returns the number deleted.
+    """
+    newest = head()
+    seqs = list(
+        MessageChange.objects.filter(changed_at__lt=before, seq__lt=newest)
+        .order_by("seq").values_list("seq", flat=True)[:batch_size]
+    )
+    if not seqs:
+        return 0
+    return MessageChange.objects.filter(seq__lte=seqs[-1]).delete()[0]
+
+
+def changes_since(user, since, limit, conversation_id=None):
+    """
+    Return ``(changes, deleted_conversations, last_seq, has_more)`` for the
+    user's conversations, or only ``conversation_id``'s.
+
+    ``changes`` maps message_id -> kind, collapsed over the window: a
+    message created and edited is "created", anything ending in a delete
+    is "deleted" (unless it was also created in the window, in which case
+    the client never saw it and it is dropped). A message archived after
+    the client saw it is "archived"; one created and archived in the
+    window is still "created". ``deleted_conversations`` lists the
+    conversations deleted since the token, whatever their messages did.
+    """
+    if head(user) <= since:
+        return {}, [], since, False
+    current = head()
+    if since < oldest() - 1:  # rows after the token were pruned
+        raise TokenExpired()
+
+    # Not a join through Conversation: tombstones outlive their conversation.
+    mine = ConversationParticipant.objects.filter(user=user).values("conversation_id")
+    window = MessageChange.objects.filter(seq__gt=since, seq__lte=current)
+    if conversation_id is not None:
+        window = window.filter(conversation_id=conversation_id, conversation_id__in=mine)
+    else:
+        window = window.filter(Q(conversation_id__in=mine) | Q(recipient=user))
+    rows = list(window.order_by("seq").values_list(
+        "seq", "conversation_id", "message_id", "kind"
+    )[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # Without more rows the client is caught up to the head, even if the
+    # rest of the window belonged to other users' conversations.
+    last_seq = rows[-1][0] if has_more else current
+
+    changes, created, deleted_conversations = {}, set(), []
+    for _, conversation, message_id, kind in rows:
+        if kind == MessageChangeKind.ConversationDeleted:
+            deleted_conversations.append(conversation)
+        elif kind == MessageChangeKind.Created:
+            created.add(message_id)
+            changes[message_id] = MessageChangeKind.Created
+        elif kind == MessageChangeKind.Updated:
+            changes[message_id] = (
+                MessageChangeKind.Created if message_id in created else MessageChangeKind.Updated
+            )
+        elif kind == MessageChangeKind.Archived:
+            changes[message_id] = (
+                MessageChangeKind.Created if message_id in created else MessageChangeKind.Archived
+            )
+        elif message_id in created:
+            changes.pop(message_id, None)
+        else:
+            changes[message_id] = MessageChangeKind.Deleted
+    return changes, deleted_conversations, last_seq, has_more
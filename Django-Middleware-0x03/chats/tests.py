@@ -1,3 +1,1735 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+import zoneinfo
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import SystemCheckError
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (
+    compression, fastpath, ids, inbox_cache, metrics, ratelimit, receipts, requestlog, search,
+    services, summaries, sync,
+)
+from .models import (
+    ArchivedMessage, CustomUser, Conversation, ConversationParticipant, ConversationSummary, Message,
+    MessageChange, MessageChangeKind,
+)
+from .middleware import AccessPolicyMiddleware, MetricsMiddleware, RequestLoggingMiddleware
+from .pubsub import MessageHub, hub
+from .permissions import IsParticipantOfConversation, is_participant, load_memberships
+from .summaries import rebuild_summaries
+from .views import ConversationViewSet, MessageViewSet
+
+
+# The chats access middlewares (time window, role gate, rate limit) are
+# exercised separately; API tests run against the stock Django stack.
+API_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+]
+
+
+def make_user(name, role="guest"):
+    return CustomUser.objects.create_user(
+        username=name,
+        email=f"{name}@example.com",
+        password="pass-1234",
+        first_name=name.title(),
+        last_name="Tester",
+        role=role,
+    )
+
+
+@override_settings(MIDDLEWARE=API_MIDDLEWARE)
+class ChatsAPITestCase(TestCase):
+    """Shared fixtures: two participants in one conversation, one outsider."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = make_user("alice")
+        cls.bob = make_user("bob")
+        cls.eve = make_user("eve")
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.set([cls.alice, cls.bob])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def add_messages(self, count, conversation=None, sender=None, start=None):
+        """Create ``count`` messages one second apart, oldest first."""
+        conversation = conversation or self.conversation
+        sender = sender or self.alice
+        start = start or timezone.now() - timedelta(days=1)
+        messages = []
+        for i in range(count):
+            message = Message.objects.create(
+                conversation=conversation, sender=sender, message_body=f"message {i}"
+            )
+            message.sent_at = start + timedelta(seconds=i)
+            message.save(update_fields=["sent_at"])
+            messages.append(message)
+        return messages
+
+
+class MessageCursorPaginationTests(ChatsAPITestCase):
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item["message_body"] for item in response.data["results"])
+            url = response.data["next"]
+        return seen
+
+    def test_cursor_pages_cover_every_message_once_in_order(self):
+        self.add_messages(7)
+        seen = self.walk("/api/v1/chats/messages/?pagination=cursor&page_size=3")
+        self.assertEqual(seen, [f"message {i}" for i in range(7)])
+
+    def test_nested_route_and_previous_link(self):
+        self.add_messages(5)
+        url = f"/api/v1/chats/conversations/{self.conversation.pk}/messages/"
+        first = self.client.get(url, {"pagination": "cursor", "page_size": 2}).data
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).data
+        self.assertEqual([m["message_body"] for m in second["results"]],
+                         ["message 2", "message 3"])
+        back = self.client.get(second["previous"]).data
+        self.assertEqual(back["results"], first["results"])
+
+    def test_ties_on_sent_at_are_broken_by_message_id(self):
+        messages = self.add_messages(4)
+        Message.objects.filter(pk__in=[m.pk for m in messages]).update(
+            sent_at=messages[0].sent_at
+        )
+        seen = self.walk("/api/v1/chats/messages/?pagination=cursor&page_size=1")
+        self.assertEqual(sorted(seen), [f"message {i}" for i in range(4)])
+        self.assertEqual(len(seen), 4)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get("/api/v1/chats/messages/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_outsider_sees_nothing(self):
+        self.add_messages(2)
+        self.client.force_authenticate(self.eve)
+        response = self.client.get("/api/v1/chats/messages/", {"pagination": "cursor"})
+        self.assertEqual(response.data["results"], [])
+
+
+class ConversationListPreviewTests(ChatsAPITestCase):
+
+    def test_list_is_paginated_and_embeds_only_the_latest_messages(self):
+        self.add_messages(6)
+        response = self.client.get("/api/v1/chats/conversations/", {"preview": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 1)
+        conversation = response.data["results"][0]
+        self.assertEqual([m["message_body"] for m in conversation["messages"]],
+                         ["message 4", "message 5"])
+
+    def test_previews_are_loaded_with_a_fixed_number_of_queries(self):
+        for _ in range(5):
+            conversation = Conversation.objects.create()
+            conversation.participants.set([self.alice, self.bob])
+            self.add_messages(4, conversation=conversation)
+        # validators, count, page, participants, windowed message preview
+        with self.assertNumQueries(5):
+            response = self.client.get("/api/v1/chats/conversations/")
+        self.assertEqual(len(response.data["results"]), 6)
+        for conversation in response.data["results"]:
+            self.assertLessEqual(len(conversation["messages"]), 3)
+
+    def test_preview_can_be_disabled(self):
+        self.add_messages(2)
+        response = self.client.get("/api/v1/chats/conversations/", {"preview": 0})
+        self.assertEqual(response.data["results"][0]["messages"], [])
+
+    def test_retrieve_keeps_the_full_history(self):
+        self.add_messages(5)
+        response = self.client.get(f"/api/v1/chats/conversations/{self.conversation.pk}/")
+        self.assertEqual(len(response.data["messages"]), 5)
+
+
+class ConversationSummaryTests(ChatsAPITestCase):
+
+    def post_message(self, body, conversation=None):
+        conversation = conversation or self.conversation
+        response = self.client.post(
+            f"/api/v1/chats/conversations/{conversation.pk}/messages/",
+            {"sender_id": str(self.alice.pk), "message_body": body},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def summary(self, conversation=None):
+        return ConversationSummary.objects.get(pk=(conversation or self.conversation).pk)
+
+    def test_create_update_and_delete_keep_the_summary_in_step(self):
+        first = self.post_message("first")
+        second = self.post_message("second")
+        summary = self.summary()
+        self.assertEqual(summary.message_count, 2)
+        self.assertEqual(str(summary.last_message_id), second["message_id"])
+        self.assertEqual(summary.last_message_snippet, "second")
+
+        self.client.patch(f"/api/v1/chats/messages/{second['message_id']}/",
+                          {"message_body": "edited"}, format="json")
+        self.assertEqual(self.summary().last_message_snippet, "edited")
+
+        self.client.delete(f"/api/v1/chats/messages/{second['message_id']}/")
+        summary = self.summary()
+        self.assertEqual(summary.message_count, 1)
+        self.assertEqual(str(summary.last_message_id), first["message_id"])
+        self.assertEqual(summary.last_message_snippet, "first")
+
+    def test_inbox_is_ordered_by_latest_activity(self):
+        quiet = services.create_conversation([self.alice, self.bob])
+        busy = services.create_conversation([self.alice, self.bob])
+        self.post_message("hello", conversation=self.conversation)
+        self.post_message("hello", conversation=busy)
+
+        response = self.client.get("/api/v1/chats/conversations/")
+        order = [c["conversation_id"] for c in response.data["results"]]
+        self.assertEqual(order, [str(busy.pk), str(self.conversation.pk), str(quiet.pk)])
+        self.assertEqual(response.data["results"][0]["message_count"], 1)
+
+    def test_rebuild_command_recomputes_from_messages(self):
+        self.add_messages(3)
+        ConversationSummary.objects.all().delete()
+        call_command("rebuild_conversation_summaries", batch_size=1, stdout=StringIO())
+        summary = self.summary()
+        self.assertEqual(summary.message_count, 3)
+        self.assertEqual(summary.last_message_snippet, "message 2")
+
+    def test_rebuild_command_rolls_back_a_failed_batch(self):
+        self.add_messages(3)
+        ConversationSummary.objects.all().delete()
+        with mock.patch.object(receipts, "recount", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                call_command("rebuild_conversation_summaries", stdout=StringIO())
+        self.assertFalse(ConversationSummary.objects.exists())
+
+    def test_a_late_commit_does_not_move_the_preview_back(self):
+        newer, older = self.add_messages(2)[::-1]
+        rebuild_summaries([self.conversation.pk])
+        older.message_body = "older"
+        summaries.messages_created([older])  # e.g. its transaction committed last
+        summary = self.summary()
+        self.assertEqual((summary.last_message_id, summary.message_count), (newer.pk, 3))
+        self.assertEqual(summary.last_message_snippet, "message 1")
+
+    def test_rebuild_changes_the_version(self):
+        rebuild_summaries([self.conversation.pk])
+        version = self.summary().version
+        self.add_messages(1)
+        ConversationSummary.objects.filter(pk=self.conversation.pk).update(version=version)
+        rebuild_summaries([self.conversation.pk])
+        self.assertGreater(self.summary().version, version)
+
+
+class ParticipantPermissionTests(ChatsAPITestCase):
+
+    def test_membership_is_checked_with_one_exists_query_and_memoized(self):
+        request = RequestFactory().get("/")
+        request.user = self.alice
+        permission = IsParticipantOfConversation()
+        message = self.add_messages(1)[0]
+        with self.assertNumQueries(1):
+            self.assertTrue(permission.has_object_permission(request, None, self.conversation))
+            self.assertTrue(permission.has_object_permission(request, None, message))
+
+    def test_memberships_loaded_in_bulk_are_reused(self):
+        other = Conversation.objects.create()
+        request = RequestFactory().get("/")
+        request.user = self.alice
+        with self.assertNumQueries(1):
+            member_of = load_memberships(request, [self.conversation.pk, other.pk])
+            self.assertFalse(is_participant(request, other.pk))
+        self.assertEqual(member_of, {self.conversation.pk})
+
+    def test_outsider_gets_403_on_message_retrieve(self):
+        message = self.add_messages(1)[0]
+        self.client.force_authenticate(self.eve)
+        response = self.client.get(f"/api/v1/chats/messages/{message.pk}/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_participant_retrieve_costs_three_queries(self):
+        message = self.add_messages(1)[0]
+        # validators, message, membership EXISTS
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/v1/chats/messages/{message.pk}/")
+        self.assertEqual(response.status_code, 200)
+
+
+class FastPathSerializationTests(ChatsAPITestCase):
+
+    def assertSameBytes(self, url, params=None):
+        with self.settings(CHATS_FAST_SERIALIZATION=False, CHATS_INBOX_CACHE_TTL=0):
+            slow = self.client.get(url, params)
+        with self.settings(CHATS_FAST_SERIALIZATION=True, CHATS_INBOX_CACHE_TTL=0):
+            fast = self.client.get(url, params)
+        self.assertEqual(slow.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_message_list_is_byte_identical(self):
+        self.add_messages(5)
+        self.add_messages(3, sender=self.bob)
+        self.assertSameBytes("/api/v1/chats/messages/")
+        self.assertSameBytes("/api/v1/chats/messages/", {"pagination": "cursor", "page_size": 4})
+
+    def test_conversation_list_is_byte_identical(self):
+        self.add_messages(5)
+        busy = services.create_conversation([self.alice, self.bob, self.eve])
+        services.create_message(busy, self.eve, "hi")
+        services.create_conversation([self.alice])  # empty, with a summary row
+        self.assertSameBytes("/api/v1/chats/conversations/")
+        self.assertSameBytes("/api/v1/chats/conversations/", {"preview": 0})
+
+    def test_non_utc_timezone_is_byte_identical(self):
+        self.add_messages(2)
+        with self.settings(TIME_ZONE="Africa/Addis_Ababa"):
+            self.assertSameBytes("/api/v1/chats/messages/")
+
+    def test_datetime_formatter_matches_the_drf_field(self):
+        field = serializers.DateTimeField()
+        values = [
+            timezone.now(),
+            timezone.now().astimezone(zoneinfo.ZoneInfo("Asia/Kolkata")),
+            timezone.now().replace(tzinfo=None),
+            None,
+        ]
+        for time_zone in ("UTC", "Africa/Addis_Ababa"):
+            with self.settings(TIME_ZONE=time_zone):
+                format_datetime = fastpath.datetime_formatter()
+                self.assertEqual(format_datetime.__name__, "format_datetime")
+                for value in values:
+                    self.assertEqual(format_datetime(value), field.to_representation(value))
+
+
+class ConditionalGetTests(ChatsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.message = services.create_message(self.conversation, self.alice, "hello")
+
+    def assertNotModified(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(1):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        return first["ETag"]
+
+    def test_unchanged_reads_return_304_after_one_query(self):
+        self.assertNotModified("/api/v1/chats/conversations/")
+        self.assertNotModified(f"/api/v1/chats/conversations/{self.conversation.pk}/")
+        self.assertNotModified(f"/api/v1/chats/conversations/{self.conversation.pk}/messages/")
+        self.assertNotModified("/api/v1/chats/messages/")
+        self.assertNotModified(f"/api/v1/chats/messages/{self.message.pk}/")
+
+    def test_writes_change_the_etag(self):
+        url = f"/api/v1/chats/conversations/{self.conversation.pk}/messages/"
+        etag = self.assertNotModified(url)
+        services.update_message(self.message, "edited")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        services.create_message(self.conversation, self.bob, "reply")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        response = self.client.get("/api/v1/chats/conversations/")
+        again = self.client.get("/api/v1/chats/conversations/",
+                                HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_outsiders_never_get_a_304(self):
+        response = self.client.get(f"/api/v1/chats/messages/{self.message.pk}/")
+        self.client.force_authenticate(self.eve)
+        again = self.client.get(f"/api/v1/chats/messages/{self.message.pk}/",
+                                HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 403)
+
+
+class InboxCacheTests(ChatsAPITestCase):
+
+    def inbox(self, client=None):
+        return (client or self.client).get("/api/v1/chats/conversations/")
+
+    def test_repeat_reads_are_served_from_the_cache(self):
+        before = inbox_cache.stats.as_dict()
+        self.inbox()
+        with self.assertNumQueries(1):  # only the ETag aggregate
+            self.inbox()
+        after = inbox_cache.stats.as_dict()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_writes_invalidate_participants_only(self):
+        eve_client = APIClient()
+        eve_client.force_authenticate(self.eve)
+        self.inbox()
+        self.inbox(eve_client)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.create_message(self.conversation, self.bob, "fresh")
+
+        results = self.inbox().data["results"]
+        self.assertEqual(results[0]["last_message_snippet"], "fresh")
+        with self.assertNumQueries(1):  # eve's inbox was left alone
+            self.inbox(eve_client)
+
+    def test_users_removed_from_a_conversation_are_invalidated(self):
+        self.assertEqual(self.inbox().data["count"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.update_participants(self.conversation, [self.bob])
+        self.assertEqual(self.inbox().data["count"], 0)
+
+    def test_ttl_is_capped(self):
+        with self.settings(CHATS_INBOX_CACHE_TTL=3600, CHATS_INBOX_CACHE_MAX_TTL=60):
+            self.assertEqual(inbox_cache.get_ttl(), 60)
+
+
+class BulkMessageCreateTests(ChatsAPITestCase):
+
+    def item(self, conversation, sender, body="hi"):
+        return {"conversation_id": str(conversation.pk), "sender_id": str(sender.pk),
+                "message_body": body}
+
+    def test_mixed_batch_reports_per_item_results(self):
+        other = services.create_conversation([self.alice, self.eve])
+        foreign = services.create_conversation([self.bob, self.eve])
+        response = self.client.post("/api/v1/chats/messages/bulk/", [
+            self.item(self.conversation, self.alice, "one"),
+            self.item(other, self.eve, "two"),
+            self.item(self.conversation, self.eve, "not a participant"),
+            self.item(foreign, self.bob, "not my conversation"),
+            {"conversation_id": "nope", "sender_id": "nope", "message_body": "x"},
+        ], format="json")
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["created"], 2)
+        statuses = [r["status"] for r in response.data["results"]]
+        self.assertEqual(statuses, [201, 201, 400, 404, 400])
+        self.assertEqual(response.data["results"][1]["message"]["sender"]["email"],
+                         "eve@example.com")
+        self.assertEqual(ConversationSummary.objects.get(pk=other.pk).message_count, 1)
+        self.assertFalse(Message.objects.filter(conversation=foreign).exists())
+
+    def test_large_batch_uses_a_handful_of_queries(self):
+        rebuild_summaries([self.conversation.pk])
+        items = [self.item(self.conversation, self.bob, f"m{i}") for i in range(1000)]
+        # SQLite caps parameters per statement, so bulk INSERTs are split
+        insert_batches = sum(
+            -(-1000 // connection.ops.bulk_batch_size(list(model._meta.concrete_fields), items))
+            for model in (Message, MessageChange)
+        )
+        # memberships, sender links, savepoint, message + change log INSERTs,
+        # summary UPDATE, unread + sender read mark UPDATEs, cache
+        # invalidation lookup, release, senders
+        with self.assertNumQueries(8 + insert_batches):
+            response = self.client.post(
+                f"/api/v1/chats/conversations/{self.conversation.pk}/messages/bulk/",
+                {"messages": items}, format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.conversation.messages.count(), 1000)
+        self.assertEqual(ConversationSummary.objects.get(pk=self.conversation.pk).message_count,
+                         1000)
+
+    def test_batch_size_is_capped(self):
+        items = [self.item(self.conversation, self.alice)] * 1001
+        response = self.client.post("/api/v1/chats/messages/bulk/", items, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchRetrieveTests(ChatsAPITestCase):
+
+    def test_results_keep_request_order_and_report_missing_ids(self):
+        first, second, third = self.add_messages(3)
+        foreign = services.create_conversation([self.bob, self.eve])
+        hidden = services.create_message(foreign, self.bob, "secret")
+        ids = [third.pk, "garbage", first.pk, hidden.pk, second.pk]
+
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                "/api/v1/chats/messages/batch/", {"ids": ",".join(map(str, ids))}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m["message_body"] for m in response.data["results"]],
+                         ["message 2", "message 0", "message 1"])
+        self.assertEqual(response.data["missing"], ["garbage", str(hidden.pk)])
+
+    def test_post_body_and_serializer_path(self):
+        messages = self.add_messages(2)
+        with self.settings(CHATS_FAST_SERIALIZATION=False):
+            response = self.client.post(
+                "/api/v1/chats/messages/batch/",
+                {"ids": [str(m.pk) for m in reversed(messages)]}, format="json",
+            )
+        self.assertEqual([m["message_body"] for m in response.data["results"]],
+                         ["message 1", "message 0"])
+        self.assertEqual(response.data["missing"], [])
+
+    def test_requires_ids(self):
+        response = self.client.get("/api/v1/chats/messages/batch/")
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_non_string_ids_and_malformed_conversations(self):
+        message = self.add_messages(1)[0]
+        for ids in ([[1]], [{}], [str(message.pk), 7]):
+            response = self.client.post("/api/v1/chats/messages/batch/", {"ids": ids}, format="json")
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(
+            "/api/v1/chats/conversations/not-a-uuid/messages/batch/", {"ids": str(message.pk)}
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            f"/api/v1/chats/conversations/{self.conversation.pk}/messages/batch/",
+            {"ids": str(message.pk)},
+        )
+        self.assertEqual([m["message_id"] for m in response.data["results"]], [str(message.pk)])
+
+
+class DeltaSyncTests(ChatsAPITestCase):
+
+    def sync(self, token=None):
+        response = self.client.get("/api/v1/chats/messages/sync/", {"token": token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_returns_only_changes_since_the_token(self):
+        kept = services.create_message(self.conversation, self.alice, "kept")
+        token = self.sync()["token"]
+
+        edited = services.create_message(self.conversation, self.bob, "draft")
+        services.update_message(kept, "kept, edited")
+        services.delete_message(services.create_message(self.conversation, self.bob, "oops"))
+        services.update_message(edited, "final")
+        foreign = services.create_conversation([self.bob, self.eve])
+        services.create_message(foreign, self.eve, "not for alice")
+
+        data = self.sync(token)
+        self.assertEqual([m["message_body"] for m in data["created"]], ["final"])
+        self.assertEqual([m["message_body"] for m in data["updated"]], ["kept, edited"])
+        self.assertEqual(data["deleted"], [])
+
+        kept_id = str(kept.message_id)
+        services.delete_message(kept)
+        again = self.sync(data["token"])
+        self.assertEqual(again["deleted"], [kept_id])
+
+    def test_no_change_poll_is_one_query(self):
+        services.create_message(self.conversation, self.alice, "hello")
+        token = self.sync()["token"]
+        with self.assertNumQueries(1):
+            data = self.sync(token)
+        self.assertEqual(data["token"], token)
+        self.assertEqual(data["created"], [])
+
+    def test_no_change_poll_ignores_other_users_changes(self):
+        token = self.sync()["token"]
+        foreign = services.create_conversation([self.bob, self.eve])
+        services.create_message(foreign, self.eve, "not for alice")
+        with self.assertNumQueries(1):
+            data = self.sync(token)
+        self.assertEqual(data["token"], token)
+
+    def test_deleted_conversations_reach_former_participants(self):
+        services.create_message(self.conversation, self.alice, "seen")
+        token = self.sync()["token"]
+        self.client.force_authenticate(self.bob)
+        bob_token = self.sync()["token"]
+        services.create_message(self.conversation, self.bob, "unseen")
+        conversation_id = self.conversation.conversation_id
+        services.delete_conversation(self.conversation)
+
+        self.assertTrue(MessageChange.objects.filter(
+            conversation_id=conversation_id, kind=MessageChangeKind.Created
+        ).exists())
+        data = self.sync(bob_token)
+        self.assertEqual(data["deleted_conversations"], [str(conversation_id)])
+        self.assertEqual(data["created"], [])
+
+        self.client.force_authenticate(self.alice)
+        data = self.sync(token)
+        self.assertEqual(data["deleted_conversations"], [str(conversation_id)])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.sync(data["token"])["deleted_conversations"], [])
+
+        self.client.force_authenticate(self.eve)
+        eve_token = sync.encode_token(self.eve, 0)
+        self.assertEqual(self.sync(eve_token)["deleted_conversations"], [])
+
+    def test_large_windows_are_paged(self):
+        token = self.sync()["token"]
+        for i in range(5):
+            services.create_message(self.conversation, self.alice, f"m{i}")
+        view = MessageViewSet
+        with mock.patch.object(view, "sync_max_changes", 3):
+            first = self.sync(token)
+            second = self.sync(first["token"])
+        self.assertTrue(first["has_more"])
+        self.assertFalse(second["has_more"])
+        bodies = [m["message_body"] for m in first["created"] + second["created"]]
+        self.assertEqual(bodies, [f"m{i}" for i in range(5)])
+
+    def test_tokens_are_bound_to_their_user(self):
+        token = self.sync()["token"]
+        self.client.force_authenticate(self.bob)
+        response = self.client.get("/api/v1/chats/messages/sync/", {"token": token})
+        self.assertEqual(response.status_code, 400)
+
+    def test_nested_route_only_syncs_its_conversation(self):
+        other = services.create_conversation([self.alice, self.bob])
+        url = f"/api/v1/chats/conversations/{self.conversation.conversation_id}/messages/sync/"
+        token = self.client.get(url).data["token"]
+        services.create_message(self.conversation, self.bob, "here")
+        services.create_message(other, self.bob, "elsewhere")
+
+        data = self.client.get(url, {"token": token}).data
+        self.assertEqual([m["message_body"] for m in data["created"]], ["here"])
+
+        self.client.force_authenticate(self.eve)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        missing = f"/api/v1/chats/conversations/{uuid.uuid4()}/messages/sync/"
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_prune_keeps_recent_changes_and_expires_old_tokens(self):
+        token = self.sync()["token"]
+        services.create_message(self.conversation, self.alice, "old")
+        services.create_message(self.conversation, self.alice, "older")
+        MessageChange.objects.update(changed_at=timezone.now() - timedelta(days=40))
+        recent = self.sync()["token"]
+        services.create_message(self.conversation, self.alice, "new")
+
+        call_command("prune_message_changes", older_than_days=30, stdout=StringIO())
+        self.assertEqual(MessageChange.objects.count(), 1)
+
+        response = self.client.get("/api/v1/chats/messages/sync/", {"token": token})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual([m["message_body"] for m in self.sync(recent)["created"]], ["new"])
+
+
+class MessageStreamTests(ChatsAPITestCase):
+
+    def start_loop(self):
+        """Run an event loop in a thread, standing in for the ASGI server."""
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.addCleanup(stop)
+        return loop
+
+    def test_hub_delivers_across_threads(self):
+        local_hub = MessageHub()
+
+        async def consume():
+            subscription = local_hub.subscribe("bob")
+            delivered = await asyncio.to_thread(local_hub.publish, ["bob", "eve"], "event")
+            self.assertEqual(delivered, 1)
+            return await asyncio.wait_for(subscription.queue.get(), 1)
+
+        self.assertEqual(asyncio.run(consume()), "event")
+
+    def test_created_messages_reach_subscribed_participants(self):
+        loop = self.start_loop()
+
+        async def subscribe():
+            return hub.subscribe(self.bob.pk)
+        subscription = asyncio.run_coroutine_threadsafe(subscribe(), loop).result()
+        self.addCleanup(hub.unsubscribe, subscription)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            message = services.create_message(self.conversation, self.alice, "live")
+        event = asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(subscription.queue.get(), 1), loop
+        ).result()
+
+        lines = event.strip().split("\n")
+        self.assertEqual(lines[:2], [f"id: {message.message_id}", "event: message"])
+        data = json.loads(lines[2][len("data: "):])
+        self.assertEqual(data["message_body"], "live")
+        self.assertEqual(data["sender"]["email"], "alice@example.com")
+
+    def test_nothing_is_serialized_without_subscribers(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            services.create_message(self.conversation, self.alice, "quiet")
+        with mock.patch("chats.streams.MessageSerializer") as serializer:
+            for callback in callbacks:
+                callback()
+        serializer.assert_not_called()
+
+    async def test_stream_requires_authentication(self):
+        response = await AsyncClient().get("/api/v1/chats/stream/")
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_opens_for_jwt_user(self):
+        token = str(AccessToken.for_user(self.alice))
+        response = await AsyncClient().get(
+            "/api/v1/chats/stream/", headers={"Authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+        self.assertTrue(hub.has_subscribers([self.alice.pk]))
+
+        # a client disconnect cancels the pending read, as the ASGI handler does
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(hub.has_subscribers([self.alice.pk]))
+
+
+class AsyncViewTests(ChatsAPITestCase):
+
+    def request(self, method, path, user=None, **kwargs):
+        # AsyncClient ignores default headers, so authenticate per request
+        token = AccessToken.for_user(user or self.alice)
+        client = AsyncClient()
+        return getattr(client, method)(
+            f"/api/v1/chats/async/{path}", headers={"Authorization": f"Bearer {token}"}, **kwargs
+        )
+
+    async def test_lists_match_the_sync_endpoints(self):
+        await sync_to_async(self.add_messages)(5)
+        await sync_to_async(services.create_conversation)([self.alice, self.eve])
+        for path, params in [
+            ("conversations/", {"preview": 2}),
+            ("messages/", {"pagination": "cursor", "page_size": 2}),
+            (f"conversations/{self.conversation.pk}/messages/", {"pagination": "cursor"}),
+        ]:
+            with self.subTest(path=path):
+                expected = await sync_to_async(self.client.get)(f"/api/v1/chats/{path}", params)
+                response = await self.request("get", path, data=params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["results"], expected.json()["results"])
+
+    async def test_retrieve_checks_membership(self):
+        message = (await sync_to_async(self.add_messages)(1))[0]
+        response = await self.request("get", f"messages/{message.pk}/")
+        self.assertEqual(response.json()["message_body"], "message 0")
+        response = await self.request("get", f"conversations/{self.conversation.pk}/")
+        self.assertEqual(len(response.json()["messages"]), 1)
+
+        response = await self.request("get", f"messages/{message.pk}/", user=self.eve)
+        self.assertEqual(response.status_code, 403)
+        response = await self.request("get", f"messages/{uuid.uuid4()}/", user=self.eve)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_create_goes_through_services(self):
+        path = f"conversations/{self.conversation.pk}/messages/"
+        response = await self.request(
+            "post", path, data={"message_body": "async hello"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["sender"]["user_id"], str(self.alice.pk))
+        summary = await ConversationSummary.objects.aget(conversation=self.conversation)
+        self.assertEqual(summary.last_message_snippet, "async hello")
+
+        response = await self.request(
+            "post", path, user=self.eve,
+            data={"message_body": "let me in"}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(
+        MIDDLEWARE=["chats.middleware.MetricsMiddleware"] + API_MIDDLEWARE + [
+            "chats.middleware.RequestLoggingMiddleware", "chats.middleware.AccessPolicyMiddleware",
+        ],
+        CHATS_ACCESS_POLICY=[{"path": "/api/v1/chats/", "roles": ["guest"]}],
+    )
+    async def test_chats_middleware_runs_without_thread_hops(self):
+        # Log to a scratch file, not the configured requests.log
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "requests.log")
+        handler = requestlog.QueuedRotatingFileHandler(path)
+        handler.setFormatter(requestlog.JSONFormatter())
+        self.addCleanup(handler.close)
+        logger = logging.getLogger("chats.tests.async_requests")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+        patcher = mock.patch("chats.middleware.logger", logger)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        async def view(request):
+            return HttpResponse()
+        for middleware in (MetricsMiddleware, RequestLoggingMiddleware, AccessPolicyMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(view)))
+            self.assertFalse(iscoroutinefunction(middleware(lambda request: HttpResponse())))
+
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+        response = await self.request("get", "conversations/")
+        self.assertEqual(response.status_code, 200)
+        [(key, queries)] = [
+            (key, values) for key, values in metrics.registry.snapshot().items()
+            if key[0] == "chats_db_queries_per_request"
+        ]
+        self.assertIn(("route", "api/v1/chats/async/conversations/"), key[1])
+        self.assertGreater(queries[-1], 0)  # counted in the worker thread too
+
+        admin = await sync_to_async(make_user)("root", role="admin")
+        response = await self.request("get", "conversations/", user=admin)
+        self.assertEqual(response.status_code, 403)
+
+        handler.flush()
+        with open(path) as log:
+            statuses = [json.loads(line)["status"] for line in log]
+        self.assertEqual(statuses, [200, 403])
+
+    async def test_requires_authentication(self):
+        response = await AsyncClient().get("/api/v1/chats/async/conversations/")
+        self.assertEqual(response.status_code, 401)
+
+
+class ConversationExportTests(ChatsAPITestCase):
+
+    def export(self, **params):
+        response = self.client.get(f"/api/v1/chats/conversations/{self.conversation.pk}/export/",
+                                   params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_message_in_keyset_chunks(self):
+        self.add_messages(7)
+        expected = self.client.get(
+            f"/api/v1/chats/conversations/{self.conversation.pk}/messages/", {"page_size": 100}
+        ).json()
+        with mock.patch.object(ConversationViewSet, "export_chunk_size", 3):
+            # membership probe, then one query per chunk: 3 + 3 + 1
+            with self.assertNumQueries(4):
+                body = self.export()
+        self.assertEqual([json.loads(line) for line in body.splitlines()], expected)
+
+    def test_csv(self):
+        self.add_messages(2)
+        rows = list(csv.reader(self.export(output="csv").splitlines()))
+        self.assertEqual(rows[0][:3], ["message_id", "sent_at", "sender_id"])
+        self.assertEqual([row[-1] for row in rows[1:]], ["message 0", "message 1"])
+        self.assertEqual(rows[1][3], "alice@example.com")
+
+    def test_only_participants_can_export(self):
+        self.client.force_authenticate(self.eve)
+        url = f"/api/v1/chats/conversations/{self.conversation.pk}/export/"
+        self.assertEqual(self.client.get(url).status_code, 403)
+        url = f"/api/v1/chats/conversations/{uuid.uuid4()}/export/"
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class MessageSearchTests(ChatsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        search.memory_backend.reset()  # test transactions roll the change log back
+
+    def search(self, q, **params):
+        response = self.client.get("/api/v1/chats/messages/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [m["message_body"] for m in response.json()]
+
+    def check_backend(self):
+        services.create_message(self.conversation, self.alice, "lunch at noon?")
+        services.create_message(self.conversation, self.bob, "Lunch, lunch, LUNCH!")
+        services.create_message(self.conversation, self.bob, "dinner at eight")
+        moved = services.create_message(self.conversation, self.alice, "breakfast instead")
+        outsider = services.create_conversation([self.bob, self.eve])
+        services.create_message(outsider, self.eve, "secret lunch plans")
+
+        self.assertEqual(self.search("lunch"), ["Lunch, lunch, LUNCH!", "lunch at noon?"])
+        self.assertEqual(self.search("LUNCH noon"), ["lunch at noon?"])
+        self.assertEqual(self.search("lunch", sender_id=self.alice.pk), ["lunch at noon?"])
+        self.assertEqual(self.search("\"or\" *"), [])
+
+        services.update_message(moved, "brunch at noon")
+        services.delete_message(Message.objects.get(message_body="lunch at noon?"))
+        self.assertEqual(self.search("noon"), ["brunch at noon"])
+        self.assertEqual(self.search("breakfast"), [])
+
+    @override_settings(CHATS_SEARCH_BACKEND="auto")
+    def test_sqlite_fts(self):
+        self.assertIsInstance(search.get_backend(), search.SQLiteBackend)
+        self.check_backend()
+
+    @override_settings(CHATS_SEARCH_BACKEND="memory")
+    def test_memory_index(self):
+        self.check_backend()
+
+    @override_settings(CHATS_SEARCH_BACKEND="memory")
+    def test_memory_index_scopes_before_truncating(self):
+        outsiders = services.create_conversation([self.bob, self.eve])
+        for i in range(3):
+            services.create_message(outsiders, self.eve, f"lunch lunch {i}")
+        services.create_message(self.conversation, self.bob, "lunch, maybe later")
+        with mock.patch.object(search.memory_backend, "max_results", 2):
+            self.assertEqual(self.search("lunch"), ["lunch, maybe later"])
+
+    @override_settings(CHATS_SEARCH_BACKEND="auto")
+    def test_auto_never_falls_back_to_memory(self):
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            with self.assertRaises(ImproperlyConfigured):
+                search.get_backend()
+
+    def test_backend_is_checked_at_startup(self):
+        def errors(backend, databases=("default",)):
+            with self.settings(CHATS_SEARCH_BACKEND=backend):
+                return [error.id for error in search.check_backend(databases=databases)]
+
+        self.assertEqual(errors("auto") + errors("sqlite") + errors("memory"), [])
+        self.assertEqual(errors("elastic"), ["chats.E001"])
+        self.assertEqual(errors("mysql"), ["chats.E002"])
+        with mock.patch.object(search, "sqlite_fts_supported", return_value=False):
+            self.assertEqual(errors("auto"), ["chats.E002"])
+            self.assertEqual(errors("auto", databases=None), [])
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            self.assertEqual(errors("auto") + errors("memory"), ["chats.E002"])
+        with self.settings(CHATS_SEARCH_BACKEND="elastic"):
+            with self.assertRaises(SystemCheckError):
+                call_command("check", stdout=StringIO())
+
+    def test_triggers_are_reinstalled_after_a_table_rebuild(self):
+        self.add_messages(2)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TRIGGER {search.FTS_TABLE}_ai")
+        self.add_messages(1, start=timezone.now())
+        search.ensure_sqlite_fts(connection)
+        self.assertEqual(len(self.search("message")), 3)
+
+    def test_search_needs_page_number_pagination(self):
+        response = self.client.get("/api/v1/chats/messages/", {"q": "x", "pagination": "cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+class PrimaryKeyTests(ChatsAPITestCase):
+
+    def test_uuid7_is_time_ordered(self):
+        keys = [ids.uuid7() for _ in range(5000)]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertEqual({key.version for key in keys}, {7})
+        self.assertEqual({key.variant for key in keys}, {uuid.RFC_4122})
+        milliseconds = keys[0].int >> 80
+        self.assertLess(abs(milliseconds - timezone.now().timestamp() * 1000), 5000)
+
+    def test_time_ordered_ids_are_opt_in(self):
+        self.assertEqual(ids.default_id().version, 4)
+        with self.settings(CHATS_TIME_ORDERED_IDS=True):
+            message = services.create_message(self.conversation, self.alice, "v7")
+        self.assertEqual(message.pk.version, 7)
+        response = self.client.get(f"/api/v1/chats/messages/{message.pk}/")
+        self.assertEqual(response.json()["message_id"], str(message.pk))
+
+    def test_compact_field_is_binary_on_mysql(self):
+        field = Message._meta.pk
+        mysql = mock.Mock(vendor="mysql")
+        key = uuid.uuid4()
+        self.assertEqual(field.db_type(mysql), "binary(16)")
+        self.assertEqual(Message._meta.get_field("sender").db_type(mysql), "binary(16)")
+        self.assertEqual(field.get_db_prep_value(str(key), mysql), key.bytes)
+        self.assertEqual(field.from_db_value(key.bytes, None, mysql), key)
+        self.assertEqual(field.db_type(connection), connection.data_types["UUIDField"])
+
+
+@override_settings(CHATS_ARCHIVE_AFTER_DAYS=30)
+class ArchiveTests(ChatsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old = self.add_messages(5, start=timezone.now() - timedelta(days=60))
+        self.recent = self.add_messages(4)
+        self.all_ids = [str(m.pk) for m in self.old + self.recent]
+
+    def archive(self, **options):
+        call_command("archive_messages", stdout=StringIO(), **options)
+
+    def test_batches_are_resumable(self):
+        self.archive(batch_size=2, max_batches=1)
+        self.assertEqual(ArchivedMessage.objects.count(), 2)
+        self.archive(batch_size=2)
+        self.assertEqual(ArchivedMessage.objects.count(), 5)
+        self.assertEqual(
+            set(Message.objects.values_list("pk", flat=True)), {m.pk for m in self.recent}
+        )
+
+    def test_cursor_pages_cross_into_the_archive(self):
+        self.archive(batch_size=2, max_batches=2)  # leave one old message hot
+        ids, url = [], "/api/v1/chats/messages/?pagination=cursor&page_size=3"
+        while url:
+            data = self.client.get(url).json()
+            ids += [m["message_id"] for m in data["results"]]
+            url = data["next"]
+        self.assertEqual(ids, self.all_ids)
+
+        pages, url = [], data["previous"]
+        while url:
+            data = self.client.get(url).json()
+            pages.insert(0, [m["message_id"] for m in data["results"]])
+            url = data["previous"]
+        self.assertEqual(sum(pages, []), self.all_ids[:6])
+
+    def test_page_number_lists_chain_archive_then_hot(self):
+        self.archive()
+        first = self.client.get("/api/v1/chats/messages/", {"page_size": 4}).json()
+        second = self.client.get("/api/v1/chats/messages/", {"page_size": 4, "page": 2}).json()
+        third = self.client.get("/api/v1/chats/messages/", {"page_size": 4, "page": 3}).json()
+        self.assertEqual([m["message_id"] for m in first + second + third], self.all_ids)
+        self.assertEqual(first[0]["sender"]["email"], "alice@example.com")
+
+    def test_retrieve_falls_back_to_the_archive(self):
+        self.archive()
+        url = f"/api/v1/chats/messages/{self.old[0].pk}/"
+        self.assertEqual(self.client.get(url).json()["message_body"], "message 0")
+        self.client.force_authenticate(self.eve)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_archived_retrieve_is_conditional(self):
+        self.archive()
+        url = f"/api/v1/chats/messages/{self.old[0].pk}/"
+        response = self.client.get(url)
+        self.assertIn("Last-Modified", response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_messages_of_deleted_senders_stay_readable(self):
+        gone = make_user("gone")
+        self.conversation.participants.add(gone)
+        message = Message.objects.create(
+            conversation=self.conversation, sender=gone, message_body="before I left"
+        )
+        Message.objects.filter(pk=message.pk).update(sent_at=timezone.now() - timedelta(days=90))
+        self.archive()
+        gone_id = gone.pk
+        gone.delete()
+
+        response = self.client.get(f"/api/v1/chats/messages/{message.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["sender"]["user_id"], str(gone_id))
+        self.assertEqual(response.json()["sender"]["email"], "")
+        self.assertEqual(len(self.client.get("/api/v1/chats/messages/").json()), 10)
+
+    def test_archived_messages_keep_counting(self):
+        rebuild_summaries([self.conversation.pk])
+        receipts.recount([self.conversation.pk])
+        token = self.client.get("/api/v1/chats/messages/sync/").data["token"]
+        self.archive(older_than_days=0)  # the whole conversation
+        self.assertFalse(Message.objects.exists())
+
+        for rebuilt in (False, True):
+            if rebuilt:
+                rebuild_summaries([self.conversation.pk])
+                receipts.recount([self.conversation.pk])
+            summary = ConversationSummary.objects.get(conversation=self.conversation)
+            self.assertEqual(summary.message_count, 9)
+            self.assertEqual(summary.last_message_id, self.recent[-1].pk)
+            self.assertEqual(summary.last_message_snippet, "message 3")
+            link = ConversationParticipant.objects.get(conversation=self.conversation, user=self.bob)
+            self.assertEqual(link.unread_count, 9)
+
+        data = self.client.get("/api/v1/chats/messages/sync/", {"token": token}).data
+        self.assertEqual([m["message_id"] for m in data["archived"]], self.all_ids)
+        self.assertEqual((data["created"], data["deleted"]), ([], []))
+
+    def test_export_starts_with_the_archive(self):
+        self.archive(batch_size=2, max_batches=2)
+        url = f"/api/v1/chats/conversations/{self.conversation.pk}/export/"
+        with mock.patch.object(ConversationViewSet, "export_chunk_size", 2):
+            lines = b"".join(self.client.get(url).streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["message_id"] for line in lines], self.all_ids)
+
+    def test_archive_is_ignored_when_disabled(self):
+        self.archive()
+        with self.settings(CHATS_ARCHIVE_AFTER_DAYS=None):
+            data = self.client.get("/api/v1/chats/messages/").json()
+            self.assertEqual(len(data), 4)
+            url = f"/api/v1/chats/messages/{self.old[0].pk}/"
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class FindOrCreateConversationTests(ChatsAPITestCase):
+
+    url = "/api/v1/chats/conversations/find-or-create/"
+
+    def test_resolves_the_same_conversation_with_one_lookup(self):
+        response = self.client.post(self.url, {"participant_ids": [str(self.eve.pk)]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        conversation_id = response.json()["conversation_id"]
+        emails = {p["email"] for p in response.json()["participants"]}
+        self.assertEqual(emails, {"alice@example.com", "eve@example.com"})
+
+        # the requester may list themselves; order and duplicates don't matter
+        self.client.force_authenticate(self.eve)
+        ids = [str(self.alice.pk), str(self.eve.pk), str(self.alice.pk)]
+        with self.assertNumQueries(1):
+            _, created = services.find_or_create_conversation([self.eve, self.alice])
+        response = self.client.post(self.url, {"participant_ids": ids}, format="json")
+        self.assertEqual((response.status_code, response.json()["conversation_id"]),
+                         (200, conversation_id))
+        self.assertFalse(created)
+
+    def test_participant_rows_are_inserted_in_bulk(self):
+        users = [make_user(f"member{i}") for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            conversation = services.create_conversation(users)
+        inserts = [q["sql"].split(" (")[0] for q in queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(inserts, [
+            'INSERT INTO "chats_conversation"',
+            'INSERT INTO "chats_conversation_participants"',
+            'INSERT INTO "chats_conversationsummary"',
+        ])
+        self.assertEqual(len(queries), len(inserts) + 4)  # and two savepoints
+        self.assertEqual(conversation.participants.count(), 5)
+
+    def test_hash_follows_participant_changes(self):
+        first = services.create_conversation([self.alice, self.eve])
+        second = services.create_conversation([self.alice, self.eve])
+        self.assertIsNone(second.participant_hash)  # first already holds the set
+        self.assertEqual(services.find_or_create_conversation([self.eve, self.alice])[0], first)
+
+        services.update_participants(first, [self.alice, self.bob, self.eve])
+        self.assertEqual(
+            services.find_or_create_conversation([self.alice, self.bob, self.eve]), (first, False)
+        )
+        conversation, _ = services.find_or_create_conversation([self.alice, self.eve])
+        self.assertNotEqual(conversation, first)
+
+    def test_unknown_participants_are_rejected(self):
+        response = self.client.post(
+            self.url, {"participant_ids": [str(uuid.uuid4())]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {"participant_ids": "nope"}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ReadReceiptTests(ChatsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = services.create_conversation([self.alice, self.bob, self.eve])
+
+    def url(self, suffix=""):
+        return f"/api/v1/chats/conversations/{self.conversation.pk}/{suffix}"
+
+    def unread(self, user):
+        return self.conversation.participant_links.get(user=user).unread_count
+
+    def test_counters_follow_message_writes(self):
+        services.create_message(self.conversation, self.bob, "one")
+        services.create_message(self.conversation, self.eve, "two")
+        last = services.create_message(self.conversation, self.bob, "three")
+        self.assertEqual(
+            [self.unread(user) for user in (self.alice, self.bob, self.eve)], [3, 0, 1]
+        )
+        services.create_messages([
+            Message(conversation=self.conversation, sender=self.alice, message_body="four"),
+            Message(conversation=self.conversation, sender=self.eve, message_body="five"),
+        ])
+        self.assertEqual(
+            [self.unread(user) for user in (self.alice, self.bob, self.eve)], [1, 2, 0]
+        )
+        services.delete_message(last)  # already read by eve and alice, unread by nobody else
+        services.delete_message(Message.objects.get(message_body="five"))
+        self.assertEqual(
+            [self.unread(user) for user in (self.alice, self.bob, self.eve)], [0, 1, 0]
+        )
+
+        expected = {user.pk: self.unread(user) for user in (self.alice, self.bob, self.eve)}
+        ConversationParticipant.objects.update(unread_count=7)
+        receipts.recount([self.conversation.pk])
+        self.assertEqual(
+            {user.pk: self.unread(user) for user in (self.alice, self.bob, self.eve)}, expected
+        )
+
+    def test_mark_read_is_one_update_and_shows_on_the_list(self):
+        services.create_message(self.conversation, self.bob, "hi")
+        latest = services.create_message(self.conversation, self.eve, "hello")
+        first = self.client.get("/api/v1/chats/conversations/")
+        self.assertEqual(first.json()["results"][0]["unread_count"], 2)
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(3):
+            response = self.client.post(self.url("read/"))  # UPDATE (+ savepoint, release)
+        self.assertEqual(response.status_code, 204)
+        state = self.client.get(self.url("read/")).json()
+        self.assertEqual((state["unread_count"], state["last_read_message_id"]),
+                         (0, str(latest.pk)))
+        self.assertEqual(len(state["receipts"]), 3)
+
+        second = self.client.get(
+            "/api/v1/chats/conversations/", HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["results"][0]["unread_count"], 0)
+        self.assertEqual(second.json()["results"][0]["last_read_at"],
+                         state["last_read_at"])
+        with self.settings(CHATS_FAST_SERIALIZATION=False):
+            cache.clear()
+            slow = self.client.get("/api/v1/chats/conversations/").json()
+        self.assertEqual(slow, second.json())
+        self.assertNotIn("unread_count", self.client.get(self.url()).json())
+
+    def test_new_members_start_with_history_read(self):
+        services.create_message(self.conversation, self.bob, "before")
+        carol = make_user("carol")
+        services.update_participants(self.conversation, [self.alice, self.bob, self.eve, carol])
+        services.create_message(self.conversation, self.bob, "after")
+        self.assertEqual((self.unread(carol), self.unread(self.alice)), (1, 2))
+
+    def test_outsiders_get_403(self):
+        self.client.force_authenticate(make_user("mallory"))
+        self.assertEqual(self.client.post(self.url("read/")).status_code, 403)
+        self.assertEqual(self.client.get(self.url("read/")).status_code, 403)
+        missing = f"/api/v1/chats/conversations/{uuid.uuid4()}/read/"
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+class CompressionTests(ChatsAPITestCase):
+
+    body = "A long report. " * 400 + "zebra"
+
+    def stored(self, model, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT message_body FROM {model._meta.db_table} WHERE {model._meta.pk.column} = %s",
+                [pk.hex],
+            )
+            return cursor.fetchone()[0]
+
+    def test_large_bodies_are_stored_compressed_and_read_lazily(self):
+        message = services.create_message(self.conversation, self.alice, self.body)
+        stored = self.stored(Message, message.pk)
+        self.assertTrue(stored.startswith(compression.MARKER))
+        self.assertLess(len(stored), len(self.body) // 10)
+
+        body = Message.objects.get(pk=message.pk).message_body
+        self.assertIsInstance(body, compression.CompressedText)
+        self.assertFalse(body.inflated)
+        self.assertEqual(body, self.body)
+        self.assertEqual(self.client.get(f"/api/v1/chats/messages/{message.pk}/").json()[
+            "message_body"], self.body)
+        self.assertEqual(self.client.get("/api/v1/chats/messages/").json()[0][
+            "message_body"], self.body)
+        self.assertEqual(Message.objects.filter(message_body=self.body).get(), message)
+
+    def test_reverse_migration_inflates_in_batches(self):
+        migration = importlib.import_module("chats.migrations.0011_compressed_bodies")
+        messages = [
+            services.create_message(self.conversation, self.alice, f"{self.body} {i}")
+            for i in range(5)
+        ]
+        # The SQLite schema editor cannot open inside the test's transaction
+        schema_editor = mock.Mock(connection=connection, quote_name=connection.ops.quote_name)
+        with mock.patch.object(migration, "BATCH_SIZE", 2):
+            migration.inflate_bodies(django_apps, schema_editor)
+        for i, message in enumerate(messages):
+            self.assertEqual(self.stored(Message, message.pk), f"{self.body} {i}")
+
+    def test_small_and_unusual_bodies_round_trip(self):
+        for text in ("short", "\x01z not really compressed", "\x01"):
+            message = services.create_message(self.conversation, self.alice, text)
+            self.assertEqual(Message.objects.get(pk=message.pk).message_body, text)
+        with self.settings(CHATS_COMPRESS_BODIES_OVER=None):
+            message = services.create_message(self.conversation, self.alice, self.body)
+        self.assertEqual(self.stored(Message, message.pk), self.body)
+        self.assertIsNone(Message._meta.get_field("message_body").get_db_prep_value(
+            None, connection))
+        mysql = mock.Mock(vendor="mysql")
+        self.assertEqual(Message._meta.get_field("message_body").get_db_prep_value(
+            self.body, mysql), self.body)
+
+    @override_settings(CHATS_SEARCH_BACKEND="auto")
+    def test_search_sees_compressed_bodies(self):
+        message = services.create_message(self.conversation, self.alice, self.body)
+        services.create_message(self.conversation, self.bob, "zebra crossing")
+        found = self.client.get("/api/v1/chats/messages/", {"q": "zebra report"}).json()
+        self.assertEqual([m["message_id"] for m in found], [str(message.pk)])
+
+        services.update_message(message, self.body.replace("zebra", "giraffe"))
+        self.assertEqual(len(self.client.get("/api/v1/chats/messages/", {"q": "zebra"}).json()), 1)
+        search.ensure_sqlite_fts(connection, rebuild=True)
+        self.assertEqual(len(self.client.get("/api/v1/chats/messages/", {"q": "giraffe"}).json()), 1)
+        services.delete_message(message)
+        self.assertEqual(self.client.get("/api/v1/chats/messages/", {"q": "giraffe"}).json(), [])
+
+    def test_rewrite_compresses_existing_rows_and_reports_savings(self):
+        with self.settings(CHATS_COMPRESS_BODIES_OVER=None):
+            old = services.create_message(self.conversation, self.alice, self.body)
+        self.add_messages(3)
+        out = StringIO()
+        call_command("compress_message_bodies", rewrite=True, batch_size=2, stdout=out)
+        self.assertIn("chats_message: compressed 1 bodies.", out.getvalue())
+        self.assertTrue(self.stored(Message, old.pk).startswith(compression.MARKER))
+
+        report = compression.storage_report(connection, Message._meta.db_table)
+        self.assertEqual((report["rows"], report["compressed"]), (4, 1))
+        self.assertGreater(report["saved_bytes"], len(self.body) * 9 // 10)
+
+    @override_settings(CHATS_ARCHIVE_AFTER_DAYS=30)
+    def test_archived_bodies_stay_compressed(self):
+        message = services.create_message(self.conversation, self.alice, self.body)
+        Message.objects.filter(pk=message.pk).update(sent_at=timezone.now() - timedelta(days=60))
+        call_command("archive_messages", stdout=StringIO())
+        self.assertTrue(self.stored(ArchivedMessage, message.pk).startswith(compression.MARKER))
+        response = self.client.get(f"/api/v1/chats/messages/{message.pk}/")
+        self.assertEqual(response.json()["message_body"], self.body)
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitTests(TestCase):
+
+    def test_sliding_window_weights_the_previous_window(self):
+        clock = FakeClock(600.0)  # start of a 60s window
+        limiter = ratelimit.SlidingWindowLimiter(clock=clock)
+        self.assertEqual([limiter.hit("ip", 4, 60) for _ in range(5)], [None] * 4 + [60])
+        clock.now += 60 + 30  # half of the previous window still counts: 4 * 0.5
+        self.assertEqual([limiter.hit("ip", 4, 60) for _ in range(3)], [None, None, 30])
+        clock.now += 120  # both windows have passed
+        self.assertIsNone(limiter.hit("ip", 4, 60))
+
+    def test_idle_keys_are_evicted_least_recently_used_first(self):
+        limiter = ratelimit.SlidingWindowLimiter(max_keys=2, clock=FakeClock())
+        limiter.hit("a", 1, 60)
+        limiter.hit("b", 1, 60)
+        self.assertEqual(limiter.hit("a", 1, 60), 20)  # still limited; "a" is now most recent
+        limiter.hit("c", 1, 60)
+        self.assertEqual((list(limiter.counters), limiter.evictions), (["a", "c"], 1))
+
+    @override_settings(CHATS_ACCESS_POLICY=[], CHATS_RATE_LIMITS=[
+        {"path": "/api/v1/chats/auth/", "limit": None},
+        {"path": "/api/v1/chats/messages/", "methods": ["post"], "limit": 2, "window": 60},
+        {"path": "/api/v1/chats/", "methods": ["POST", "PUT"], "limit": 1, "window": 60},
+    ])
+    def test_rules_match_by_path_and_method(self):
+        middleware = AccessPolicyMiddleware(lambda request: HttpResponse("ok"))
+        factory = RequestFactory()
+
+        def statuses(method, path, count):
+            return [middleware(getattr(factory, method)(path)).status_code for _ in range(count)]
+
+        self.assertEqual(statuses("post", "/api/v1/chats/messages/", 3), [200, 200, 429])
+        self.assertEqual(statuses("put", "/api/v1/chats/conversations/", 2), [200, 429])
+        self.assertEqual(statuses("get", "/api/v1/chats/conversations/", 3), [200] * 3)
+        self.assertEqual(statuses("post", "/api/v1/chats/auth/token/", 3), [200] * 3)
+        response = middleware(factory.post("/api/v1/chats/messages/"))
+        self.assertTrue(1 <= int(response["Retry-After"]) <= 60)
+        other = factory.post("/api/v1/chats/messages/", REMOTE_ADDR="10.0.0.9")
+        self.assertEqual(middleware(other).status_code, 200)
+
+
+class SharedRateLimitStoreTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def stores(self, clock):
+        return {
+            "mmap": ratelimit.MmapStore(os.path.join(self.directory, "mmap"), 64, clock=clock),
+            "sqlite": ratelimit.SQLiteStore(os.path.join(self.directory, "sqlite"), clock=clock),
+        }
+
+    def test_stores_share_counters_between_processes(self):
+        context = multiprocessing.get_context("fork")
+        for name, store in self.stores(FakeClock(600.0)).items():
+            with self.subTest(store=name):
+                start, results = context.Event(), context.Queue()
+
+                def worker():
+                    start.wait()
+                    results.put(sum(store.hit("ip", 50, 60) is None for _ in range(40)))
+
+                workers = [context.Process(target=worker) for _ in range(4)]
+                for process in workers:
+                    process.start()
+                start.set()
+                allowed = sum(results.get(timeout=30) for _ in workers)
+                for process in workers:
+                    process.join()
+                self.assertEqual(allowed, 50)  # 160 attempts, exactly the limit let through
+                self.assertEqual(store.hit("ip", 50, 60), 60)
+
+    def test_stores_slide_like_the_memory_limiter(self):
+        clock = FakeClock(600.0)
+        stores = {"memory": ratelimit.SlidingWindowLimiter(clock=clock), **self.stores(clock)}
+        with self.settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        }):
+            stores["cache"] = ratelimit.CacheStore(clock=clock)
+            seen = {name: [] for name in stores}
+            for step in (0, 90, 120):
+                clock.now += step
+                for name, store in stores.items():
+                    seen[name].append([store.hit(("ip", 1), 4, 60) for _ in range(5)])
+        self.assertEqual(seen["memory"], [
+            [None] * 4 + [60], [None, None, 30, 30, 30], [None] * 4 + [30],
+        ])
+        for name in ("cache", "mmap", "sqlite"):
+            self.assertEqual(seen[name], seen["memory"], name)
+
+    def test_cache_rollback_of_an_evicted_key_is_a_no_op(self):
+        store = ratelimit.CacheStore(clock=FakeClock(600.0))
+        with self.settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        }):
+            self.assertIsNone(store.hit("ip", 1, 60))
+            evicted = ValueError("Key not found.")
+            with mock.patch.object(caches["default"], "decr", side_effect=evicted) as decr:
+                self.assertEqual(store.hit("ip", 1, 60), 60)
+            decr.assert_called_once()
+
+    def test_mmap_slot_collisions_evict(self):
+        store = ratelimit.MmapStore(os.path.join(self.directory, "mmap"), 1, clock=FakeClock())
+        self.assertEqual([store.hit("a", 1, 60), store.hit("a", 1, 60)], [None, 20])
+        self.assertIsNone(store.hit("b", 1, 60))  # takes "a"'s only slot
+        self.assertIsNone(store.hit("a", 1, 60))
+
+    @override_settings(CHATS_RATE_LIMIT_STORE="sqlite")
+    def test_store_is_chosen_by_setting(self):
+        path = os.path.join(self.directory, "limits")
+        with self.settings(CHATS_RATE_LIMIT_PATH=path):
+            store = ratelimit.get_store()
+        self.assertIsInstance(store, ratelimit.SQLiteStore)
+        self.assertEqual(store.path, path)
+
+
+class RequestLogTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "requests.log")
+
+    def handler(self, **options):
+        handler = requestlog.QueuedRotatingFileHandler(self.path, **options)
+        handler.setFormatter(requestlog.JSONFormatter())
+        self.addCleanup(handler.close)
+        return handler
+
+    def middleware(self, handler, status=200):
+        logger = logging.getLogger(f"chats.tests.requests.{id(handler)}")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+        middleware = RequestLoggingMiddleware(lambda request: HttpResponse(status=status))
+        middleware.logger = logger
+        return middleware
+
+    def lines(self, path=None):
+        with open(path or self.path) as log:
+            return [json.loads(line) for line in log]
+
+    def test_requests_are_written_as_json_lines(self):
+        handler = self.handler()
+        middleware = self.middleware(handler)
+        request = RequestFactory().get("/api/v1/chats/conversations/?page=2")
+        request.user = CustomUser(username="alice")
+        middleware(request)
+        handler.flush()
+        [line] = self.lines()
+        self.assertEqual(
+            {key: line[key] for key in ("level", "message", "method", "path", "status", "user")},
+            {"level": "INFO", "message": "request", "method": "GET",
+             "path": "/api/v1/chats/conversations/?page=2", "status": 200, "user": "alice"},
+        )
+        self.assertGreaterEqual(line["duration_ms"], 0)
+        self.assertTrue(line["time"].endswith("+00:00"))
+
+    @override_settings(CHATS_REQUEST_LOG_SAMPLE_RATE=0)
+    def test_sampling_keeps_server_errors(self):
+        handler = self.handler()
+        factory = RequestFactory()
+        for status in (200, 404, 503):
+            self.middleware(handler, status)(factory.get("/"))
+        handler.flush()
+        self.assertEqual([line["status"] for line in self.lines()], [503])
+
+    def test_file_rotates_by_size(self):
+        handler = self.handler(max_bytes=400, backup_count=2, batch_size=1)
+        logger = self.middleware(handler).logger
+        for number in range(20):
+            logger.info("request %d", number)
+        handler.flush()
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(self.path))),
+            ["requests.log", "requests.log.1", "requests.log.2"],
+        )
+        self.assertLessEqual(os.path.getsize(self.path), 400)
+        self.assertEqual(self.lines()[-1]["message"], "request 19")
+        self.assertEqual(
+            int(self.lines(self.path + ".1")[-1]["message"].split()[1]) + 1,
+            int(self.lines()[0]["message"].split()[1]),
+        )
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = self.handler(queue_size=1)
+        logger = self.middleware(handler).logger
+        slow_disk = mock.patch.object(
+            requestlog.RotatingFile, "write", lambda self, text: threading.Event().wait(0.2)
+        )
+        with slow_disk:
+            for number in range(50):
+                logger.info("request %d", number)
+            self.assertGreater(handler.dropped, 0)
+            handler.flush()
+
+
+@override_settings(MIDDLEWARE=["chats.middleware.MetricsMiddleware"] + API_MIDDLEWARE)
+class MetricsTests(ChatsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def scrape(self):
+        client = APIClient()
+        client.force_authenticate(CustomUser(username="ops", is_staff=True))
+        response = client.get("/api/v1/chats/metrics/")
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def sample(self, text, name, **labels):
+        for line in text.splitlines():
+            series, _, value = line.rpartition(" ")
+            if series.startswith(name + "{") and all(
+                f'{key}="{value}"' in series for key, value in labels.items()
+            ):
+                return float(value)
+        return None
+
+    def test_requests_are_recorded_per_route(self):
+        self.add_messages(2)
+        url = f"/api/v1/chats/messages/{Message.objects.first().pk}/"
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get(f"/api/v1/chats/messages/{uuid.uuid4()}/")
+        self.client.get("/nowhere/")
+
+        text = self.scrape()
+        self.assertIn("# TYPE chats_http_request_duration_seconds histogram", text)
+        [route] = {
+            series.split('route="')[1].split('"')[0]
+            for series in text.splitlines()
+            if series.startswith("chats_http_requests_total") and "messages/" in series
+        }
+        self.assertIn("messages/", route)
+        self.assertEqual(self.sample(text, "chats_http_requests_total", status="200"), 2)
+        self.assertEqual(self.sample(text, "chats_http_requests_total", status="404",
+                                     route=route), 1)
+        self.assertEqual(self.sample(text, "chats_http_requests_total",
+                                     route=metrics.UNRESOLVED), 1)
+        self.assertEqual(self.sample(text, "chats_http_request_duration_seconds_count",
+                                     route=route), 3)
+        self.assertGreater(self.sample(text, "chats_db_queries_per_request_sum", route=route), 0)
+        self.assertGreater(self.sample(text, "chats_db_duration_seconds_sum", route=route), 0)
+        self.assertEqual(self.sample(text, "chats_http_response_size_bytes_bucket",
+                                     route=route, le="+Inf"), 3)
+
+    @override_settings(CHATS_METRICS_TOKEN="scrape-secret")
+    def test_only_staff_and_the_scrape_token_can_read(self):
+        url = "/api/v1/chats/metrics/"
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(APIClient().get(url).status_code, 403)
+        response = APIClient().get(url, HTTP_AUTHORIZATION="Bearer scrape-secret")
+        self.assertEqual(response.status_code, 200)
+        response = APIClient().get(url, HTTP_AUTHORIZATION="Bearer guess")
+        self.assertEqual(response.status_code, 403)
+        self.assertIn("chats_http_requests_total", self.scrape())
+
+    @override_settings(
+        CHATS_METRICS_TOKEN="scrape-secret",
+        MIDDLEWARE=["chats.middleware.AccessPolicyMiddleware"] + API_MIDDLEWARE,
+    )
+    def test_token_scrapes_pass_the_shipped_access_policy_at_night(self):
+        night = timezone.localtime().replace(hour=23, minute=0)
+        with mock.patch("chats.middleware.datetime") as clock:
+            clock.now.return_value = night
+            client = APIClient()
+            response = client.get(
+                "/api/v1/chats/metrics/", HTTP_AUTHORIZATION="Bearer scrape-secret"
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(client.get("/api/v1/chats/metrics/").status_code, 403)
+            # the rest of the API is still closed at night
+            response = client.get("/api/v1/chats/conversations/")
+            self.assertIn(b"restricted", response.content)
+
+    def test_render_is_cumulative_and_escaped(self):
+        metrics.registry.record('a"b', "GET", 200, 0.02, 100, 0, 0.0)
+        metrics.registry.record('a"b', "GET", 200, 3.0, 5000, 4, 0.01)
+        text = metrics.render(metrics.registry.snapshot())
+        labels = 'route="a\\"b",method="GET"'
+        for line in (
+            f'chats_http_request_duration_seconds_bucket{{{labels},le="0.01"}} 0',
+            f'chats_http_request_duration_seconds_bucket{{{labels},le="0.025"}} 1',
+            f'chats_http_request_duration_seconds_bucket{{{labels},le="2.5"}} 1',
+            f'chats_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            f'chats_http_request_duration_seconds_sum{{{labels}}} 3.02',
+            f'chats_db_queries_per_request_bucket{{{labels},le="0"}} 1',
+            f'chats_http_requests_total{{{labels},status="200"}} 2',
+        ):
+            self.assertIn(line, text)
+
+    def test_scrape_adds_up_worker_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        context = multiprocessing.get_context("fork")
+        with self.settings(CHATS_METRICS_DIR=directory.name):
+            metrics.registry.record("route", "GET", 200, 0.01, 10, 1, 0.001)
+
+            def worker():
+                metrics.registry.record("route", "GET", 200, 0.01, 10, 1, 0.001)
+                metrics.registry.record("route", "POST", 201, 0.01, 10, 1, 0.001)
+                metrics.registry.flush()
+
+            workers = [context.Process(target=worker) for _ in range(2)]
+            for process in workers:
+                process.start()
+            for process in workers:
+                process.join()
+            metrics.registry.flush()  # our own snapshot is skipped: live totals are used
+            metrics.registry.record("route", "GET", 200, 0.01, 10, 1, 0.001)
+            text = metrics.render(metrics.registry.collect())
+
+        self.assertEqual(len(os.listdir(directory.name)), 3)
+        self.assertEqual(self.sample(text, "chats_http_requests_total", method="GET"), 4)
+        self.assertEqual(self.sample(text, "chats_http_requests_total", method="POST"), 2)
+        self.assertEqual(self.sample(text, "chats_http_request_duration_seconds_count",
+                                     method="GET"), 4)
+
+
+@override_settings(
+    CHATS_ACCESS_POLICY=[
+        {"path": "/api/v1/chats/", "hours": ["06:00", "21:00"], "roles": ["admin"]},
+        {"path": "/api/v1/chats/auth/", "roles": None},
+        {"path": "/api/v1/chats/status/", "hours": None, "roles": None},
+        {"path": "/api/v1/chats/night/", "hours": ["22:00", "02:00"]},
+    ],
+    CHATS_RATE_LIMITS=[{"path": "/api/v1/chats/", "methods": ["POST"], "limit": 1}],
+)
+class AccessPolicyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user("root", role="admin")
+        cls.guest = make_user("guest")
+
+    def setUp(self):
+        self.calls = 0
+
+        def view(request):
+            self.calls += 1
+            return HttpResponse("ok")
+
+        self.middleware = AccessPolicyMiddleware(view)
+        self.middleware.limiter = ratelimit.SlidingWindowLimiter(clock=FakeClock())
+        self.at("12:00")
+        self.factory = RequestFactory()
+
+    def at(self, moment):
+        now = timezone.localtime().replace(
+            hour=int(moment[:2]), minute=int(moment[3:]), second=0, microsecond=0
+        )
+        self.middleware.now = lambda: now
+
+    def request(self, method, path, user=None, **extra):
+        request = getattr(self.factory, method)(path, **extra)
+        request.user = user or AnonymousUser()
+        return self.middleware(request)
+
+    def test_checks_are_merged_per_path_and_method(self):
+        path = "/api/v1/chats/conversations/"
+        self.assertEqual(self.request("get", path, self.admin).status_code, 200)
+        response = self.request("get", path, self.guest)
+        self.assertEqual((response.status_code, response.content),
+                         (403, b"You do not have permission to perform this action."))
+        self.assertEqual(self.request("get", path).status_code, 403)
+        # auth/ lifts the role check but keeps the hours and the rate limit
+        self.assertEqual(self.request("post", "/api/v1/chats/auth/login/").status_code, 200)
+        self.assertEqual(self.request("post", "/api/v1/chats/auth/login/").status_code, 429)
+        self.at("23:00")
+        self.assertEqual(self.request("post", "/api/v1/chats/auth/login/").status_code, 403)
+        self.assertEqual(self.request("get", "/api/v1/chats/status/").status_code, 200)
+
+    def test_hours_may_wrap_past_midnight(self):
+        path = "/api/v1/chats/night/"
+        for moment, expected in (("23:30", 200), ("01:00", 200), ("12:00", 403)):
+            self.at(moment)
+            with self.subTest(moment=moment):
+                self.assertEqual(self.request("get", path, self.admin).status_code, expected)
+
+    def test_jwt_bearer_users_get_their_role(self):
+        token = AccessToken.for_user(self.admin)
+        response = self.request("get", "/api/v1/chats/conversations/",
+                                HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, 200)
+        response = self.request("get", "/api/v1/chats/conversations/",
+                                HTTP_AUTHORIZATION="Bearer not-a-token")
+        self.assertEqual(response.status_code, 403)
+
+    def test_paths_outside_every_rule_skip_the_checks(self):
+        self.at("03:00")
+        for path in ("/admin/", "/static/app.css", "/api/v2/"):
+            self.assertIsNone(self.middleware.policy.match("GET", path))
+            self.assertEqual(self.request("post", path).status_code, 200)
+        self.assertEqual(self.calls, 3)
+
+    def test_unknown_rule_keys_are_rejected(self):
+        with self.settings(CHATS_ACCESS_POLICY=[{"path": "/", "role": ["admin"]}]):
+            with self.assertRaisesMessage(ValueError, "['role']"):
+                AccessPolicyMiddleware(lambda request: HttpResponse())
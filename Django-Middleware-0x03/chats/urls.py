@@ -1,8 +1,10 @@
 from django.urls import path, include
 from rest_framework import routers
 from rest_framework_nested.routers import NestedDefaultRouter
+from . import async_views
 from .auth import JWTLoginView
-from .views import ConversationViewSet, MessageViewSet, StatusViewSet
+from .streams import message_stream
+from .views import ConversationViewSet, MessageViewSet, MetricsViewSet, StatusViewSet
 from rest_framework_simplejwt.views import TokenRefreshView
 
 # Main router
@@ -10,6 +12,7 @@ router = routers.DefaultRouter()
 router.register('conversations', ConversationViewSet, basename='conversation')
 router.register('messages', MessageViewSet, basename='message')
 router.register(r'status', StatusViewSet, basename='status')
+router.register(r'metrics', MetricsViewSet, basename='metrics')
 
 # Nested routes
 nested = NestedDefaultRouter(router, 'conversations', lookup='conversation')
@@ -19,6 +22,18 @@ urlpatterns = [
     path('', include(router.urls)),
     path('', include(nested.urls)),
 
+    # Native async variants of the read/create endpoints (see chats/async_views.py)
+    path('async/conversations/', async_views.conversations, name='async_conversations'),
+    path('async/conversations/<str:pk>/', async_views.conversation_detail,
+         name='async_conversation_detail'),
+    path('async/conversations/<str:conversation_pk>/messages/', async_views.messages,
+         name='async_conversation_messages'),
+    path('async/messages/', async_views.messages, name='async_messages'),
+    path('async/messages/<str:pk>/', async_views.message_detail, name='async_message_detail'),
+
+    # Server-Sent Events (served as an async view; needs ASGI to scale)
+    path('stream/', message_stream, name='message_stream'),
+
     # JWT Authentication
     path('auth/login/', JWTLoginView.as_view(), name='jwt_login'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
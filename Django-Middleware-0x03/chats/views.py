@@ -1,15 +1,29 @@
 #!/usr/bin/env python3
 """Messaging app ViewSets with full CRUD and permissions."""
 
+import uuid
+
+from django.db.models import F, Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound, ValidationError, PermissionDenied
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.settings import api_settings
 
-from .models import CustomUser, Conversation, Message
+from . import (
+    archive, conditional, export, fastpath, inbox_cache, metrics, receipts, search, services,
+    sync,
+)
+from .models import CustomUser, Conversation, ConversationParticipant, Message, MessageChangeKind
 from .serializers import ConversationSerializer, MessageSerializer
-from .permissions import IsParticipantOfConversation
-from .pagination import MessagePagination
+from .auth import MetricsTokenAuthentication
+from .permissions import (
+    CanReadMetrics, IsParticipantOfConversation, is_participant, load_memberships,
+    remember_memberships,
+)
+from .pagination import ConversationPagination, MessageCursorPagination, get_message_paginator
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import MessageFilter, ConversationFilter
 
@@ -21,6 +35,14 @@ from .filters import MessageFilter, ConversationFilter
 class ConversationViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
+    # Messages embedded per conversation in list responses (?preview=N).
+    # The full history is served by the message endpoints.
+    message_preview_size = 3
+    max_message_preview_size = 20
+
+    # Rows per keyset chunk when streaming an export
+    export_chunk_size = 2000
+
     def get_permissions(self):
         """
         Apply IsParticipantOfConversation for object-level access.
@@ -33,26 +55,84 @@ class ConversationViewSet(viewsets.ViewSet):
     # GET /conversations/
     # -----------------------
     def list(self, request):
+        validators = conditional.get_validators(request)
+        cached = conditional.not_modified(request, validators)
+        if cached is not None:
+            return cached
+
+        data = inbox_cache.get_or_build(request, lambda: self.build_list(request).data)
+        return conditional.with_validators(Response(data), validators)
+
+    def build_list(self, request):
         user = request.user
-        queryset = Conversation.objects.prefetch_related(
-            "participants", "messages__sender"
-        ).filter(participants=user)  # only conversations where user is a participant
+        # only conversations where user is a participant, with their read state
+        queryset = receipts.with_read_state(Conversation.objects.all(), user)
 
         participant_id = request.query_params.get("participant_id")
         if participant_id:
             queryset = queryset.filter(participants__user_id=participant_id)
 
-        serializer = ConversationSerializer(queryset, many=True)
-        return Response(serializer.data)
+        queryset = queryset.order_by(
+            F("summary__last_message_at").desc(nulls_last=True),
+            "-created_at",
+            "conversation_id",
+        )
+        preview_size = self.get_preview_size(request)
+        paginator = ConversationPagination()
+
+        if fastpath.enabled():
+            page = paginator.paginate_queryset(
+                fastpath.conversation_values(queryset, read_state=True), request
+            )
+            # The queryset is participant-scoped: every row is a known membership
+            remember_memberships(request, [row["conversation_id"] for row in page])
+            return paginator.get_paginated_response(
+                fastpath.conversation_rows(page, preview_size)
+            )
+
+        page = paginator.paginate_queryset(
+            queryset.select_related("summary").prefetch_related(
+                Prefetch("participants", queryset=CustomUser.objects.order_by("user_id")),
+                self.get_message_preview(preview_size),
+            ),
+            request,
+        )
+        remember_memberships(request, [conversation.pk for conversation in page])
+
+        serializer = ConversationSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def get_preview_size(self, request):
+        try:
+            size = int(request.query_params.get("preview", self.message_preview_size))
+        except ValueError:
+            size = self.message_preview_size
+        return max(0, min(size, self.max_message_preview_size))
+
+    def get_message_preview(self, size):
+        """
+        Prefetch the newest ``size`` messages of every conversation on the page.
+
+        A sliced Prefetch is resolved by Django with a single
+        ROW_NUMBER() OVER (PARTITION BY conversation_id) query.
+        """
+        recent = Message.objects.select_related("sender").order_by("-sent_at", "-message_id")
+        recent = recent[:size] if size else Message.objects.none()
+        return Prefetch("messages", queryset=recent, to_attr="recent_messages")
 
 
     # -----------------------
     # GET /conversations/<id>/
     # -----------------------
     def retrieve(self, request, pk=None):
+        validators = conditional.get_validators(request, scoped=True, pk=pk)
+        cached = conditional.not_modified(request, validators)
+        if cached is not None:
+            return cached
+
         conversation = self.get_object(pk)
         serializer = ConversationSerializer(conversation)
-        return Response(serializer.data)
+        return conditional.with_validators(Response(serializer.data), validators)
 
     # -----------------------
     # POST /conversations/
@@ -62,13 +142,74 @@ class ConversationViewSet(viewsets.ViewSet):
         if not participant_ids:
             raise ValidationError({"participant_ids": "This field is required."})
 
-        conversation = Conversation.objects.create()
         participants = CustomUser.objects.filter(user_id__in=participant_ids)
-        conversation.participants.set(participants)
+        conversation = services.create_conversation(participants)
 
         serializer = ConversationSerializer(conversation)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    # -----------------------
+    # POST /conversations/find-or-create/
+    # -----------------------
+    @action(detail=False, methods=["post"], url_path="find-or-create")
+    def find_or_create(self, request):
+        """
+        The conversation between the requester and ``participant_ids``
+        (exactly those users), created if it does not exist yet: 200 with
+        the existing conversation, 201 with a new one.
+        """
+        participant_ids = request.data.get("participant_ids")
+        if not isinstance(participant_ids, list):
+            raise ValidationError({"participant_ids": "Expected a list of user ids."})
+        try:
+            user_ids = {uuid.UUID(str(user_id)) for user_id in participant_ids}
+        except ValueError:
+            raise ValidationError({"participant_ids": "Expected a list of user ids."})
+
+        participants = list(CustomUser.objects.filter(user_id__in=user_ids))
+        missing = user_ids - {user.pk for user in participants}
+        if missing:
+            unknown = ", ".join(sorted(str(user_id) for user_id in missing))
+            raise ValidationError({"participant_ids": f"Unknown users: {unknown}."})
+        if request.user.pk not in user_ids:
+            participants.append(request.user)
+
+        conversation, created = services.find_or_create_conversation(participants)
+        serializer = ConversationSerializer(conversation)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    # -----------------------
+    # GET / POST /conversations/<id>/read/
+    # -----------------------
+    @action(detail=True, methods=["get", "post"], url_path="read")
+    def read(self, request, pk=None):
+        """
+        GET: the requester's unread count and read mark, plus every
+        participant's mark (receipts). POST: mark the conversation read up
+        to its latest message (204).
+        """
+        try:
+            conversation_id = uuid.UUID(str(pk))
+        except ValueError:
+            raise NotFound("Conversation not found.")
+
+        if request.method == "POST":
+            found = services.mark_read(conversation_id, request.user)
+            state = None
+        else:
+            state = receipts.read_state(conversation_id, request.user)
+            found = state is not None
+        if not found:
+            if Conversation.objects.filter(pk=conversation_id).exists():
+                raise PermissionDenied("You do not have permission to access this conversation.")
+            raise NotFound("Conversation not found.")
+
+        if state is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(state)
+
     # -----------------------
     # PUT / PATCH /conversations/<id>/
     # -----------------------
@@ -78,7 +219,7 @@ class ConversationViewSet(viewsets.ViewSet):
 
         if participant_ids:
             participants = CustomUser.objects.filter(user_id__in=participant_ids)
-            conversation.participants.set(participants)
+            services.update_participants(conversation, participants)
 
         serializer = ConversationSerializer(conversation)
         return Response(serializer.data)
@@ -91,15 +232,48 @@ class ConversationViewSet(viewsets.ViewSet):
     # -----------------------
     def destroy(self, request, pk=None):
         conversation = self.get_object(pk)
-        conversation.delete()
+        services.delete_conversation(conversation)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    # -----------------------
+    # GET /conversations/<id>/export/?output=ndjson|csv
+    # -----------------------
+    @action(detail=True, methods=["get"], url_path="export")
+    def export_messages(self, request, pk=None):
+        """
+        Stream every message of the conversation, oldest first.
+
+        NDJSON lines have the same shape as the message endpoints; CSV
+        flattens the sender. (``output`` rather than ``format``, which DRF
+        reserves for content negotiation.)
+        """
+        output = request.query_params.get("output", "ndjson")
+        if output not in export.CONTENT_TYPES:
+            raise ValidationError({"output": "Expected one of: ndjson, csv."})
+        try:
+            conversation_id = uuid.UUID(str(pk))
+        except ValueError:
+            raise NotFound("Conversation not found.")
+        if not is_participant(request, conversation_id):
+            if Conversation.objects.filter(pk=conversation_id).exists():
+                raise PermissionDenied("You do not have permission to access this conversation.")
+            raise NotFound("Conversation not found.")
+
+        response = StreamingHttpResponse(
+            export.stream(conversation_id, output, self.export_chunk_size),
+            content_type=export.CONTENT_TYPES[output],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="conversation-{conversation_id}.{output}"'
+        )
+        return response
+
     # -----------------------
     # Helper
     # -----------------------
     def get_object(self, pk):
         try:
-            conversation = Conversation.objects.prefetch_related(
+            conversation = Conversation.objects.select_related("summary").prefetch_related(
                 "participants", "messages__sender"
             ).get(conversation_id=pk)
         except Conversation.DoesNotExist:
@@ -122,6 +296,10 @@ class MessageViewSet(viewsets.ViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = MessageFilter
 
+    bulk_max_size = 1000
+    batch_max_size = 500
+    sync_max_changes = 500
+
     def get_permissions(self):
         if self.action in ["list", "retrieve", "update", "partial_update", "destroy", "create"]:
             return [IsAuthenticated(), IsParticipantOfConversation()]
@@ -131,6 +309,17 @@ class MessageViewSet(viewsets.ViewSet):
     # GET /messages/ OR /conversations/<pk>/messages/
     # -----------------------
     def list(self, request, conversation_pk=None):
+        if conversation_pk:
+            validators = conditional.get_validators(request, pk=conversation_pk)
+        else:
+            validators = conditional.get_validators(request)
+        cached = conditional.not_modified(request, validators)
+        if cached is not None:
+            return cached
+
+        return conditional.with_validators(self.build_list(request, conversation_pk), validators)
+
+    def build_list(self, request, conversation_pk=None):
         user = request.user
 
         # Filter messages only for conversations where user is a participant
@@ -142,20 +331,95 @@ class MessageViewSet(viewsets.ViewSet):
         # Apply filters
         filtered_qs = MessageFilter(request.GET, queryset=queryset).qs
 
-        paginator = MessagePagination()
-        paginated_qs = paginator.paginate_queryset(filtered_qs.order_by("sent_at"), request)
-
-        serializer = MessageSerializer(paginated_qs, many=True)
-        return Response(serializer.data)
-
+        # ?pagination=cursor switches to keyset pages on (sent_at, message_id)
+        paginator = get_message_paginator(request)
+        cursor_mode = isinstance(paginator, MessageCursorPagination)
+
+        # ?q= full-text search, best match first
+        query = request.query_params.get("q", "").strip()
+        if query:
+            if cursor_mode:
+                raise ValidationError({"q": "Search results are ranked; use page-number pagination."})
+            filtered_qs = search.search(filtered_qs, query).order_by(
+                "-search_rank", "-sent_at", "message_id"
+            )
+        elif not cursor_mode:
+            filtered_qs = filtered_qs.order_by("sent_at")
+
+        if fastpath.enabled():
+            hot = fastpath.message_values(filtered_qs)
+        else:
+            hot = filtered_qs.select_related("sender")
+
+        # Older messages may have been moved to the archive; search skips them
+        if archive.enabled() and not query:
+            archived = MessageFilter(request.GET, queryset=archive.visible_to(user)).qs
+            if conversation_pk:
+                archived = archived.filter(conversation_id=conversation_pk)
+            page = self.paginate_with_archive(request, paginator, hot, archived)
+        else:
+            page = paginator.paginate_queryset(hot, request)
+
+        # rows are dicts (fast path, archive) or Message instances
+        remember_memberships(request, {
+            row["conversation_id"] if isinstance(row, dict) else row.conversation_id
+            for row in page
+        })
+        rendered = iter(fastpath.message_rows([row for row in page if isinstance(row, dict)]))
+        data = [
+            next(rendered) if isinstance(row, dict) else MessageSerializer(row).data
+            for row in page
+        ]
+
+        if cursor_mode:
+            return paginator.get_paginated_response(data)
+        return Response(data)
+
+
+    @staticmethod
+    def paginate_with_archive(request, paginator, hot, archived):
+        if isinstance(paginator, MessageCursorPagination):
+            # same cursor against both tables, then merge the two pages
+            hot_rows = list(paginator.page_queryset(hot, request))
+            archived_rows = archive.message_rows(
+                paginator.page_queryset(archived.values(*archive.ARCHIVED_FIELDS), request)
+            )
+            return archive.merge_pages(paginator, hot_rows, archived_rows)
+        chained = archive.ChainedMessages(
+            archive.ArchivedRows(archived.order_by("sent_at", "message_id")), hot
+        )
+        return paginator.paginate_queryset(chained, request)
 
     # -----------------------
     # GET /messages/<id>/
     # -----------------------
     def retrieve(self, request, pk=None, conversation_pk=None):
-        message = self.get_object(pk)
+        validators = conditional.get_validators(request, scoped=True, messages__pk=pk)
+        cached = conditional.not_modified(request, validators)
+        if cached is not None:
+            return cached
+
+        try:
+            message = self.get_object(pk)
+        except NotFound:
+            row = archive.get_row(pk) if archive.enabled() else None
+            if row is None:
+                raise
+            # Archived: the validators above found no hot message, so take
+            # them from its conversation (None when the user is not in it).
+            validators = conditional.get_validators(
+                request, scoped=True, pk=row["conversation_id"]
+            )
+            if validators is None:
+                raise PermissionDenied("You do not have permission to access this message.")
+            cached = conditional.not_modified(request, validators)
+            if cached is not None:
+                return cached
+            return conditional.with_validators(
+                Response(fastpath.message_rows([row])[0]), validators
+            )
         serializer = MessageSerializer(message)
-        return Response(serializer.data)
+        return conditional.with_validators(Response(serializer.data), validators)
 
     # -----------------------
     # POST /messages/ OR /conversations/<pk>/messages/
@@ -178,15 +442,214 @@ class MessageViewSet(viewsets.ViewSet):
         except CustomUser.DoesNotExist:
             raise NotFound("Sender not found.")
 
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=sender,
-            message_body=message_body
-        )
+        message = services.create_message(conversation, sender, message_body)
 
         serializer = MessageSerializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    # -----------------------
+    # POST /messages/bulk/ OR /conversations/<pk>/messages/bulk/
+    # -----------------------
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request, conversation_pk=None):
+        """
+        Create up to ``bulk_max_size`` messages, possibly across conversations.
+
+        Accepts a list (or ``{"messages": [...]}``) of objects shaped like the
+        single create payload. Memberships and senders are validated with
+        set-based queries, valid items are inserted with one bulk INSERT in a
+        single transaction, and a result is reported per item, in order.
+        """
+        items = request.data.get("messages") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Expected a non-empty list of messages.")
+        if len(items) > self.bulk_max_size:
+            raise ValidationError(f"At most {self.bulk_max_size} messages per request.")
+
+        results, parsed = [None] * len(items), {}
+        for index, item in enumerate(items):
+            try:
+                parsed[index] = self.parse_bulk_item(item, conversation_pk)
+            except ValidationError as exc:
+                results[index] = {"index": index, "status": 400, "errors": exc.detail}
+
+        # One query for the requester's memberships, one for sender memberships
+        conversation_ids = {conversation_id for conversation_id, _, _ in parsed.values()}
+        member_of = load_memberships(request, conversation_ids)
+        sender_links = set(
+            ConversationParticipant.objects.filter(
+                conversation_id__in=member_of,
+                user_id__in={sender_id for _, sender_id, _ in parsed.values()},
+            ).values_list("conversation_id", "user_id")
+        )
+
+        pending = []
+        for index, (conversation_id, sender_id, body) in parsed.items():
+            if conversation_id not in member_of:
+                results[index] = {"index": index, "status": 404,
+                                  "errors": "Conversation not found."}
+            elif (conversation_id, sender_id) not in sender_links:
+                results[index] = {"index": index, "status": 400,
+                                  "errors": "Sender is not a participant of this conversation."}
+            else:
+                pending.append((index, Message(
+                    conversation_id=conversation_id, sender_id=sender_id, message_body=body
+                )))
+
+        if pending:
+            created = services.create_messages([message for _, message in pending])
+            senders = CustomUser.objects.in_bulk({m.sender_id for m in created})
+            for (index, _), message in zip(pending, created):
+                message.sender = senders[message.sender_id]
+                results[index] = {"index": index, "status": 201,
+                                  "message": MessageSerializer(message).data}
+
+        if len(pending) == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif pending:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({"created": len(pending), "results": results}, status=response_status)
+
+    # -----------------------
+    # GET /messages/batch/?ids=<id>,<id>  OR  POST /messages/batch/ {"ids": [...]}
+    # -----------------------
+    @action(detail=False, methods=["get", "post"], url_path="batch")
+    def batch_retrieve(self, request, conversation_pk=None):
+        """
+        Retrieve up to ``batch_max_size`` messages by id in two queries.
+
+        Results keep the request order. Ids that are malformed, unknown or
+        in conversations the user is not part of are listed under
+        ``missing`` (indistinguishably, so existence is not leaked).
+        """
+        if request.method == "POST":
+            raw_ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        else:
+            raw_ids = [i for i in request.query_params.get("ids", "").split(",") if i]
+        if not isinstance(raw_ids, list) or not raw_ids:
+            raise ValidationError({"ids": "Provide a non-empty list of message ids."})
+        if len(raw_ids) > self.batch_max_size:
+            raise ValidationError({"ids": f"At most {self.batch_max_size} ids per request."})
+        if not all(isinstance(raw, str) for raw in raw_ids):
+            raise ValidationError({"ids": "Message ids must be strings."})
+
+        requested = {}
+        for raw in raw_ids:
+            try:
+                requested.setdefault(uuid.UUID(raw), raw)
+            except ValueError:
+                requested.setdefault(raw, raw)
+        ids = [key for key in requested if isinstance(key, uuid.UUID)]
+
+        queryset = Message.objects.filter(message_id__in=ids)
+        if conversation_pk is not None:
+            try:
+                queryset = queryset.filter(conversation_id=uuid.UUID(str(conversation_pk)))
+            except ValueError:
+                raise NotFound("Conversation not found.")
+
+        if fastpath.enabled():
+            rows = list(fastpath.message_values(queryset))
+            found = {row["message_id"]: row for row in rows}
+            visible = load_memberships(request, {row["conversation_id"] for row in rows})
+            found = {pk: row for pk, row in found.items() if row["conversation_id"] in visible}
+            data = dict(zip(found, fastpath.message_rows(found.values())))
+        else:
+            found = {m.message_id: m for m in queryset.select_related("sender")}
+            visible = load_memberships(request, {m.conversation_id for m in found.values()})
+            data = {
+                pk: MessageSerializer(m).data
+                for pk, m in found.items() if m.conversation_id in visible
+            }
+
+        return Response({
+            "results": [data[key] for key in requested if key in data],
+            "missing": [raw for key, raw in requested.items() if key not in data],
+        })
+
+    # -----------------------
+    # GET /messages/sync/?token=<token>
+    # -----------------------
+    @action(detail=False, methods=["get"], url_path="sync")
+    def sync_changes(self, request, conversation_pk=None):
+        """
+        Changes to the user's messages since ``token``, plus a new token;
+        on the nested route, only the conversation's.
+
+        Without a token, returns the current token and no changes: clients
+        load history from the list endpoints, then poll from there.
+        "archived" lists messages moved to the archive since: unchanged, but
+        read-only from then on. "deleted_conversations" lists conversations
+        deleted since, with all their messages.
+        """
+        conversation_id = None
+        if conversation_pk is not None:
+            try:
+                conversation_id = uuid.UUID(str(conversation_pk))
+            except ValueError:
+                raise NotFound("Conversation not found.")
+            if not is_participant(request, conversation_id):
+                if Conversation.objects.filter(pk=conversation_id).exists():
+                    raise PermissionDenied(
+                        "You do not have permission to access this conversation."
+                    )
+                raise NotFound("Conversation not found.")
+
+        token = request.query_params.get("token")
+        if not token:
+            return Response({"token": sync.encode_token(request.user, sync.head()),
+                             "has_more": False, "created": [], "updated": [], "deleted": [],
+                             "archived": [], "deleted_conversations": []})
+
+        since = sync.decode_token(request.user, token)
+        changes, deleted_conversations, last_seq, has_more = sync.changes_since(
+            request.user, since, self.sync_max_changes, conversation_id
+        )
+
+        alive = [pk for pk, kind in changes.items() if kind != MessageChangeKind.Deleted]
+        queryset = Message.objects.filter(message_id__in=alive)
+        if fastpath.enabled():
+            rows = list(fastpath.message_values(queryset))
+            current = dict(zip((row["message_id"] for row in rows), fastpath.message_rows(rows)))
+        else:
+            current = {m.message_id: MessageSerializer(m).data for m in queryset.select_related("sender")}
+        moved = [pk for pk in alive if pk not in current]
+        if moved and archive.enabled():
+            rows = archive.get_rows(moved, request.user)
+            current.update(zip(rows, fastpath.message_rows(rows.values())))
+
+        created, updated, deleted, archived = [], [], [], []
+        for pk, kind in changes.items():
+            if pk not in current:  # deleted in the window, or since it was read
+                deleted.append(str(pk))
+            elif kind == MessageChangeKind.Created:
+                created.append(current[pk])
+            elif kind == MessageChangeKind.Archived:
+                archived.append(current[pk])
+            else:
+                updated.append(current[pk])
+
+        return Response({"token": sync.encode_token(request.user, last_seq), "has_more": has_more,
+                         "created": created, "updated": updated, "deleted": deleted,
+                         "archived": archived,
+                         "deleted_conversations": [str(pk) for pk in deleted_conversations]})
+
+    @staticmethod
+    def parse_bulk_item(item, conversation_pk=None):
+        if not isinstance(item, dict):
+            raise ValidationError("Each message must be an object.")
+        conversation_id = conversation_pk or item.get("conversation_id")
+        sender_id = item.get("sender_id")
+        message_body = (item.get("message_body") or "").strip()
+        if not all([conversation_id, sender_id, message_body]):
+            raise ValidationError("conversation_id, sender_id, and message_body are required.")
+        try:
+            return uuid.UUID(str(conversation_id)), uuid.UUID(str(sender_id)), message_body
+        except ValueError:
+            raise ValidationError("conversation_id and sender_id must be UUIDs.")
+
     # -----------------------
     # PUT / PATCH /messages/<id>/
     # -----------------------
@@ -194,8 +657,7 @@ class MessageViewSet(viewsets.ViewSet):
         message = self.get_object(pk)
         message_body = (request.data.get("message_body") or "").strip()
         if message_body:
-            message.message_body = message_body
-            message.save()
+            services.update_message(message, message_body)
         serializer = MessageSerializer(message)
         return Response(serializer.data)
 
@@ -207,7 +669,7 @@ class MessageViewSet(viewsets.ViewSet):
     # -----------------------
     def destroy(self, request, pk=None, conversation_pk=None):
         message = self.get_object(pk)
-        message.delete()
+        services.delete_message(message)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     # -----------------------
@@ -223,10 +685,7 @@ class MessageViewSet(viewsets.ViewSet):
         for perm in self.get_permissions():
             if hasattr(perm, "has_object_permission"):
                 if not perm.has_object_permission(self.request, self, message):
-                    return Response(
-                    {"detail": "You do not have permission to access this message."},
-                    status=status.HTTP_403_FORBIDDEN
-                )
+                    raise PermissionDenied("You do not have permission to access this message.")
 
         return message
 
@@ -256,4 +715,24 @@ class StatusViewSet(viewsets.ViewSet):
             "status": "OK",
             "message": "API is operational",
             "server_time_utc": now_utc.isoformat(),
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+# ===========================================================
+# Metrics
+# ===========================================================
+class MetricsViewSet(viewsets.ViewSet):
+    """
+    GET /metrics/: per-route request and database metrics of every worker
+    process, in the Prometheus text format (see chats/metrics.py). For
+    staff users, and scrapers sending CHATS_METRICS_TOKEN as a bearer token.
+    """
+    authentication_classes = [
+        MetricsTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ]
+    permission_classes = [CanReadMetrics]
+
+    def list(self, request):
+        return HttpResponse(
+            metrics.render(metrics.registry.collect()), content_type=metrics.CONTENT_TYPE
+        )